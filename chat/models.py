@@ -48,6 +48,9 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['chat_room', '-created_at'], name='chat_msg_room_created_idx'),  # 채팅방별 최근 대화 조회
+        ]
 
     def __str__(self):
         return f"{self.user.username}: {self.input_content[:50]}"
\ No newline at end of file
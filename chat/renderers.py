@@ -0,0 +1,27 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    text/event-stream(SSE) 요청을 DRF 콘텐츠 협상에서 허용하기 위한 렌더러.
+
+    스트리밍 응답 본문은 StreamingHttpResponse가 직접 만들고,
+    이 렌더러는 오류 응답 등 일반 Response만 JSON 문자열로 렌더링합니다.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, bytes):
+            return data
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+def format_sse(event, data):
+    """SSE 이벤트 한 건을 직렬화합니다."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -1,6 +1,15 @@
 # 비즈니스 로직 (MessageTranslator)
+import logging
 import os
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from rag.method import RAGQuery
+from rag.engine import RAGEngine
+from rag.history import ChatHistoryProvider
+from rag.semantic_cache import SemanticResponseCache, context_fingerprint
+from rag.single_flight import SingleFlight, flight_key
+from rag.metrics import Trace, timed, traced, use_trace
+from rag.warm_phrases import WarmPhraseLibrary
 from dotenv import load_dotenv
 from openai import OpenAI
 import requests  # requests 라이브러리 추가
@@ -10,41 +19,250 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 DEEPL_API_KEY = os.getenv('DEEPL_API_KEY')  # DeepL API 키 가져오기
 
+logger = logging.getLogger(__name__)
+
 # 답변 3개 추천
 class MessageTranslator:
-    def __init__(self, input_content):
+    def __init__(self, input_content, chat_room=None, use_cache=True):
         # 기존 get_translation_options 기능을 유지하되, RAGQuery.get_answer를 사용하여 3개의 응답을 생성하고
         # 결과를 self.options 에 저장합니다.
-        self.options = []
-        answer = RAGQuery.get_answer(input_content)
-        # 3개의 응답을 리스트로 변환
-        self.options = answer.split('|')
-        # 리스트 내 문자열 앞뒤 공백 제거
-        self.options = [option.strip() for option in self.options]
-        print(self.options)
+        # chat_room이 주어지면 해당 채팅방의 최근 대화만 맥락으로 사용합니다.
+        # 자주 들어오는 문장은 미리 생성해 둔 다정 표현 라이브러리(WarmPhrase)에서 바로 가져옵니다.
+        # use_cache=False이면 라이브러리와 의미 기반 응답 캐시를 건너뛰고 항상 새로 생성합니다.
+        self.chat_room = chat_room
+        with traced("warm_mode") as trace:
+            # 같은 방에서 같은 입력이 동시에 들어오면 하나의 계산 결과를 함께 사용합니다.
+            shared = False
+            if settings.RAG_SINGLE_FLIGHT_ENABLED:
+                key = self._flight_key(input_content, chat_room, use_cache)
+                (options, self.cached), shared = SingleFlight.instance().do(
+                    key, lambda: self._generate(input_content, chat_room, use_cache)
+                )
+            else:
+                options, self.cached = self._generate(input_content, chat_room, use_cache)
+            trace.set(cached=self.cached, coalesced=shared)
+        self.options = list(options)
+        logger.debug("Warm options: %s", self.options)
+
+    @classmethod
+    def _generate(cls, input_content, chat_room, use_cache):
+        """캐시 조회 후 필요하면 LLM으로 3개의 옵션을 생성합니다. Returns: (options, cached)"""
+        cache_key, cached_options = cls._lookup(input_content, chat_room, use_cache)
+        if cached_options is not None:
+            return cached_options, True
+
+        answer = RAGQuery.get_answer(input_content, chat_room=chat_room)
+        options = cls.parse_options(answer)
+        cls._store(cache_key, options)
+        return options, False
+
+    @classmethod
+    async def agenerate(cls, input_content, chat_room=None, use_cache=True):
+        """
+        __init__과 같은 방식으로 3개의 옵션을 비동기로 생성합니다.
+
+        Returns:
+            tuple: (options, cached)
+        """
+        with traced("warm_mode") as trace:
+            shared = False
+            if settings.RAG_SINGLE_FLIGHT_ENABLED:
+                key = await sync_to_async(cls._flight_key)(input_content, chat_room, use_cache)
+                (options, cached), shared = await SingleFlight.instance().ado(
+                    key, lambda: cls._agenerate(input_content, chat_room, use_cache)
+                )
+            else:
+                options, cached = await cls._agenerate(input_content, chat_room, use_cache)
+            trace.set(cached=cached, coalesced=shared)
+        return list(options), cached
+
+    @classmethod
+    async def _agenerate(cls, input_content, chat_room, use_cache):
+        """_generate의 비동기 버전."""
+        cache_key, cached_options = await cls._alookup(input_content, chat_room, use_cache)
+        if cached_options is not None:
+            return cached_options, True
+
+        answer = await RAGQuery.aget_answer(input_content, chat_room=chat_room)
+        options = cls.parse_options(answer)
+        cls._store(cache_key, options)
+        return options, False
+
+    @staticmethod
+    def _flight_key(input_content, chat_room, use_cache):
+        """single-flight 키: (채팅방, 정규화된 입력, 히스토리 지문, 캐시 사용 여부)."""
+        history_lines = ChatHistoryProvider.instance().get_lines(chat_room)
+        room_id = chat_room.pk if chat_room is not None else None
+        return flight_key(room_id, input_content, history_lines, use_cache)
+
+    @staticmethod
+    def parse_options(answer):
+        """LLM 응답을 파이프(|) 기준으로 나누어 옵션 리스트로 변환합니다."""
+        # 3개의 응답을 리스트로 변환하고 리스트 내 문자열 앞뒤 공백 제거
+        return [option.strip() for option in answer.split('|')]
+
+    @classmethod
+    def stream(cls, input_content, chat_room=None, use_cache=True):
+        """
+        3개의 옵션을 생성되는 대로 하나씩 내보내는 제너레이터.
+
+        Yields:
+            ('option', {'index': int, 'text': str}): 파이프(|) 구분자가 도착해 완성된 옵션
+            ('done', {'options': list, 'cached': bool}): 전체 응답을 파싱한 최종 결과
+        """
+        # 제너레이터는 소비하는 쪽의 컨텍스트에서 실행되므로 Trace를 직접 넘겨 구간별로 활성화
+        trace = Trace("warm_mode.stream")
+        error = None
+        try:
+            yield from cls._coalesced_stream(input_content, chat_room, use_cache, trace)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            trace.finish(error=error)
+
+    @classmethod
+    def _coalesced_stream(cls, input_content, chat_room, use_cache, trace):
+        # 같은 요청이 이미 생성 중이면 그 결과를 기다렸다가 한 번에 내보냄 (프로세스 내)
+        flight = SingleFlight.instance() if settings.RAG_SINGLE_FLIGHT_ENABLED else None
+        key = future = None
+        if flight is not None:
+            with use_trace(trace):
+                key = cls._flight_key(input_content, chat_room, use_cache)
+            future, leader = flight.acquire(key)
+            if not leader:
+                try:
+                    with use_trace(trace), timed("single_flight_wait"):
+                        options, cached = future.result(timeout=flight.timeout)
+                except Exception:
+                    pass  # 리더 실패/시간 초과: 직접 생성
+                else:
+                    trace.set(cached=cached, coalesced=True)
+                    for index, option in enumerate(options):
+                        yield 'option', {'index': index, 'text': option}
+                    yield 'done', {'options': list(options), 'cached': cached}
+                    return
+                key = future = None
+
+        try:
+            result = yield from cls._stream(input_content, chat_room, use_cache, trace)
+        except BaseException as e:
+            # 클라이언트 연결 종료(GeneratorExit) 포함: 기다리던 요청은 각자 다시 생성
+            if future is not None:
+                flight.release(key, future, error=e)
+            raise
+        if future is not None:
+            flight.release(key, future, result)
+
+    @classmethod
+    def _stream(cls, input_content, chat_room, use_cache, trace):
+        """stream()의 실제 생성 부분. 최종 (options, cached)를 반환합니다."""
+        with use_trace(trace):
+            cache_key, cached_options = cls._lookup(input_content, chat_room, use_cache)
+        trace.set(cached=cached_options is not None)
+        if cached_options is not None:
+            for index, option in enumerate(cached_options):
+                yield 'option', {'index': index, 'text': option}
+            yield 'done', {'options': cached_options, 'cached': True}
+            return cached_options, True
+
+        answer = ""
+        buffer = ""
+        index = 0
+        for chunk in RAGQuery.stream_answer(input_content, chat_room=chat_room, trace=trace):
+            answer += chunk
+            buffer += chunk
+            # 구분자가 도착할 때마다 완성된 옵션을 바로 내보냄
+            while '|' in buffer:
+                option, buffer = buffer.split('|', 1)
+                yield 'option', {'index': index, 'text': option.strip()}
+                index += 1
+        if buffer.strip():
+            yield 'option', {'index': index, 'text': buffer.strip()}
+
+        options = cls.parse_options(answer)
+        cls._store(cache_key, options)
+        yield 'done', {'options': options, 'cached': False}
+        return options, False
+
+    @staticmethod
+    def _cache_enabled(use_cache):
+        return use_cache and settings.RAG_SEMANTIC_CACHE_ENABLED
+
+    @classmethod
+    def _lookup(cls, input_content, chat_room, use_cache):
+        """
+        미리 생성된 다정 표현 라이브러리, 그 다음 의미 기반 캐시를 조회합니다.
+
+        Returns: (cache_key 또는 None, 캐시된 옵션 또는 None)
+        """
+        if use_cache and settings.RAG_WARM_PHRASE_ENABLED:
+            with timed("warm_phrase"):
+                options = WarmPhraseLibrary.instance().lookup(input_content)
+            if options is not None:
+                return None, options
+        if not cls._cache_enabled(use_cache):
+            return None, None
+        with timed("semantic_cache"):
+            cache_key = cls._cache_key(input_content, chat_room)
+            return cache_key, SemanticResponseCache.instance().lookup(*cache_key)
+
+    @classmethod
+    async def _alookup(cls, input_content, chat_room, use_cache):
+        """_lookup의 비동기 버전."""
+        if use_cache and settings.RAG_WARM_PHRASE_ENABLED:
+            with timed("warm_phrase"):
+                options = await WarmPhraseLibrary.instance().alookup(input_content)
+            if options is not None:
+                return None, options
+        if not cls._cache_enabled(use_cache):
+            return None, None
+        with timed("semantic_cache"):
+            cache_key = await cls._acache_key(input_content, chat_room)
+            return cache_key, SemanticResponseCache.instance().lookup(*cache_key)
+
+    @staticmethod
+    def _cache_key(input_content, chat_room):
+        """의미 기반 캐시 조회용 (질의 임베딩, 맥락 지문)을 계산합니다."""
+        # 질의 임베딩은 임베딩 캐시에 남으므로 이후 리트리브 단계에서 다시 요청하지 않습니다.
+        vector = RAGEngine.instance().get().embeddings.embed_query(input_content)
+        history_lines = []
+        if settings.RAG_SEMANTIC_CACHE_CONTEXT_TURNS > 0:
+            history_lines = ChatHistoryProvider.instance().get_lines(chat_room)
+        return vector, context_fingerprint(history_lines)
+
+    @staticmethod
+    async def _acache_key(input_content, chat_room):
+        """_cache_key의 비동기 버전."""
+        state = await RAGEngine.instance().aget()
+        vector = await state.embeddings.aembed_query(input_content)
+        history_lines = []
+        if settings.RAG_SEMANTIC_CACHE_CONTEXT_TURNS > 0:
+            history_lines = await sync_to_async(ChatHistoryProvider.instance().get_lines)(chat_room)
+        return vector, context_fingerprint(history_lines)
+
+    @staticmethod
+    def _store(cache_key, options):
+        if cache_key is not None and len(options) == 3:
+            SemanticResponseCache.instance().store(*cache_key, options)
 
     def get_contextual_response(self, current_input):
         """
-        데이터베이스에 저장된 모든 채팅 메시지를 가져와 대화의 흐름을 형성한 후,
+        채팅방의 최근 대화(턴 수/토큰 예산 제한)로 대화의 흐름을 형성한 후,
         현재 입력(current_input)과 함께 RAGQuery.get_answer를 호출하여 답변을 생성합니다.
         예상 응답 형식: {"text": "...", "emotion": "..."} 등 (RAGQuery의 반환값에 따라 조정 필요)
         """
-        from chat.models import Message
-
-        # 모든 채팅 메시지를 시간순으로 조회
-        messages = Message.objects.all().order_by('created_at')
-        # 각 메시지의 발신자와 내용을 활용하여 대화 맥락을 구성 (필드명에 맞게 수정하세요)
-        conversation = "\n".join([f"{msg.user}: {msg.input_content}" for msg in messages])
+        # 채팅방의 최근 메시지로 대화 맥락을 구성 (작성자는 한 번의 쿼리로 함께 조회)
+        conversation = ChatHistoryProvider.instance().get_history(self.chat_room)
 
         # 전체 프롬프트 구성: 기존 대화 맥락 + 현재 사용자 입력
         full_prompt = f"대화 맥락:\n{conversation}\n현재 사용자: {current_input}\n적절한 답변을 생성해줘. 단, 답변은 current_input의 언어로 해줘."
-        print(full_prompt)
+        logger.debug("Contextual prompt: %s", full_prompt)
         contextual_answer = RAGQuery.get_answer(full_prompt)
         return contextual_answer
 
 class LanguageTranslator:
     def __init__(self):
-        print(DEEPL_API_KEY)
         # OpenAI 클라이언트 제거
         pass
 
@@ -3,6 +3,8 @@ from . import views
 
 urlpatterns = [
     path('json-drf/', views.json_drf, name='json_drf'),
+    path('json-drf/stream/', views.json_drf_stream, name='json_drf_stream'),
+    path('json-drf/async/', views.json_drf_async, name='json_drf_async'),
     path('messages/<int:user_id>/', views.get_user_messages, name='get_user_messages'),
     # path('select-translation/<int:message_id>/', views.select_translation, name='select_translation'),
     path('select-translation/', views.select_translation, name='select_translation'),
@@ -1,10 +1,18 @@
+import json
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
-from rest_framework.decorators import api_view, permission_classes
+from django.http import StreamingHttpResponse, JsonResponse, HttpResponseNotAllowed
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .renderers import EventStreamRenderer, format_sse
 from .serializers import MessageSerializer
 from .models import Message, UserSettings, ChatRoom
 from .services import MessageTranslator, LanguageTranslator
+from rag.metrics import traced
 
 User = get_user_model()
 
@@ -63,9 +71,12 @@ def json_drf(request):
         #     return Response({'input_content': input_content})  # 입력된 내용을 그대로 반환
         
         # 다정한 말투로 변환된 3개의 옵션 생성
-        translator = MessageTranslator(input_content)
+        # bypass_cache=true이면 의미 기반 응답 캐시를 건너뛰고 새로 생성
+        bypass_cache = request.data.get('bypass_cache') in (True, 'true', '1', 1)
+        with traced("json_drf"):
+            translator = MessageTranslator(input_content, chat_room=chat_room, use_cache=not bypass_cache)
         warm_options = translator.options
-        return Response({'options': warm_options})  # 사용자에게 옵션 반환
+        return Response({'options': warm_options, 'cached': translator.cached})  # 사용자에게 옵션 반환
     else:
         # 기존 방식으로 메시지 저장
         message = Message.objects.create(
@@ -79,6 +90,96 @@ def json_drf(request):
         serializer = MessageSerializer(message)
         return Response(serializer.data)
 
+async def _authenticate_jwt(request):
+    """비동기 뷰용 JWT 인증. 인증되지 않으면 None을 반환합니다."""
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def json_drf_async(request):
+    """
+    json_drf의 비동기 버전 (ASGI 전용)
+
+    요청/응답 형식은 json_drf와 같습니다. LLM 응답을 기다리는 동안 워커 스레드를
+    점유하지 않으므로 한 프로세스가 많은 요청을 동시에 처리할 수 있습니다.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    user = await _authenticate_jwt(request)
+    if user is None:
+        return JsonResponse({'detail': '자격 인증데이터(authentication credentials)가 제공되지 않았습니다.'}, status=401)
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': '유효한 JSON 형식이 아닙니다.'}, status=400)
+
+    input_content = data.get('input_content')
+    # 기본 채팅방 가져오기
+    chat_room = await sync_to_async(ChatRoom.get_default_room)(user)
+
+    if chat_room.warm_mode:
+        # 다정한 말투로 변환된 3개의 옵션 생성
+        bypass_cache = data.get('bypass_cache') in (True, 'true', '1', 1)
+        with traced("json_drf_async"):
+            warm_options, cached = await MessageTranslator.agenerate(
+                input_content, chat_room=chat_room, use_cache=not bypass_cache
+            )
+        return JsonResponse({'options': warm_options, 'cached': cached}, json_dumps_params={'ensure_ascii': False})
+
+    # 기존 방식으로 메시지 저장
+    message = await Message.objects.acreate(
+        user=user,
+        chat_room=chat_room,  # 기본 채팅방 사용
+        input_content=input_content,
+        output_content=input_content,
+        translated_content=None,
+        warm_mode=False
+    )
+    data = await sync_to_async(lambda: MessageSerializer(message).data)()
+    return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+
+
+# Django 4.2의 csrf_exempt 데코레이터는 코루틴 함수를 감싸면 동기 뷰로 바뀌므로 직접 표시
+json_drf_async.csrf_exempt = True
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def json_drf_stream(request):
+    """
+    다정모드 옵션을 SSE(text/event-stream)로 스트리밍하는 API
+
+    옵션 하나가 완성될 때마다 'option' 이벤트를 보내고,
+    마지막에 파싱된 전체 옵션 리스트를 담은 'done' 이벤트를 보냅니다.
+    """
+    input_content = request.data.get('input_content')
+    if not input_content:
+        return Response({'error': 'input_content가 필요합니다.'}, status=400)
+
+    chat_room = ChatRoom.get_default_room(request.user)
+    if not chat_room.warm_mode:
+        return Response({'error': '다정모드가 꺼져 있습니다.'}, status=400)
+
+    bypass_cache = request.data.get('bypass_cache') in (True, 'true', '1', 1)
+
+    def event_stream():
+        try:
+            for event, data in MessageTranslator.stream(input_content, chat_room=chat_room, use_cache=not bypass_cache):
+                yield format_sse(event, data)
+        except Exception as e:
+            yield format_sse('error', {'error': str(e)})
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 프록시(nginx) 버퍼링 비활성화
+    return response
+
 # @api_view(['POST'])
 # @permission_classes([IsAuthenticated])
 # def select_translation(request):
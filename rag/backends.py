@@ -0,0 +1,226 @@
+"""
+질의용 벡터 검색 백엔드.
+
+RAGEngine은 RAG_RETRIEVER_BACKEND 설정에 따라 아래 백엔드 중 하나를 사용합니다.
+
+- 'chroma': Chroma 컬렉션(korean_dialogue)을 직접 검색합니다. (기본값)
+- 'faiss' : RAGProcessor 적재 후 만들어지는 FAISS 스냅샷(rag.faiss_index)을 검색합니다.
+
+모든 백엔드는 같은 인터페이스를 가집니다.
+    search(vector, k, emotions=None) -> [(Document, score), ...]   # score는 클수록 유사
+    search_many(vectors, k, emotions=None) -> [[(Document, score), ...], ...]
+
+emotions가 주어지면 적재 시 만들어 둔 감정별 파티션만 검색하고 결과를 점수순으로 합칩니다.
+
+RAG_RETRIEVAL_MODE가 'hybrid'이면 HybridRetriever가 벡터 검색 결과와 BM25 어휘 색인(rag.lexical)
+결과를 RRF로 결합합니다.
+"""
+import asyncio
+import contextvars
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from .lexical import reciprocal_rank_fusion
+from .metrics import timed
+from .partitions import list_partitions
+
+logger = logging.getLogger(__name__)
+
+# 동기 경로에서 벡터 검색에 시간 제한을 두기 위한 스레드 풀
+_VECTOR_SEARCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-vector")
+
+
+def merge_hits(hit_lists, k):
+    """여러 파티션의 검색 결과를 점수순으로 합쳐 상위 k개를 반환합니다."""
+    return heapq.nlargest(k, (hit for hits in hit_lists for hit in hits), key=lambda hit: hit[1])
+
+
+class ChromaBackend:
+    name = "chroma"
+
+    def __init__(self, vectorstore):
+        self.vectorstore = vectorstore
+        self.collection = vectorstore._collection
+        self.partitions = list_partitions(vectorstore._client)
+
+    def count(self):
+        return self.collection.count()
+
+    def search(self, vector, k, emotions=None):
+        return self.search_many([vector], k, emotions)[0]
+
+    def search_many(self, vectors, k, emotions=None):
+        if not len(vectors):
+            return []
+        if not emotions:
+            return self._query(self.collection, vectors, k)
+
+        partitioned = [e for e in emotions if e in self.partitions]
+        missing = [e for e in emotions if e not in self.partitions]
+        hit_lists = [self._query(self.partitions[e], vectors, k) for e in partitioned]
+        if missing:
+            # 파티션이 없는 감정은 전체 컬렉션에서 메타데이터 필터로 검색
+            hit_lists.append(self._query(self.collection, vectors, k, where={"emotion": {"$in": missing}}))
+        return [merge_hits([hits[i] for hits in hit_lists], k) for i in range(len(vectors))]
+
+    @staticmethod
+    def _query(collection, vectors, k, where=None):
+        result = collection.query(
+            query_embeddings=[list(map(float, v)) for v in vectors],
+            n_results=k,
+            where=where,
+            include=["documents", "metadatas", "distances"]
+        )
+        batches = []
+        for ids, documents, metadatas, distances in zip(
+            result["ids"], result["documents"], result["metadatas"], result["distances"]
+        ):
+            hits = []
+            for doc_id, text, metadata, distance in zip(ids, documents, metadatas, distances):
+                metadata = dict(metadata or {})
+                metadata.setdefault("doc_id", doc_id)
+                hits.append((Document(page_content=text, metadata=metadata), -float(distance)))
+            batches.append(hits)
+        return batches
+
+
+class FaissBackend:
+    name = "faiss"
+
+    def __init__(self, index):
+        self.index = index
+
+    def count(self):
+        return self.index.count
+
+    def search(self, vector, k, emotions=None):
+        return self.index.search(vector, k, emotions)
+
+    def search_many(self, vectors, k, emotions=None):
+        return self.index.search_many(vectors, k, emotions)
+
+
+class VectorBackendRetriever(BaseRetriever):
+    """질의를 임베딩한 뒤 벡터 백엔드에서 상위 k개 문서를 찾는 리트리버."""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    backend: Any
+    embeddings: Any
+    k: int = 10
+
+    def search(self, query, k=None, emotions=None):
+        with timed("embed"):
+            vector = self.embeddings.embed_query(query)
+        with timed("search"):
+            return self.backend.search(vector, k or self.k, emotions)
+
+    async def asearch(self, query, k=None, emotions=None):
+        with timed("embed"):
+            vector = await self.embeddings.aembed_query(query)
+        with timed("search"):
+            return await asyncio.to_thread(self.backend.search, vector, k or self.k, emotions)
+
+    def search_batch(self, queries, vectors, emotions=None):
+        """이미 임베딩된 여러 질의를 한 번의 백엔드 호출로 검색합니다. Returns: [[Document, ...], ...]"""
+        with timed("search"):
+            return [[doc for doc, _ in hits] for hits in self.backend.search_many(vectors, self.k, emotions)]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+        emotions: Optional[List[str]] = None
+    ) -> List[Document]:
+        return [doc for doc, _ in self.search(query, emotions=emotions)]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+        emotions: Optional[List[str]] = None
+    ) -> List[Document]:
+        return [doc for doc, _ in await self.asearch(query, emotions=emotions)]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    벡터 검색과 BM25 어휘 검색 결과를 RRF로 결합하는 리트리버.
+
+    mode가 'lexical'이면 어휘 검색만 사용합니다. 'hybrid'에서 임베딩+벡터 검색이
+    timeout 초 안에 끝나지 않거나 실패하면 어휘 검색 결과만으로 응답합니다.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vector: VectorBackendRetriever
+    lexical: Any
+    k: int = 10
+    mode: str = "hybrid"
+    rrf_k: int = 60
+    timeout: float = 2.0
+
+    @property
+    def candidates(self):
+        # 결합 전 각 검색에서 가져올 후보 수
+        return self.k * 2
+
+    def search_batch(self, queries, vectors, emotions=None):
+        """VectorBackendRetriever.search_batch와 같은 형식으로 벡터/BM25 결과를 질의별로 결합합니다."""
+        with timed("lexical_search"):
+            lexical = [self.lexical.search(query, self.candidates, emotions) for query in queries]
+        if self.mode == "lexical":
+            return [[doc for doc, _ in hits[:self.k]] for hits in lexical]
+        with timed("search"):
+            vector = self.vector.backend.search_many(vectors, self.candidates, emotions)
+        return [self._fuse(vector_hits, lexical_hits) for vector_hits, lexical_hits in zip(vector, lexical)]
+
+    def _fuse(self, vector_hits, lexical_hits):
+        return [doc for doc, _ in reciprocal_rank_fusion([vector_hits, lexical_hits], self.k, self.rrf_k)]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+        emotions: Optional[List[str]] = None
+    ) -> List[Document]:
+        if self.mode == "lexical":
+            with timed("lexical_search"):
+                return [doc for doc, _ in self.lexical.search(query, self.k, emotions)]
+        # 현재 Trace가 이어지도록 컨텍스트를 복사해서 넘김
+        future = _VECTOR_SEARCH_POOL.submit(
+            contextvars.copy_context().run, self.vector.search, query, self.candidates, emotions
+        )
+        with timed("lexical_search"):
+            lexical_hits = self.lexical.search(query, self.candidates, emotions)
+        try:
+            vector_hits = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            logger.warning("벡터 검색이 %s초를 넘어 BM25 결과만 사용합니다.", self.timeout)
+            return [doc for doc, _ in lexical_hits[:self.k]]
+        except Exception as e:
+            logger.warning("벡터 검색 실패로 BM25 결과만 사용합니다: %s", e)
+            return [doc for doc, _ in lexical_hits[:self.k]]
+        return self._fuse(vector_hits, lexical_hits)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+        emotions: Optional[List[str]] = None
+    ) -> List[Document]:
+        if self.mode == "lexical":
+            with timed("lexical_search"):
+                hits = await asyncio.to_thread(self.lexical.search, query, self.k, emotions)
+            return [doc for doc, _ in hits]
+        vector_task = asyncio.ensure_future(
+            asyncio.wait_for(self.vector.asearch(query, self.candidates, emotions), self.timeout)
+        )
+        with timed("lexical_search"):
+            lexical_hits = await asyncio.to_thread(self.lexical.search, query, self.candidates, emotions)
+        try:
+            vector_hits = await vector_task
+        except asyncio.TimeoutError:
+            logger.warning("벡터 검색이 %s초를 넘어 BM25 결과만 사용합니다.", self.timeout)
+            return [doc for doc, _ in lexical_hits[:self.k]]
+        except Exception as e:
+            logger.warning("벡터 검색 실패로 BM25 결과만 사용합니다: %s", e)
+            return [doc for doc, _ in lexical_hits[:self.k]]
+        return self._fuse(vector_hits, lexical_hits)
@@ -0,0 +1,2 @@
+# RAG 공통 상수
+COLLECTION_NAME = "korean_dialogue"  # Chroma 기본 컬렉션 이름
@@ -0,0 +1,151 @@
+"""
+다정모드 프롬프트에 넣을 대화 히스토리와 리트리브 문맥을 토큰 예산 안으로 묶는 단계.
+
+- 전체 예산 RAG_PROMPT_TOKEN_BUDGET에서 질문 토큰을 먼저 빼고, 나머지를 히스토리(RAG_PROMPT_HISTORY_SHARE 비율)와
+  문맥으로 나눕니다. 히스토리가 자기 몫을 다 쓰지 않으면 남은 토큰은 문맥에 넘겨줍니다.
+- 히스토리는 최근 대화부터, 문맥은 검색 순위대로 예산에 들어가는 만큼만 넣습니다.
+  예산 때문에 빠진 히스토리 줄/문맥 조각과 그 토큰 수는 stats()에 함께 기록합니다.
+- 적재 시 붙는 "content: " 접두어를 제거하고, 거의 같은 문맥 조각
+  (문자 3-gram 자카드 유사도 RAG_PROMPT_DEDUP_THRESHOLD 이상)은 하나만 남깁니다.
+"""
+import re
+import unicodedata
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .tokens import count_tokens
+
+CONTENT_PREFIX = re.compile(r"^\s*content:\s*")
+_NOISE = re.compile(r"[\W_]+")
+
+
+def clean_snippet(text: str) -> str:
+    """적재 시 붙인 "content: " 접두어와 앞뒤 공백을 제거합니다."""
+    return CONTENT_PREFIX.sub("", text or "").strip()
+
+
+def _shingles(text):
+    normalized = _NOISE.sub("", unicodedata.normalize("NFC", text).lower())
+    if len(normalized) < 3:
+        return {normalized}
+    return {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+
+
+def dedupe_snippets(snippets, threshold=None):
+    """
+    거의 같은 조각을 제거합니다. 앞선(순위가 높은) 조각을 남깁니다.
+
+    Returns:
+        (남은 조각 리스트, 제거된 개수)
+    """
+    threshold = settings.RAG_PROMPT_DEDUP_THRESHOLD if threshold is None else threshold
+    kept, kept_shingles = [], []
+    for snippet in snippets:
+        shingles = _shingles(snippet)
+        duplicate = any(
+            len(shingles & other) / (len(shingles | other) or 1) >= threshold
+            for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(snippet)
+            kept_shingles.append(shingles)
+    return kept, len(snippets) - len(kept)
+
+
+@dataclass
+class PackedContext:
+    """예산에 맞춰 묶인 프롬프트 입력과 토큰 통계."""
+    question: str
+    chat_history: str
+    retrieved_context: str
+    history_tokens: int
+    context_tokens: int
+    question_tokens: int
+    history_lines: int
+    documents_retrieved: int
+    documents_used: int
+    duplicates_dropped: int
+    budget: int
+    history_lines_dropped: int = 0
+    documents_over_budget: int = 0
+    overflow_tokens: int = 0  # 예산 때문에 넣지 못한 문맥 조각의 토큰 수
+
+    def as_inputs(self) -> dict:
+        """QA 체인(프롬프트 템플릿)에 넘길 입력."""
+        return {
+            "chat_history": self.chat_history,
+            "retrieved_context": self.retrieved_context,
+            "question": self.question
+        }
+
+    def stats(self) -> dict:
+        return {
+            "budget": self.budget,
+            "history_tokens": self.history_tokens,
+            "context_tokens": self.context_tokens,
+            "question_tokens": self.question_tokens,
+            "history_lines": self.history_lines,
+            "documents_retrieved": self.documents_retrieved,
+            "documents_used": self.documents_used,
+            "duplicates_dropped": self.duplicates_dropped,
+            "history_lines_dropped": self.history_lines_dropped,
+            "documents_over_budget": self.documents_over_budget,
+            "overflow_tokens": self.overflow_tokens,
+        }
+
+
+def pack_context(question, history_lines, documents, budget=None, history_share=None) -> PackedContext:
+    """
+    히스토리 줄 목록(오래된 순)과 리트리브된 문서(순위순)를 토큰 예산 안으로 묶습니다.
+    """
+    budget = budget or settings.RAG_PROMPT_TOKEN_BUDGET
+    history_share = settings.RAG_PROMPT_HISTORY_SHARE if history_share is None else history_share
+
+    # 질문은 항상 들어가므로 먼저 빼 둠
+    question_tokens = count_tokens(question)
+    available = max(0, budget - question_tokens)
+
+    # 히스토리: 최근 대화부터 자기 몫만큼
+    history_budget = int(available * history_share)
+    history, history_tokens = [], 0
+    for line in reversed(history_lines):
+        tokens = count_tokens(line) + 1  # 줄바꿈
+        if history_tokens + tokens > history_budget:
+            break
+        history.append(line)
+        history_tokens += tokens
+    history.reverse()
+
+    # 문맥: 남은 예산 안에서 순위순으로
+    snippets = [s for s in (clean_snippet(doc.page_content) for doc in documents) if s]
+    snippets, duplicates = dedupe_snippets(snippets)
+    context_budget = available - history_tokens
+    context, context_tokens = [], 0
+    over_budget, overflow_tokens = 0, 0
+    for snippet in snippets:
+        tokens = count_tokens(snippet) + 1
+        if context_tokens + tokens > context_budget:
+            # 뒤의 짧은 조각은 들어갈 수 있으므로 계속 진행
+            over_budget += 1
+            overflow_tokens += tokens
+            continue
+        context.append(snippet)
+        context_tokens += tokens
+
+    return PackedContext(
+        question=question,
+        chat_history="\n".join(history),
+        retrieved_context="\n".join(context),
+        history_tokens=history_tokens,
+        context_tokens=context_tokens,
+        question_tokens=question_tokens,
+        history_lines=len(history),
+        documents_retrieved=len(documents),
+        documents_used=len(context),
+        duplicates_dropped=duplicates,
+        budget=budget,
+        history_lines_dropped=len(history_lines) - len(history),
+        documents_over_budget=over_budget,
+        overflow_tokens=overflow_tokens
+    )
@@ -0,0 +1,187 @@
+"""
+임베딩 2단계 캐시 (메모리 LRU + 디스크 SQLite).
+
+키는 (모델 이름, 차원, 정규화된 텍스트)의 SHA-256 해시입니다. 정규화는 유니코드 NFC 변환,
+앞뒤 공백 제거, 연속 공백 축약만 수행하므로 의미가 다른 텍스트가 같은 키를 갖지는 않습니다.
+
+질의 시점(RAGQuery의 리트리버)과 적재 시점(RAGProcessor) 모두 CachedEmbeddings를 거치므로
+한 번 계산한 임베딩은 워커 재시작 후에도 다시 요청하지 않습니다.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """캐시 키 계산용 텍스트 정규화."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def _as_list(vector):
+    """LangChain Embeddings 인터페이스는 float 리스트를 반환하므로 캐시의 배열은 반환 직전에 변환."""
+    return vector.tolist() if isinstance(vector, np.ndarray) else vector
+
+
+class EmbeddingCache:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path=None, memory_size=None):
+        self.path = str(path or settings.RAG_EMBEDDING_CACHE_PATH)
+        self.memory_size = memory_size or settings.RAG_EMBEDDING_CACHE_MEMORY_SIZE
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._conn = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def instance(cls):
+        """프로세스 전역 임베딩 캐시를 반환합니다."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> dict:
+        """캐시에 있는 키만 {key: vector(np.float32 배열)} 형태로 반환합니다."""
+        found = {}
+        disk_keys = []
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.memory_hits += 1
+                else:
+                    disk_keys.append(key)
+
+            if disk_keys:
+                for key, blob in self._select(disk_keys):
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                self.misses += len(disk_keys) - sum(1 for key in disk_keys if key in found)
+        return found
+
+    def put_many(self, items: dict):
+        """{key: vector}를 메모리와 디스크에 저장합니다."""
+        if not items:
+            return
+        # 메모리 LRU에는 float 리스트(차원당 수십 바이트) 대신 float32 배열(차원당 4바이트)로 보관
+        vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+        rows = [(key, vector.tobytes()) for key, vector in vectors.items()]
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            conn = self._connection()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+
+    def stats(self) -> dict:
+        """캐시 적중률 카운터를 반환합니다."""
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.memory_hits + self.disk_hits) / total if total else 0.0,
+            'memory_entries': len(self._memory),
+        }
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _select(self, keys):
+        conn = self._connection()
+        rows = []
+        # SQLite 바인딩 변수 개수 제한을 고려해 나누어 조회
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall())
+        return rows
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings 구현체를 감싸 EmbeddingCache를 거치게 하는 래퍼.
+
+    한 번의 embed_documents 호출 안에서 중복된 텍스트는 한 번만 요청합니다.
+    """
+
+    def __init__(self, underlying: Embeddings, namespace: str, cache: EmbeddingCache = None):
+        self.underlying = underlying
+        self.namespace = namespace
+        self.cache = cache or EmbeddingCache.instance()
+
+    def _lookup(self, texts):
+        keys = [EmbeddingCache.make_key(self.namespace, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return keys, found, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [_as_list(found[key]) for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.aembed_through(texts, self.underlying.aembed_documents)
+
+    async def aembed_through(self, texts: List[str], embed_missing) -> List[List[float]]:
+        """
+        캐시에 없는 텍스트만 embed_missing(텍스트 리스트)으로 계산해 캐시에 넣고, 입력 순서대로 반환합니다.
+        EmbeddingScheduler가 실제로 요청하는 텍스트에만 토큰 한도를 적용할 때 사용합니다.
+        """
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            vectors = await embed_missing(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [_as_list(found[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
@@ -0,0 +1,245 @@
+"""
+적재용 임베딩 요청 스케줄러.
+
+OpenAI 임베딩 API의 한도는 분당 토큰(TPM)/요청(RPM) 기준이므로, 행 수나 CPU 코어 수가 아니라
+토큰 수로 배치를 만들고 속도를 조절합니다.
+
+- 배치 구성: tiktoken 토큰 수 기준으로 요청당 RAG_EMBEDDING_BATCH_MAX_TOKENS / RAG_EMBEDDING_BATCH_MAX_ITEMS까지 채움
+- 속도 제한: TPM/RPM 토큰 버킷 (RAG_EMBEDDING_TPM, RAG_EMBEDDING_RPM). 요청 전에 필요한 만큼 기다리며,
+  임베딩 캐시 적중은 요청하지 않으므로 차감하지 않음
+- 동시성: AIMD. 성공이 이어지면 동시 요청 수를 1씩 늘리고, 429 또는 응답 지연이
+  RAG_EMBEDDING_TARGET_LATENCY를 넘으면 절반으로 줄임
+- 재시도: 429/타임아웃/연결/5xx 오류는 지수 백오프 + 전체 지터(full jitter)로 재시도하며,
+  Retry-After 헤더가 있으면 그 시간 동안 모든 요청을 멈춤
+
+버킷과 동시성 상태는 프로세스 전역(instance())이라 적재 파이프라인의 여러 임베딩 스레드가
+각자의 이벤트 루프에서 호출해도 한도를 함께 지킵니다.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import List
+
+from django.conf import settings
+
+from .embedding_cache import CachedEmbeddings
+from .metrics import MetricsRegistry
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def pack_batches(texts: List[str], max_tokens: int, max_items: int, model: str = None):
+    """
+    입력 순서를 유지하면서 토큰 수 합이 max_tokens, 개수가 max_items를 넘지 않도록 묶습니다.
+
+    Returns:
+        [(시작 위치, 텍스트 리스트, 토큰 수)]
+    """
+    batches = []
+    start, batch, batch_tokens = 0, [], 0
+    for i, text in enumerate(texts):
+        tokens = max(1, count_tokens(text, model))
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            batches.append((start, batch, batch_tokens))
+            start, batch, batch_tokens = i, [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append((start, batch, batch_tokens))
+    return batches
+
+
+def is_rate_limited(error) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error) -> bool:
+    if is_rate_limited(error) or getattr(error, "status_code", None) in RETRYABLE_STATUS:
+        return True
+    return type(error).__name__ in {"APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """분당 rate만큼 채워지는 버킷. 여러 스레드/이벤트 루프에서 함께 사용합니다."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount):
+        """amount를 예약하고 기다려야 할 시간(초)을 반환합니다. 부족분은 빚으로 남깁니다."""
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= amount
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    async def acquire(self, amount):
+        wait = self._reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class EmbeddingScheduler:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, tpm=None, rpm=None, initial_concurrency=None, max_concurrency=None):
+        self.tokens = TokenBucket(tpm or settings.RAG_EMBEDDING_TPM)
+        self.requests = TokenBucket(rpm or settings.RAG_EMBEDDING_RPM)
+        self.max_concurrency = max_concurrency or settings.RAG_EMBEDDING_MAX_CONCURRENCY
+        self.concurrency = float(min(initial_concurrency or settings.RAG_EMBEDDING_INITIAL_CONCURRENCY, self.max_concurrency))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'texts': 0, 'tokens': 0, 'retries': 0, 'rate_limited': 0, 'throttled_seconds': 0.0}
+
+    @classmethod
+    def instance(cls):
+        """프로세스 전역 스케줄러를 반환합니다."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    async def embed(self, texts: List[str], embedding_function, pbar=None) -> List[List[float]]:
+        """
+        texts를 토큰 기준 배치로 나누어 한도 안에서 동시에 임베딩하고, 입력 순서대로 반환합니다.
+
+        embedding_function이 CachedEmbeddings이면 캐시 적중과 중복 텍스트를 먼저 걸러 내고
+        실제로 요청하는 텍스트만 배치로 만들어 TPM/RPM 버킷에서 차감합니다.
+        """
+        if not texts:
+            return []
+        if isinstance(embedding_function, CachedEmbeddings):
+            requested = []
+
+            async def embed_missing(missing):
+                requested.append(len(missing))
+                return await self._embed_batches(missing, embedding_function.underlying, pbar)
+
+            vectors = await embedding_function.aembed_through(texts, embed_missing)
+            if pbar is not None:
+                # 요청한 텍스트는 배치가 끝날 때마다 반영되므로 캐시에서 찾은 수만 더함
+                pbar.update(len(texts) - sum(requested))
+            return vectors
+        return await self._embed_batches(texts, embedding_function, pbar)
+
+    async def _embed_batches(self, texts, embedding_function, pbar=None):
+        if not texts:
+            return []
+        batches = pack_batches(
+            texts,
+            settings.RAG_EMBEDDING_BATCH_MAX_TOKENS,
+            settings.RAG_EMBEDDING_BATCH_MAX_ITEMS,
+            settings.RAG_EMBEDDING_MODEL
+        )
+
+        async def run(batch, tokens):
+            vectors = await self._request(embedding_function, batch, tokens)
+            if pbar is not None:
+                pbar.update(len(batch))
+            return vectors
+
+        results = await asyncio.gather(*(run(batch, tokens) for _, batch, tokens in batches))
+        return [vector for vectors in results for vector in vectors]
+
+    async def _request(self, embedding_function, batch, tokens):
+        attempt = 0
+        while True:
+            await self._acquire_slot()
+            try:
+                waited = await self.requests.acquire(1)
+                waited += await self.tokens.acquire(tokens)
+                started = time.monotonic()
+                try:
+                    vectors = await embedding_function.aembed_documents(batch)
+                except Exception as e:
+                    if not is_retryable(e) or attempt >= settings.RAG_EMBEDDING_MAX_RETRIES:
+                        raise
+                    delay = self._on_failure(e, attempt)
+                else:
+                    self._on_success(time.monotonic() - started, len(batch), tokens, waited)
+                    return vectors
+            finally:
+                self._release_slot()
+            attempt += 1
+            logger.warning("임베딩 요청 재시도 %d회차 (%.1f초 후)", attempt, delay)
+            await asyncio.sleep(delay)
+
+    async def _acquire_slot(self):
+        """AIMD로 조절되는 동시 요청 수 안에서 자리를 얻습니다 (여러 이벤트 루프 공용이라 짧게 폴링)."""
+        while True:
+            with self._lock:
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0 and self.in_flight < int(self.concurrency):
+                    self.in_flight += 1
+                    return
+            await asyncio.sleep(max(pause, 0.01))
+
+    def _release_slot(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _on_success(self, latency, texts, tokens, waited):
+        MetricsRegistry.instance().observe("ingest.embedding_request", latency * 1000)
+        with self._lock:
+            self.counters['requests'] += 1
+            self.counters['texts'] += texts
+            self.counters['tokens'] += tokens
+            self.counters['throttled_seconds'] += waited
+            if latency > settings.RAG_EMBEDDING_TARGET_LATENCY:
+                self._decrease()
+            else:
+                # 동시성 n에서 n번 성공하면 1 증가 (additive increase)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / max(self.concurrency, 1.0))
+
+    def _on_failure(self, error, attempt):
+        """재시도 대기 시간(초)을 반환합니다."""
+        retry_after = retry_after_seconds(error)
+        delay = random.uniform(0, min(settings.RAG_EMBEDDING_BACKOFF_MAX, settings.RAG_EMBEDDING_BACKOFF_BASE * 2 ** attempt))
+        with self._lock:
+            self.counters['retries'] += 1
+            if is_rate_limited(error):
+                self.counters['rate_limited'] += 1
+                self._decrease()
+            if retry_after:
+                # 서버가 알려준 시간 동안은 모든 요청을 멈춤
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                delay = max(delay, retry_after)
+        return delay
+
+    def _decrease(self):
+        """multiplicative decrease (잠금 안에서 호출)."""
+        self.concurrency = max(1.0, self.concurrency / 2)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.counters,
+                'concurrency': round(self.concurrency, 2),
+                'in_flight': self.in_flight,
+                'tokens_available': round(self.tokens.level),
+                'requests_available': round(self.requests.level),
+            }
@@ -0,0 +1,152 @@
+"""
+적재 중 계산한 임베딩을 보관하는 .npy 샤드 캐시 (이전 pickle 임시 파일 대체).
+
+원본 파일 하나당 디렉터리 하나를 쓰며, 이름에 파일 내용 해시와 임베딩 모델/차원이 들어가므로
+파일 내용이나 모델 설정이 바뀌면 이전 벡터를 재사용하지 않습니다.
+
+    RAG_TEMP_DIR/<파일 이름>.<경로 해시>.<키>/
+        manifest.json     : 원본 파일, 내용 해시, 모델, 차원, dtype, 샤드별 행 수, 적재 체크포인트
+        00000.npy         : 샤드 벡터 (행 순서는 00000.ids.json과 같음)
+        00000.ids.json    : 샤드 행 ID 목록
+
+스트리밍 적재는 청크마다, 파일 단위 적재는 샤드 하나를 씁니다. 샤드는 메모리 매핑으로 열기 때문에
+중단된 적재를 다시 시작하면 저장된 벡터를 거의 복사 없이 Chroma에 넘깁니다.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .engine import embedding_dimensions
+
+
+def file_digest(path, block_size=1 << 20):
+    """파일 내용의 SHA-256."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class EmbeddingShardStore:
+    def __init__(self, source_file, root, content_hash=None):
+        self.source_file = source_file
+        self.root = str(root)
+        self.content_hash = content_hash or file_digest(source_file)
+        self.namespace = settings.RAG_EMBEDDINGS_FACTORY or settings.RAG_EMBEDDING_MODEL
+        self.dimensions = embedding_dimensions()
+        # 샤드 벡터는 Chroma에 그대로 넘기는 원본이므로 항상 float32로 저장
+        # (양자화는 FAISS 스냅샷의 검색용 코드에만 적용, rag/quantization.py)
+        self.dtype = np.float32
+
+        key = hashlib.sha256(
+            f"{self.content_hash}\x00{self.namespace}\x00{self.dimensions}\x00{np.dtype(self.dtype).name}".encode("utf-8")
+        ).hexdigest()[:16]
+        self.prefix = f"{os.path.basename(source_file)}.{hashlib.sha1(os.path.abspath(source_file).encode('utf-8')).hexdigest()[:8]}."
+        self.path = os.path.join(self.root, self.prefix + key)
+        self._lock = threading.Lock()  # 임베딩 스레드들과 쓰기 스레드가 manifest를 함께 갱신
+
+    @staticmethod
+    def shard_name(shard):
+        return f"{int(shard):05d}"
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    def manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {
+                "source": os.path.basename(self.source_file),
+                "content_sha256": self.content_hash,
+                "model": self.namespace,
+                "dimensions": self.dimensions,
+                "dtype": np.dtype(self.dtype).name,
+                "shards": {},
+            }
+
+    def load(self, shard):
+        """
+        샤드의 (ids, vectors)를 반환합니다. vectors는 읽기 전용 메모리 매핑 배열입니다.
+        샤드가 없으면 None.
+        """
+        name = self.shard_name(shard)
+        try:
+            with open(os.path.join(self.path, f"{name}.ids.json"), encoding="utf-8") as f:
+                ids = json.load(f)
+            vectors = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        if len(ids) != len(vectors):
+            return None
+        return ids, vectors
+
+    def save(self, shard, ids, vectors):
+        """샤드를 원자적으로 저장하고 manifest를 갱신합니다."""
+        self._ensure_dir()
+        name = self.shard_name(shard)
+        vectors = np.asarray(vectors, dtype=self.dtype)
+        tmp = os.path.join(self.path, f"{name}.tmp.npy")
+        np.save(tmp, vectors)
+        os.replace(tmp, os.path.join(self.path, f"{name}.npy"))
+        _write_json(os.path.join(self.path, f"{name}.ids.json"), list(ids))
+
+        with self._lock:
+            manifest = self.manifest()
+            manifest["shards"][name] = len(ids)
+            if len(vectors):
+                manifest["dimensions"] = int(vectors.shape[1])
+            _write_json(self.manifest_path, manifest)
+
+    def load_checkpoint(self, collection_id, chunk_rows):
+        """
+        같은 컬렉션/청크 크기로 마지막으로 쓴 다음 배치 번호를 반환합니다 (없으면 0).
+        컬렉션이 새로 만들어졌거나 청크 크기가 바뀌었으면 처음부터 진행합니다.
+        """
+        checkpoint = self.manifest().get("checkpoint") or {}
+        if checkpoint.get("collection") != str(collection_id) or checkpoint.get("chunk_rows") != chunk_rows:
+            return 0
+        return int(checkpoint.get("next_batch", 0))
+
+    def save_checkpoint(self, collection_id, chunk_rows, next_batch):
+        self._ensure_dir()
+        with self._lock:
+            manifest = self.manifest()
+            manifest["checkpoint"] = {
+                "collection": str(collection_id),
+                "chunk_rows": chunk_rows,
+                "next_batch": next_batch,
+            }
+            _write_json(self.manifest_path, manifest)
+
+    def _ensure_dir(self):
+        if not os.path.isdir(self.path):
+            self._prune_stale()
+            os.makedirs(self.path, exist_ok=True)
+
+    def _prune_stale(self):
+        """같은 원본 파일의 이전 내용/모델로 만든 샤드 디렉터리를 지웁니다."""
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            full = os.path.join(self.root, name)
+            if name.startswith(self.prefix) and full != self.path and os.path.isdir(full):
+                shutil.rmtree(full, ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,308 @@
+"""
+RAG 질의용 프로세스 전역(워커당 1개) 엔진.
+
+Chroma 컬렉션, 임베딩 클라이언트, LLM, 프롬프트 체인을 워커 프로세스마다 한 번만 만들고
+모든 요청이 공유합니다. 질의 경로에서는 이미 만들어진 상태 객체를 그대로 돌려주므로
+요청당 추가 비용은 속성 조회 수준입니다.
+
+데이터가 새로 적재되면 invalidate() 또는 reload()로 갱신합니다. 두 메서드 모두
+DB_DIR 아래의 세대(generation) 마커 파일을 갱신하므로, 다른 워커 프로세스도
+RAG_ENGINE_RELOAD_CHECK_SECONDS 이내에 변경을 감지하고 다음 질의에서 다시 로드합니다.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from langchain.prompts import ChatPromptTemplate
+from langchain_chroma import Chroma
+from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+
+from .constants import COLLECTION_NAME
+from .backends import ChromaBackend, FaissBackend, HybridRetriever, VectorBackendRetriever
+from .embedding_cache import CachedEmbeddings
+from .faiss_index import FaissIndex
+from .lexical import LexicalIndex
+
+logger = logging.getLogger(__name__)
+
+GENERATION_MARKER = ".engine_generation"
+
+# 모델별 기본(전체) 임베딩 차원
+MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# 프롬프트 템플릿: 채팅 히스토리와 리트리브된 문서를 별도의 키로 전달
+WARM_PROMPT_TEMPLATE = """Given the chat history and the retrieved context, rephrase the partner's harsh message into a gentle, warm, and loving tone that fits naturally into your ongoing conversation.
+
+        Chat History:
+        {chat_history}
+
+        Retrieved Context:
+        {retrieved_context}
+
+        Partner's harsh message:
+        {question}
+
+        Instructions:
+          1. Carefully analyze the chat history to grasp the emotional cues.
+          2. Incorporate relevant context from the retrieved documents.
+          3. Rephrase the partner's message, keeping its original meaning while softening the tone into a caring and respectful manner.
+          4. Provide three alternative rephrasings separated by pipes (|).
+          5. Each alternative should be concise (aim for around 15 words) and crafted for a loving conversation.
+          6. (Important) Whatever the language of the Chat History and Retrieved Context is, always respond in the same language as the harsh message "{question}"!!
+
+        Response Format:
+        Alternative1 | Alternative2 | Alternative3
+        """
+
+
+def build_embeddings():
+    """
+    질의/적재에 공통으로 사용하는 임베딩 클라이언트를 생성합니다.
+
+    RAG_EMBEDDINGS_FACTORY(모듈 경로)가 설정되어 있으면 OpenAIEmbeddings 대신 그 팩토리를 사용하고
+    (예: 'rag.fakes.hashing_embeddings'), RAG_EMBEDDING_CACHE_ENABLED가 켜져 있으면
+    메모리/디스크 임베딩 캐시를 거칩니다.
+
+    RAG_EMBEDDING_DIMENSIONS가 설정되어 있으면 줄인 차원의 임베딩을 요청하고(OpenAI dimensions 파라미터),
+    캐시 네임스페이스에도 차원을 포함해 다른 차원의 벡터와 섞이지 않게 합니다.
+    """
+    factory = settings.RAG_EMBEDDINGS_FACTORY
+    dimensions = settings.RAG_EMBEDDING_DIMENSIONS
+    if factory:
+        embeddings = import_string(factory)()
+        namespace = factory
+    else:
+        embeddings = OpenAIEmbeddings(model=settings.RAG_EMBEDDING_MODEL, chunk_size=1000, dimensions=dimensions)
+        namespace = settings.RAG_EMBEDDING_MODEL
+    if dimensions:
+        namespace = f"{namespace}:{dimensions}"
+    if not settings.RAG_EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    return CachedEmbeddings(embeddings, namespace=namespace)
+
+
+def embedding_dimensions():
+    """
+    현재 설정으로 만들어지는 임베딩 차원.
+    RAG_EMBEDDING_DIMENSIONS가 없으면 모델 기본 차원이며, 팩토리를 사용해 알 수 없으면 None입니다.
+    """
+    if settings.RAG_EMBEDDING_DIMENSIONS:
+        return int(settings.RAG_EMBEDDING_DIMENSIONS)
+    if settings.RAG_EMBEDDINGS_FACTORY:
+        return None
+    return MODEL_DIMENSIONS.get(settings.RAG_EMBEDDING_MODEL)
+
+
+def collection_dimensions(collection):
+    """
+    컬렉션에 기록된 임베딩 차원. 기록이 없는 이전 컬렉션은 저장된 벡터 하나로 확인하며,
+    비어 있으면 None입니다.
+    """
+    recorded = (collection.metadata or {}).get("embedding_dimensions")
+    if recorded:
+        return int(recorded)
+    sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+    if sample is None or not len(sample):
+        return None
+    return len(sample[0])
+
+
+def check_dimensions(actual, source):
+    """저장된 벡터 차원이 현재 설정과 다르면 질의/적재 전에 바로 실패합니다."""
+    expected = embedding_dimensions()
+    if expected and actual and int(actual) != expected:
+        raise ImproperlyConfigured(
+            f"{source}의 임베딩 차원({actual})이 현재 설정({expected})과 다릅니다. "
+            f"RAG_EMBEDDING_DIMENSIONS={actual}로 되돌리거나 "
+            f"manage.py reproject_embeddings --dimensions {expected}로 컬렉션을 변환하세요."
+        )
+    return actual
+
+
+def build_llm():
+    """
+    다정모드 변환에 사용하는 채팅 모델을 생성합니다.
+
+    RAG_LLM_FACTORY(모듈 경로)가 설정되어 있으면 ChatOpenAI 대신 그 팩토리를 사용합니다.
+    """
+    if settings.RAG_LLM_FACTORY:
+        return import_string(settings.RAG_LLM_FACTORY)()
+    return ChatOpenAI(
+        model=settings.RAG_LLM_MODEL,
+        temperature=settings.RAG_LLM_TEMPERATURE,
+        stream_usage=True  # 스트리밍 응답에서도 프롬프트/완성 토큰 수를 받음
+    )
+
+
+def build_backend(vectorstore):
+    """
+    RAG_RETRIEVER_BACKEND 설정에 맞는 벡터 검색 백엔드를 생성합니다.
+
+    'faiss'로 설정되어 있어도 스냅샷이 아직 없으면 Chroma 백엔드를 사용합니다.
+    """
+    if settings.RAG_RETRIEVER_BACKEND == "faiss":
+        if FaissIndex.exists():
+            index = FaissIndex.load()
+            check_dimensions(index.meta["dim"], f"FAISS 스냅샷({index.path})")
+            return FaissBackend(index)
+        logger.warning("FAISS 스냅샷이 없어 Chroma 백엔드를 사용합니다. (manage.py rebuild_faiss_index)")
+    return ChromaBackend(vectorstore)
+
+
+def build_retriever(backend, embeddings):
+    """
+    RAG_RETRIEVAL_MODE 설정에 맞는 리트리버를 생성합니다.
+
+    'hybrid' 또는 'lexical'로 설정되어 있어도 BM25 어휘 색인이 아직 없으면 벡터 검색만 사용합니다.
+    """
+    vector = VectorBackendRetriever(backend=backend, embeddings=embeddings, k=settings.RAG_RETRIEVER_K)
+    mode = settings.RAG_RETRIEVAL_MODE
+    if mode == "vector":
+        return vector
+    if not LexicalIndex.exists():
+        logger.warning("BM25 어휘 색인이 없어 벡터 검색만 사용합니다. (manage.py rebuild_lexical_index)")
+        return vector
+    return HybridRetriever(
+        vector=vector,
+        lexical=LexicalIndex.load(),
+        k=settings.RAG_RETRIEVER_K,
+        mode=mode,
+        rrf_k=settings.RAG_RRF_K,
+        timeout=settings.RAG_VECTOR_SEARCH_TIMEOUT
+    )
+
+
+@dataclass(frozen=True)
+class EngineState:
+    """한 번 로드된 엔진 구성요소 묶음. 교체는 통째로(원자적으로) 이루어집니다."""
+    embeddings: object
+    vectorstore: Chroma
+    backend: object
+    retriever: object
+    llm: object
+    chain: object
+    document_count: int
+    loaded_at: float
+
+
+class RAGEngine:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db_dir=None):
+        if db_dir is None:
+            from .method import RAGProcessor
+            db_dir = RAGProcessor.DB_DIR
+        self.db_dir = str(db_dir)
+        self._lock = threading.Lock()
+        self._state = None
+        self._loaded_marker = None
+        self._next_marker_check = 0.0
+
+    @classmethod
+    def instance(cls):
+        """프로세스 전역 엔진을 반환합니다 (최초 호출 시 생성)."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @property
+    def marker_path(self):
+        return os.path.join(self.db_dir, GENERATION_MARKER)
+
+    @property
+    def is_loaded(self):
+        return self._state is not None
+
+    def get(self) -> EngineState:
+        """
+        로드된 엔진 상태를 반환합니다.
+
+        이미 로드되어 있고 다른 프로세스에서 무효화하지 않았다면 잠금 없이 즉시 반환하고,
+        그렇지 않은 경우에만 잠금을 잡고 한 번 로드합니다.
+        """
+        state = self._state
+        if state is not None and not self._is_stale():
+            return state
+        with self._lock:
+            if self._state is None or self._state is state:
+                self._state = self._load()
+            return self._state
+
+    async def aget(self) -> EngineState:
+        """get()의 비동기 버전. 로드가 필요할 때만 별도 스레드에서 로드합니다."""
+        state = self._state
+        if state is not None and not self._is_stale():
+            return state
+        return await asyncio.to_thread(self.get)
+
+    def reload(self) -> EngineState:
+        """현재 프로세스에서 즉시 다시 로드하고, 다른 워커에도 무효화를 알립니다."""
+        self._touch_marker()
+        with self._lock:
+            self._state = self._load()
+            return self._state
+
+    def invalidate(self):
+        """로드된 상태를 버립니다. 다음 질의에서 다시 로드됩니다."""
+        self._touch_marker()
+        with self._lock:
+            self._state = None
+
+    def _load(self) -> EngineState:
+        self._loaded_marker = self._read_marker()
+        embeddings = build_embeddings()
+        vectorstore = Chroma(
+            persist_directory=self.db_dir,
+            embedding_function=embeddings,
+            collection_name=COLLECTION_NAME
+        )
+        check_dimensions(collection_dimensions(vectorstore._collection), f"Chroma 컬렉션({COLLECTION_NAME})")
+        backend = build_backend(vectorstore)
+        retriever = build_retriever(backend, embeddings)
+        llm = build_llm()
+        prompt = ChatPromptTemplate.from_template(WARM_PROMPT_TEMPLATE)
+        document_count = backend.count()
+        mode = retriever.mode if isinstance(retriever, HybridRetriever) else "vector"
+        logger.info("RAG 엔진 로드 완료 (백엔드: %s, 검색: %s, 문서 수: %s)", backend.name, mode, document_count)
+        return EngineState(
+            embeddings=embeddings,
+            vectorstore=vectorstore,
+            backend=backend,
+            retriever=retriever,
+            llm=llm,
+            chain=prompt | llm,
+            document_count=document_count,
+            loaded_at=time.time()
+        )
+
+    def _is_stale(self):
+        """세대 마커를 주기적으로 확인하여 다른 프로세스의 무효화 여부를 판단합니다."""
+        now = time.monotonic()
+        if now < self._next_marker_check:
+            return False
+        self._next_marker_check = now + settings.RAG_ENGINE_RELOAD_CHECK_SECONDS
+        return self._read_marker() != self._loaded_marker
+
+    def _read_marker(self):
+        try:
+            return os.stat(self.marker_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _touch_marker(self):
+        os.makedirs(self.db_dir, exist_ok=True)
+        with open(self.marker_path, "w") as f:
+            f.write(str(time.time_ns()))
@@ -0,0 +1,348 @@
+"""
+Chroma 컬렉션을 FAISS 인덱스 파일로 내보낸 질의 전용 스냅샷.
+
+스냅샷 디렉터리 구성 (RAG_FAISS_DIR/<버전>/):
+    index.faiss   : FAISS 인덱스 (문서 수가 RAG_FAISS_IVF_THRESHOLD 이상이면 IVF, 아니면 Flat)
+    docs.jsonl    : 행 번호 순서의 {"id", "text", "metadata"} (emotion 메타데이터 포함)
+    offsets.npy   : docs.jsonl 각 행의 바이트 오프셋
+    meta.json     : 문서 수, 차원, 인덱스 종류, 양자화 방식, 생성 시각, 감정별 파티션 목록
+    partitions/   : emotion 값별 하위 인덱스(<slug>.faiss)와 전체 행 번호 매핑(<slug>.rows.npy)
+
+양자화 스냅샷(quantization이 'float16' 또는 'int8', rag/quantization.py 참고)은 index.faiss 대신
+index.codes.npy(+ index.scales.npy)와 재채점용 float32 원본 vectors.npy를 두며,
+파티션도 <slug>.codes.npy(+ <slug>.scales.npy)로 저장합니다.
+
+RAG_FAISS_DIR/CURRENT 파일이 사용할 버전 디렉터리를 가리키며, 재생성 시 새 버전을 모두 만든 뒤
+CURRENT만 원자적으로 교체합니다. 인덱스와 문서 파일은 메모리 매핑으로 열기 때문에
+같은 호스트의 여러 워커가 페이지 캐시를 공유합니다.
+"""
+import json
+import math
+import mmap
+import os
+import shutil
+import time
+
+import faiss
+import numpy as np
+from django.conf import settings
+from langchain_core.documents import Document
+
+from .partitions import partition_name
+from .quantization import QuantizedIndex, quantize, save_codes, validate_mode
+
+CURRENT_POINTER = "CURRENT"
+
+
+def _normalize(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def iter_collection(collection, batch_size, include=("embeddings", "documents", "metadatas")):
+    """
+    Chroma 컬렉션의 (ids, embeddings, documents, metadatas)를 배치 단위로 읽습니다.
+
+    limit/offset 페이징은 페이지마다 앞의 행을 다시 건너뛰므로 전체가 O(n²)이고, 읽는 동안 적재가 진행되면
+    행이 밀려 중복/누락이 생깁니다. 그래서 시작 시점의 ID 목록만 먼저 읽어 정렬해 두고 ID 배치로 조회합니다.
+    시작 후 추가된 문서는 포함하지 않으며, 그 사이 삭제된 문서는 건너뜁니다.
+    include에 없는 항목은 None입니다.
+    """
+    ids = sorted(collection.get(include=[])["ids"])
+    for start in range(0, len(ids), batch_size):
+        batch = collection.get(ids=ids[start:start + batch_size], include=list(include))
+        if not batch["ids"]:
+            continue
+        yield batch["ids"], batch.get("embeddings"), batch.get("documents"), batch.get("metadatas")
+
+
+def _read_index(index_file):
+    try:
+        index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # 메모리 매핑을 지원하지 않는 인덱스 종류는 일반 로드
+        index = faiss.read_index(index_file)
+    if hasattr(index, "nprobe"):
+        index.nprobe = settings.RAG_FAISS_NPROBE
+    return index
+
+
+class FaissIndex:
+    def __init__(self, path, index, offsets, docs_file, docs_map, meta, partitions=None):
+        self.path = path
+        self.index = index
+        self.offsets = offsets
+        self._docs_file = docs_file
+        self._docs_map = docs_map
+        self.meta = meta
+        self.partitions = partitions or {}  # {emotion: (index, rows)}
+
+    @property
+    def count(self):
+        return self.meta["count"]
+
+    @staticmethod
+    def root_dir(root=None):
+        return str(root or settings.RAG_FAISS_DIR)
+
+    @classmethod
+    def current_path(cls, root=None):
+        """CURRENT가 가리키는 스냅샷 경로를 반환합니다. 없으면 None."""
+        root = cls.root_dir(root)
+        try:
+            with open(os.path.join(root, CURRENT_POINTER)) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        path = os.path.join(root, version)
+        return path if os.path.isdir(path) else None
+
+    @classmethod
+    def exists(cls, root=None):
+        return cls.current_path(root) is not None
+
+    @classmethod
+    def load(cls, root=None):
+        """현재 스냅샷을 메모리 매핑으로 엽니다."""
+        path = cls.current_path(root)
+        if path is None:
+            raise FileNotFoundError(f"FAISS 스냅샷이 없습니다: {cls.root_dir(root)}")
+
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("quantization", "none") != "none":
+            index, partitions = cls._load_quantized(path, meta)
+        else:
+            index = _read_index(os.path.join(path, "index.faiss"))
+            partitions = {}
+            for emotion, slug in meta.get("partitions", {}).items():
+                partitions[emotion] = (
+                    _read_index(os.path.join(path, "partitions", f"{slug}.faiss")),
+                    np.load(os.path.join(path, "partitions", f"{slug}.rows.npy"), mmap_mode="r")
+                )
+
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        docs_file = open(os.path.join(path, "docs.jsonl"), "rb")
+        docs_map = mmap.mmap(docs_file.fileno(), 0, access=mmap.ACCESS_READ) if meta["count"] else None
+        return cls(path, index, offsets, docs_file, docs_map, meta, partitions)
+
+    @staticmethod
+    def _load_quantized(path, meta):
+        """
+        양자화 스냅샷을 엽니다. RAG_QUERY_QUANTIZATION이 'float32'이면 압축 벡터 대신
+        float32 원본으로 정확 검색합니다.
+        """
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        exact = settings.RAG_QUERY_QUANTIZATION == "float32"
+        index = QuantizedIndex.exact_over(vectors) if exact else QuantizedIndex.load(os.path.join(path, "index"), vectors)
+        partitions = {}
+        for emotion, slug in meta.get("partitions", {}).items():
+            prefix = os.path.join(path, "partitions", slug)
+            rows = np.load(f"{prefix}.rows.npy", mmap_mode="r")
+            partitions[emotion] = (
+                QuantizedIndex.exact_over(vectors, rows) if exact else QuantizedIndex.load(prefix, vectors, rows),
+                rows
+            )
+        return index, partitions
+
+    def document(self, row):
+        """행 번호의 문서를 읽어 Document로 반환합니다."""
+        start = int(self.offsets[row])
+        end = self._docs_map.find(b"\n", start)
+        record = json.loads(self._docs_map[start:end])
+        metadata = dict(record["metadata"] or {})
+        metadata.setdefault("doc_id", record["id"])
+        return Document(page_content=record["text"], metadata=metadata)
+
+    def search(self, vector, k, emotions=None):
+        return self.search_many([vector], k, emotions)[0]
+
+    def search_many(self, vectors, k, emotions=None):
+        """
+        상위 k개 (Document, 내적 점수)를 반환합니다.
+
+        emotions가 주어지면 해당 감정의 파티션 인덱스만 검색하고 점수순으로 합칩니다.
+        """
+        if not len(vectors):
+            return []
+        if not self.count:
+            return [[] for _ in vectors]
+        queries = _normalize(vectors)
+        if not emotions:
+            scores, rows = self.index.search(queries, k)
+        else:
+            scores, rows = self._search_partitions(queries, k, emotions)
+        return [
+            [(self.document(row), float(score)) for score, row in zip(row_scores, row_ids) if row >= 0]
+            for row_scores, row_ids in zip(scores, rows)
+        ]
+
+    def _search_partitions(self, queries, k, emotions):
+        """감정별 파티션 결과(파티션 내 행 번호)를 전체 행 번호로 바꾸어 점수순으로 합칩니다."""
+        all_scores = [np.full((len(queries), 0), -np.inf, dtype=np.float32)]
+        all_rows = [np.full((len(queries), 0), -1, dtype=np.int64)]
+        for emotion in emotions:
+            if emotion not in self.partitions:
+                continue
+            index, row_map = self.partitions[emotion]
+            scores, local_rows = index.search(queries, k)
+            valid = local_rows >= 0
+            rows = np.where(valid, np.asarray(row_map)[np.where(valid, local_rows, 0)], -1)
+            all_scores.append(np.where(valid, scores, -np.inf))
+            all_rows.append(rows)
+        scores = np.concatenate(all_scores, axis=1)
+        rows = np.concatenate(all_rows, axis=1)
+        order = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+    @classmethod
+    def build_from_chroma(cls, collection, root=None, batch_size=5000, quantization=None):
+        """
+        Chroma 컬렉션 전체를 새 스냅샷으로 내보내고 CURRENT를 교체합니다.
+
+        임베딩은 먼저 임시 memmap 파일에 기록하므로 전체 벡터를 메모리에 올리지 않습니다.
+        quantization이 없으면 적재 시 컬렉션 메타데이터에 기록된 방식, 그다음 RAG_VECTOR_QUANTIZATION을 사용합니다.
+
+        Returns:
+            str: 새 스냅샷 경로
+        """
+        root = cls.root_dir(root)
+        quantization = validate_mode(
+            quantization or (collection.metadata or {}).get("quantization") or settings.RAG_VECTOR_QUANTIZATION
+        )
+        version = time.strftime("%Y%m%d%H%M%S") + f"_{os.getpid()}"
+        path = os.path.join(root, version)
+        os.makedirs(path, exist_ok=True)
+
+        total = collection.count()
+        dim = None
+        vectors = None
+        offsets = np.zeros(total, dtype=np.int64)
+        vectors_file = os.path.join(path, "vectors.tmp")
+        row = 0
+        emotion_rows = {}
+        with open(os.path.join(path, "docs.jsonl"), "wb") as docs:
+            for ids, embeddings, documents, metadatas in iter_collection(collection, batch_size):
+                embeddings = np.asarray(embeddings, dtype=np.float32)
+                if vectors is None:
+                    dim = embeddings.shape[1]
+                    vectors = np.lib.format.open_memmap(vectors_file, mode="w+", dtype=np.float32, shape=(total, dim))
+                n = min(len(ids), total - row)
+                vectors[row:row + n] = _normalize(embeddings[:n])
+                for doc_id, text, metadata in zip(ids[:n], documents[:n], metadatas[:n]):
+                    emotion = (metadata or {}).get("emotion")
+                    if emotion:
+                        emotion_rows.setdefault(emotion, []).append(row)
+                    offsets[row] = docs.tell()
+                    docs.write(json.dumps({"id": doc_id, "text": text, "metadata": metadata}, ensure_ascii=False).encode("utf-8"))
+                    docs.write(b"\n")
+                    row += 1
+
+        quantized = quantization != "none" and vectors is not None
+        if quantized:
+            save_codes(os.path.join(path, "index"), *cls._quantize_rows(vectors, np.arange(row), quantization))
+            index_type = f"QuantizedIndex({quantization})"
+        else:
+            index = cls._build_index(vectors[:row] if vectors is not None else None, dim)
+            faiss.write_index(index, os.path.join(path, "index.faiss"))
+            index_type = type(index).__name__
+        np.save(os.path.join(path, "offsets.npy"), offsets[:row])
+
+        # 감정별 파티션 하위 인덱스
+        partitions = {}
+        if emotion_rows:
+            os.makedirs(os.path.join(path, "partitions"), exist_ok=True)
+        for emotion, rows in emotion_rows.items():
+            slug = partition_name(emotion)
+            rows = np.asarray(rows, dtype=np.int64)
+            if quantized:
+                save_codes(os.path.join(path, "partitions", slug), *cls._quantize_rows(vectors, rows, quantization))
+            else:
+                faiss.write_index(cls._build_index(vectors[rows], dim), os.path.join(path, "partitions", f"{slug}.faiss"))
+            np.save(os.path.join(path, "partitions", f"{slug}.rows.npy"), rows)
+            partitions[emotion] = slug
+
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({
+                "count": row,
+                "dim": dim,
+                "index_type": index_type,
+                "quantization": quantization if quantized else "none",
+                "partitions": partitions,
+                "built_at": time.time()
+            }, f, ensure_ascii=False)
+        if vectors is not None:
+            vectors.flush()
+        del vectors
+        if quantized:
+            # 재채점용 float32 원본으로 그대로 보관 (전체 행을 채웠을 때만 크기가 맞음)
+            if row < total:
+                cls._truncate_vectors(vectors_file, row, dim)
+            os.replace(vectors_file, os.path.join(path, "vectors.npy"))
+        elif os.path.exists(vectors_file):
+            os.remove(vectors_file)
+
+        cls._switch_current(root, version)
+        return path
+
+    @staticmethod
+    def _quantize_rows(vectors, rows, mode, chunk_rows=100000):
+        """memmap 벡터의 지정 행을 청크 단위로 압축해 (codes, scales)를 반환합니다."""
+        parts = [quantize(vectors[rows[i:i + chunk_rows]], mode) for i in range(0, len(rows), chunk_rows)]
+        if not parts:
+            return quantize(np.zeros((0, vectors.shape[1]), dtype=np.float32), mode)
+        codes = np.concatenate([codes for codes, _ in parts])
+        scales = None if parts[0][1] is None else np.concatenate([scales for _, scales in parts])
+        return codes, scales
+
+    @staticmethod
+    def _truncate_vectors(vectors_file, rows, dim):
+        """적재 도중 컬렉션이 줄어든 경우 임시 memmap을 실제 행 수로 다시 씁니다."""
+        source = np.load(vectors_file, mmap_mode="r")
+        tmp = vectors_file + ".trunc"
+        target = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(rows, dim))
+        for i in range(0, rows, 100000):
+            target[i:i + 100000] = source[i:i + 100000]
+        target.flush()
+        del source, target
+        os.replace(tmp, vectors_file)
+
+    @staticmethod
+    def _build_index(vectors, dim):
+        if vectors is None or not len(vectors):
+            return faiss.IndexFlatIP(dim or 1)
+        n = len(vectors)
+        if n < settings.RAG_FAISS_IVF_THRESHOLD:
+            index = faiss.IndexFlatIP(dim)
+        else:
+            # 클러스터 수는 4*sqrt(n), 단 클러스터당 학습 표본이 39개 이상이 되도록 제한
+            nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+            index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            # 학습은 표본으로만 수행 (클러스터당 최대 256개)
+            sample_size = min(n, nlist * 256)
+            sample = np.random.default_rng(0).choice(n, size=sample_size, replace=False)
+            index.train(np.ascontiguousarray(vectors[np.sort(sample)]))
+        for i in range(0, n, 100000):
+            index.add(np.ascontiguousarray(vectors[i:i + 100000]))
+        return index
+
+    @staticmethod
+    def _switch_current(root, version):
+        """CURRENT 포인터를 원자적으로 교체하고, 직전 버전을 제외한 오래된 스냅샷을 정리합니다."""
+        pointer = os.path.join(root, CURRENT_POINTER)
+        previous = None
+        if os.path.exists(pointer):
+            with open(pointer) as f:
+                previous = f.read().strip()
+        tmp = pointer + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(version)
+        os.replace(tmp, pointer)
+
+        for name in os.listdir(root):
+            full = os.path.join(root, name)
+            if name not in (version, previous) and os.path.isdir(full):
+                shutil.rmtree(full, ignore_errors=True)
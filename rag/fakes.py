@@ -0,0 +1,137 @@
+"""
+OpenAI 호출 없이 RAG 파이프라인을 돌리기 위한 로컬 대체 모델.
+
+벤치마크(manage.py rag_benchmark)와 로컬 개발에서 사용합니다. 설정으로 교체할 수 있습니다.
+    RAG_EMBEDDINGS_FACTORY = 'rag.fakes.hashing_embeddings'
+    RAG_LLM_FACTORY = 'rag.fakes.canned_chat_model'
+
+- HashingEmbeddings: 문자 n-gram 해싱 기반의 결정적 임베딩 (OpenAIEmbeddings와 같은 Embeddings 인터페이스).
+  같은 텍스트는 항상 같은 벡터이고, 표면형이 비슷한 텍스트는 코사인 유사도가 높습니다.
+- CannedChatModel: 정해진 지연 후 고정된 3가지 응답을 돌려주는 채팅 모델 (ChatOpenAI와 같은 BaseChatModel 인터페이스).
+  스트리밍 시에는 토큰 단위로 나누어 내보냅니다.
+"""
+import asyncio
+import hashlib
+import time
+import unicodedata
+from typing import Any, Iterator, List, Optional
+
+import numpy as np
+from django.conf import settings
+from langchain_core.callbacks import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DEFAULT_ANSWER = "많이 속상했구나, 내 마음도 알아줬으면 해 | 우리 잠깐 쉬었다가 다시 얘기해 볼까? | 네 말 듣고 있어, 천천히 얘기해 줘"
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    문자 1~3-gram을 해싱해 고정 차원 벡터로 만드는 결정적 임베딩.
+
+    dimensions를 주면 OpenAI text-embedding-3의 dimensions 파라미터처럼
+    size 차원 벡터의 앞부분만 남기고 다시 정규화합니다.
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.0, dimensions: Optional[int] = None):
+        self.size = size
+        self.latency = latency  # 배치 호출당 지연(초). 원격 API의 왕복 시간 흉내
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        text = unicodedata.normalize("NFC", text).lower()
+        for n in (1, 2, 3):
+            for i in range(len(text) - n + 1):
+                digest = hashlib.blake2b(text[i:i + n].encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.size
+                vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        if self.dimensions:
+            vector = vector[:self.dimensions]
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class CannedChatModel(BaseChatModel):
+    """latency 초 후 answer를 돌려주는 채팅 모델. 스트리밍은 전체 지연을 토큰 수로 나누어 냅니다."""
+
+    answer: str = DEFAULT_ANSWER
+    latency: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "canned-chat"
+
+    def _usage(self, messages):
+        from .tokens import count_tokens
+        prompt_tokens = sum(count_tokens(str(m.content)) for m in messages)
+        completion_tokens = count_tokens(self.answer)
+        return {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any
+    ) -> ChatResult:
+        time.sleep(self.latency)
+        message = AIMessage(content=self.answer, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        message = AIMessage(content=self.answer, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        pieces = self.answer.split(" ")
+        delay = self.latency / max(len(pieces), 1)
+        for i, piece in enumerate(pieces):
+            time.sleep(delay)
+            # 마지막 조각에 토큰 사용량을 싣는 것은 ChatOpenAI(stream_usage=True)와 같음
+            usage = self._usage(messages) if i == len(pieces) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=piece if i == 0 else " " + piece, usage_metadata=usage
+            ))
+
+
+def hashing_embeddings():
+    """RAG_EMBEDDINGS_FACTORY용 팩토리."""
+    return HashingEmbeddings(
+        size=settings.RAG_FAKE_EMBEDDING_SIZE,
+        latency=settings.RAG_FAKE_EMBEDDING_LATENCY,
+        dimensions=settings.RAG_EMBEDDING_DIMENSIONS
+    )
+
+
+def canned_chat_model():
+    """RAG_LLM_FACTORY용 팩토리."""
+    return CannedChatModel(latency=settings.RAG_FAKE_LLM_LATENCY)
@@ -0,0 +1,146 @@
+"""
+채팅방 단위 대화 히스토리 제공자.
+
+RAGQuery와 MessageTranslator가 프롬프트에 넣을 대화 맥락을 만듭니다.
+
+- 호출한 채팅방(ChatRoom)의 메시지만 사용합니다.
+- 최근 RAG_HISTORY_MAX_TURNS개 메시지, 그리고 RAG_HISTORY_MAX_TOKENS 토큰 이내로 제한합니다.
+- 작성자는 select_related로 한 번의 쿼리에 함께 가져옵니다 (N+1 제거).
+- 방별로 포맷된 창(window)을 메모리에 캐시하고, Message 저장 시그널로 증분 갱신합니다.
+  다른 워커에서 저장된 메시지는 RAG_HISTORY_CACHE_TTL 초 이내에 반영됩니다.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+from .tokens import count_tokens
+
+
+class _RoomWindow:
+    """한 채팅방의 최근 메시지 창. 각 줄의 토큰 수를 함께 보관합니다."""
+
+    def __init__(self, max_turns, expires_at):
+        self.lines = deque(maxlen=max_turns)
+        self.token_counts = deque(maxlen=max_turns)
+        self.last_message_id = None
+        self.expires_at = expires_at
+        self.rendered = None
+
+    def append(self, message_id, line):
+        self.lines.append(line)
+        self.token_counts.append(count_tokens(line))
+        self.last_message_id = message_id
+        self.rendered = None
+
+
+class ChatHistoryProvider:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_turns=None, max_tokens=None, ttl=None, max_rooms=None):
+        self.max_turns = max_turns or settings.RAG_HISTORY_MAX_TURNS
+        self.max_tokens = max_tokens or settings.RAG_HISTORY_MAX_TOKENS
+        self.ttl = ttl or settings.RAG_HISTORY_CACHE_TTL
+        self.max_rooms = max_rooms or settings.RAG_HISTORY_CACHE_MAX_ROOMS
+        self._lock = threading.Lock()
+        self._windows = OrderedDict()
+
+    @classmethod
+    def instance(cls):
+        """프로세스 전역 히스토리 제공자를 반환합니다."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def format_line(username, content):
+        return f"{username}: {content}"
+
+    def get_lines(self, chat_room):
+        """토큰 예산 안에 들어가는 최근 대화 줄 목록(오래된 순)을 반환합니다."""
+        if chat_room is None:
+            return []
+        window = self._get_window(self._room_id(chat_room))
+        with self._lock:
+            return self._fit_budget(window)
+
+    def get_history(self, chat_room) -> str:
+        """토큰 예산 안에 들어가는 최근 대화를 한 문자열로 반환합니다."""
+        if chat_room is None:
+            return ""
+        window = self._get_window(self._room_id(chat_room))
+        with self._lock:
+            if window.rendered is None:
+                window.rendered = "\n".join(self._fit_budget(window))
+            return window.rendered
+
+    def append(self, message):
+        """
+        새로 저장된 메시지를 캐시된 창에 반영합니다.
+
+        캐시되지 않은 방은 다음 조회 시 DB에서 읽으므로 아무 것도 하지 않습니다.
+        """
+        with self._lock:
+            window = self._windows.get(message.chat_room_id)
+            if window is None:
+                return
+            if window.last_message_id is not None and message.pk <= window.last_message_id:
+                return
+            window.append(message.pk, self.format_line(message.user.username, message.input_content))
+
+    def forget(self, room_id=None):
+        """방(또는 전체)의 캐시된 창을 버립니다."""
+        with self._lock:
+            if room_id is None:
+                self._windows.clear()
+            else:
+                self._windows.pop(room_id, None)
+
+    @staticmethod
+    def _room_id(chat_room):
+        return getattr(chat_room, 'pk', chat_room)
+
+    def _get_window(self, room_id):
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(room_id)
+            if window is not None and window.expires_at > now:
+                self._windows.move_to_end(room_id)
+                return window
+
+        window = self._load_window(room_id, now)
+        with self._lock:
+            self._windows[room_id] = window
+            self._windows.move_to_end(room_id)
+            while len(self._windows) > self.max_rooms:
+                self._windows.popitem(last=False)
+        return window
+
+    def _load_window(self, room_id, now):
+        from chat.models import Message
+
+        messages = list(
+            Message.objects.filter(chat_room_id=room_id)
+            .select_related('user')
+            .only('id', 'input_content', 'user__username')
+            .order_by('-created_at', '-id')[:self.max_turns]
+        )
+        window = _RoomWindow(self.max_turns, now + self.ttl)
+        for msg in reversed(messages):
+            window.append(msg.pk, self.format_line(msg.user.username, msg.input_content))
+        return window
+
+    def _fit_budget(self, window):
+        """최근 줄부터 거슬러 올라가며 토큰 예산을 넘지 않는 만큼만 남깁니다."""
+        total = 0
+        start = len(window.lines)
+        for tokens in reversed(window.token_counts):
+            if total + tokens > self.max_tokens:
+                break
+            total += tokens
+            start -= 1
+        return list(window.lines)[start:]
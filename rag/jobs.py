@@ -0,0 +1,396 @@
+"""
+백그라운드 적재 작업.
+
+setup API(/rag/setup/, /rag/json-setup/, /rag/bulk-json-setup/)는 IngestionJob 행을 등록하고 작업 ID만
+바로 돌려주며, 실제 파싱/임베딩/Chroma 쓰기는 별도 프로세스(manage.py rag_worker)가 RAGProcessor로 실행합니다.
+
+- 진행 상황: 적재 코드가 track_file/report_progress로 파일별 읽은 행 수, 새 문서 수, 오류를 기록하면
+  하트비트 스레드가 RAG_INGEST_JOB_HEARTBEAT_SECONDS마다 DB에 반영합니다 (GET /rag/jobs/<id>/).
+- 취소: cancel_requested를 켜 두면 하트비트 스레드가 읽어 오고, 다음 진행 보고 시점(청크 경계)에서
+  JobCancelled로 중단합니다. 이미 쓴 청크는 체크포인트가 남아 있습니다.
+- 재개: 실패/취소된 작업을 다시 대기열에 넣습니다. 끝난 파일은 건너뛰고(RAG_DB, 작업 진행 기록),
+  스트리밍 CSV는 체크포인트 다음 청크부터, 나머지는 내용 해시 ID로 이미 적재된 문서를 건너뜁니다.
+- 워커가 죽으면 하트비트가 끊기므로, RAG_INGEST_JOB_STALE_SECONDS가 지난 실행 중 작업은 다음 워커가
+  대기열로 되돌립니다.
+
+Chroma 로컬 DB는 쓰기 프로세스가 하나여야 하므로 워커는 한 번에 한 작업만 실행합니다.
+"""
+import contextvars
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Exists, F
+from django.utils import timezone
+
+from .models import IngestionJob
+
+logger = logging.getLogger(__name__)
+
+_current_job = contextvars.ContextVar("rag_ingest_job", default=None)
+
+
+class JobCancelled(Exception):
+    """취소 요청을 받은 작업을 중단할 때 발생합니다."""
+
+
+def current_job():
+    """현재 컨텍스트에서 실행 중인 작업의 JobProgress (작업 밖에서는 None)."""
+    return _current_job.get()
+
+
+def report_progress(path, rows=0, new_docs=0):
+    """실행 중인 작업이 있으면 path의 진행 상황을 더하고, 취소 요청이 있으면 JobCancelled를 발생시킵니다."""
+    job = current_job()
+    if job is not None:
+        job.advance(path, rows=rows, new_docs=new_docs)
+
+
+def report_file_started(path):
+    """실행 중인 작업이 있으면 path를 처리 중으로 기록합니다 (취소 요청이 있으면 JobCancelled)."""
+    job = current_job()
+    if job is not None:
+        job.file_started(path)
+
+
+def report_file_status(path, status, error=""):
+    """실행 중인 작업이 있으면 path의 상태(done, failed, skipped 등)를 기록합니다."""
+    job = current_job()
+    if job is not None:
+        job.file_status(path, status, error=error)
+
+
+@contextmanager
+def track_file(path):
+    """파일 하나의 처리 시작/완료/실패를 실행 중인 작업에 기록합니다."""
+    job = current_job()
+    if job is None:
+        yield None
+        return
+    job.file_started(path)
+    try:
+        yield job
+    except JobCancelled:
+        job.file_status(path, "cancelled")
+        raise
+    except Exception as e:
+        job.file_status(path, "failed", error=str(e))
+        raise
+    if job.files.get(path, {}).get("status") == "running":
+        job.file_status(path, "done")
+
+
+class JobProgress:
+    """
+    실행 중인 작업의 파일별 진행 상황.
+
+    적재 스레드(임베딩/쓰기 스레드 포함)는 메모리에만 기록하고, 하트비트 스레드가 주기적으로 DB에 쓰면서
+    취소 요청 여부를 읽어 옵니다.
+    """
+
+    def __init__(self, job):
+        self.job_id = job.pk
+        self.progress = json.loads(json.dumps(job.progress or {}))
+        self.files = self.progress.setdefault("files", {})
+        self.started = time.time()
+        self.cancelled = job.cancel_requested
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_files(self, paths):
+        """처리할 파일 목록을 등록합니다 (이전 실행에서 끝난 파일의 기록은 유지)."""
+        with self._lock:
+            for path in paths:
+                self.files.setdefault(path, {"status": "pending", "rows": 0, "new_docs": 0})
+
+    def is_done(self, path):
+        return self.files.get(path, {}).get("status") == "done"
+
+    def file_started(self, path):
+        self.check_cancelled()
+        with self._lock:
+            self.files[path] = {
+                "status": "running", "rows": 0, "new_docs": 0, "error": "",
+                "started_at": time.time(), "finished_at": None,
+            }
+
+    def advance(self, path, rows=0, new_docs=0):
+        with self._lock:
+            entry = self.files.setdefault(path, {"status": "running", "rows": 0, "new_docs": 0, "started_at": time.time()})
+            entry["rows"] += rows
+            entry["new_docs"] += new_docs
+            elapsed = max(time.time() - (entry.get("started_at") or self.started), 1e-6)
+            entry["rows_per_sec"] = round(entry["rows"] / elapsed, 1)
+            entry["docs_per_sec"] = round(entry["new_docs"] / elapsed, 1)
+        self.check_cancelled()
+
+    def file_status(self, path, status, error=""):
+        with self._lock:
+            entry = self.files.setdefault(path, {"rows": 0, "new_docs": 0})
+            entry.update(status=status, error=error, finished_at=time.time())
+
+    def failed_files(self):
+        with self._lock:
+            return [path for path, entry in self.files.items() if entry.get("status") == "failed"]
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(f"적재 작업 #{self.job_id} 취소 요청")
+
+    def snapshot(self):
+        with self._lock:
+            progress = json.loads(json.dumps(self.progress))
+        files = progress["files"].values()
+        elapsed = max(time.time() - self.started, 1e-6)
+        rows = sum(entry.get("rows", 0) for entry in files)
+        new_docs = sum(entry.get("new_docs", 0) for entry in files)
+        progress["totals"] = {
+            "files": len(progress["files"]),
+            "done": sum(1 for entry in files if entry.get("status") == "done"),
+            "failed": sum(1 for entry in files if entry.get("status") == "failed"),
+            "rows": rows,
+            "new_docs": new_docs,
+            "elapsed_sec": round(elapsed, 1),
+            # 이번 실행 기준 처리 속도
+            "rows_per_sec": round(rows / elapsed, 1),
+            "docs_per_sec": round(new_docs / elapsed, 1),
+        }
+        return progress
+
+    def flush(self):
+        """진행 상황과 하트비트를 DB에 쓰고 취소 요청 여부를 읽어 옵니다."""
+        IngestionJob.objects.filter(pk=self.job_id).update(progress=self.snapshot(), heartbeat_at=timezone.now())
+        if IngestionJob.objects.filter(pk=self.job_id, cancel_requested=True).exists():
+            self.cancelled = True
+
+    def start(self):
+        self._thread = threading.Thread(target=self._heartbeat, name=f"rag-job-{self.job_id}-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _heartbeat(self):
+        try:
+            while not self._stop.wait(settings.RAG_INGEST_JOB_HEARTBEAT_SECONDS):
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("적재 작업 #%s 진행 상황 저장 실패", self.job_id)
+        finally:
+            connection.close()
+
+
+class IngestionJobRunner:
+    @staticmethod
+    def enqueue(kind, params=None):
+        job = IngestionJob.objects.create(kind=kind, params=params or {})
+        logger.info("적재 작업 #%s 등록 (%s)", job.pk, kind)
+        return job
+
+    @staticmethod
+    def cancel(job):
+        """대기 중이면 바로 취소하고, 실행 중이면 워커가 다음 청크 경계에서 멈추도록 요청합니다."""
+        if IngestionJob.objects.filter(pk=job.pk, status=IngestionJob.STATUS_QUEUED).update(
+            status=IngestionJob.STATUS_CANCELLED, cancel_requested=True, finished_at=timezone.now()
+        ):
+            logger.info("적재 작업 #%s 취소 (대기 중)", job.pk)
+        elif IngestionJob.objects.filter(pk=job.pk, status=IngestionJob.STATUS_RUNNING).update(cancel_requested=True):
+            logger.info("적재 작업 #%s 취소 요청 (실행 중)", job.pk)
+        job.refresh_from_db()
+        return job
+
+    @staticmethod
+    def resume(job):
+        """실패/취소된 작업을 다시 대기열에 넣습니다."""
+        if job.status not in (IngestionJob.STATUS_FAILED, IngestionJob.STATUS_CANCELLED):
+            raise ValueError(f"{job.get_status_display()} 상태의 작업은 재개할 수 없습니다.")
+        IngestionJob.objects.filter(pk=job.pk, status=job.status).update(
+            status=IngestionJob.STATUS_QUEUED, cancel_requested=False, error='', finished_at=None
+        )
+        job.refresh_from_db()
+        return job
+
+    @staticmethod
+    def requeue_stale():
+        """하트비트가 끊긴(워커가 죽은) 실행 중 작업을 대기열로 되돌립니다."""
+        cutoff = timezone.now() - timedelta(seconds=settings.RAG_INGEST_JOB_STALE_SECONDS)
+        stale = IngestionJob.objects.filter(status=IngestionJob.STATUS_RUNNING, heartbeat_at__lt=cutoff)
+        cancelled = stale.filter(cancel_requested=True).update(
+            status=IngestionJob.STATUS_CANCELLED, finished_at=timezone.now()
+        )
+        requeued = stale.update(status=IngestionJob.STATUS_QUEUED, worker='')
+        if requeued or cancelled:
+            logger.warning("중단된 적재 작업 %d개 재등록, %d개 취소 처리", requeued, cancelled)
+        return requeued
+
+    @staticmethod
+    def claim(worker):
+        """
+        가장 오래된 대기 작업을 실행 중으로 바꾸고 반환합니다.
+        다른 작업이 실행 중이면(쓰기 프로세스는 하나) 가져오지 않습니다.
+
+        확인과 변경은 한 트랜잭션에서 하며, 대기/실행 중 행을 select_for_update로 잠그고
+        (SQLite는 행 잠금이 없으므로) 변경도 UPDATE ... WHERE NOT EXISTS(실행 중 작업) 한 문장으로 합니다.
+        """
+        with transaction.atomic():
+            active = list(
+                IngestionJob.objects.select_for_update()
+                .filter(status__in=[IngestionJob.STATUS_QUEUED, IngestionJob.STATUS_RUNNING])
+                .order_by('created_at', 'pk')
+                .values_list('pk', 'status')
+            )
+            if not active or any(status == IngestionJob.STATUS_RUNNING for _, status in active):
+                return None
+            pk = active[0][0]
+            now = timezone.now()
+            running = IngestionJob.objects.filter(status=IngestionJob.STATUS_RUNNING)
+            claimed = IngestionJob.objects.filter(pk=pk, status=IngestionJob.STATUS_QUEUED).filter(~Exists(running)).update(
+                status=IngestionJob.STATUS_RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+                attempts=F('attempts') + 1
+            )
+        if not claimed:
+            return None
+        return IngestionJob.objects.get(pk=pk)
+
+    @staticmethod
+    def default_worker_name():
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def run(job):
+        """작업 하나를 실행하고 최종 상태를 기록합니다."""
+        handler = JOB_HANDLERS[job.kind]
+        progress = JobProgress(job)
+        token = _current_job.set(progress)
+        progress.start()
+        status, error, result = IngestionJob.STATUS_SUCCEEDED, '', {}
+        logger.info("적재 작업 #%s 시작 (%s, %d회차)", job.pk, job.kind, job.attempts)
+        try:
+            result = handler(job.params, progress)
+            failed = progress.failed_files()
+            if failed:
+                status, error = IngestionJob.STATUS_FAILED, f"{len(failed)}개 파일 처리 실패: " + ", ".join(failed[:10])
+        except JobCancelled:
+            status = IngestionJob.STATUS_CANCELLED
+        except Exception:
+            status, error = IngestionJob.STATUS_FAILED, traceback.format_exc()
+        finally:
+            progress.stop()
+            _current_job.reset(token)
+
+        IngestionJob.objects.filter(pk=job.pk).update(
+            status=status, error=error, result=result, progress=progress.snapshot(),
+            heartbeat_at=timezone.now(), finished_at=timezone.now()
+        )
+        logger.info("적재 작업 #%s 종료: %s", job.pk, status)
+        job.refresh_from_db()
+        return job
+
+    @staticmethod
+    def work(worker=None, once=False, poll_interval=None):
+        """대기 작업을 순서대로 실행합니다. once이면 대기 작업이 없을 때 종료합니다."""
+        worker = worker or IngestionJobRunner.default_worker_name()
+        poll_interval = poll_interval or settings.RAG_INGEST_JOB_POLL_SECONDS
+        processed = 0
+        while True:
+            close_old_connections()
+            IngestionJobRunner.requeue_stale()
+            job = IngestionJobRunner.claim(worker)
+            if job is not None:
+                IngestionJobRunner.run(job)
+                processed += 1
+                continue
+            if once:
+                return processed
+            time.sleep(poll_interval)
+
+
+def _run_csv(params, progress):
+    from .method import RAGProcessor
+
+    csv_files = RAGProcessor.load_and_preprocess_csv(params["pattern"]) or []
+    new_files = RAGProcessor.filter_processed_files(csv_files)
+    progress.add_files(new_files)
+    if not new_files:
+        return {'message': '새로운 파일이 없습니다.', 'processed_files': 0, 'new_docs': 0}
+
+    vectorstore, existing_ids = RAGProcessor.initialize_chroma_db()
+    vectorstore, total_new_docs, processed_count = RAGProcessor.process_files(
+        new_files, existing_ids, vectorstore, RAGProcessor.DB_DIR
+    )
+    if processed_count:
+        RAGProcessor.refresh_query_indexes(vectorstore)
+    return {
+        'message': '새로운 데이터 처리 완료',
+        'processed_files': processed_count,
+        'new_docs': total_new_docs,
+        'total_docs': vectorstore._collection.count() if vectorstore else 0,
+    }
+
+
+def _run_json(params, progress):
+    from .method import RAGProcessor
+
+    path = "<request>"
+    vectorstore, existing_ids = RAGProcessor.initialize_chroma_db()
+    with track_file(path):
+        vectorstore, total_new_docs, processed_count = RAGProcessor.process_conversation_json(
+            params["conversation"], existing_ids, vectorstore
+        )
+        report_progress(path, rows=processed_count, new_docs=total_new_docs)
+    if total_new_docs:
+        RAGProcessor.refresh_query_indexes(vectorstore)
+    return {
+        'message': 'JSON 파일 처리 완료',
+        'processed_items': processed_count,
+        'new_docs': total_new_docs,
+        'total_docs': vectorstore._collection.count() if vectorstore else 0,
+    }
+
+
+def _run_bulk_json(params, progress):
+    from contextlib import nullcontext
+    from glob import glob
+    from .method import RAGProcessor
+    from .parallel_ingest import ParallelParser
+
+    json_files = sorted(glob(params["pattern"], recursive=True))
+    progress.add_files(json_files)
+    if not json_files:
+        return {'message': '처리할 JSON 파일이 없습니다.', 'processed_files': 0, 'new_docs': 0}
+
+    vectorstore, existing_ids = RAGProcessor.initialize_chroma_db()
+    pending = [file_path for file_path in json_files if not progress.is_done(file_path)]
+    # 병렬 파싱이면 파일 읽기/JSON 디코딩/텍스트 추출을 프로세스 풀에서 하고, 쓰기는 이 프로세스에서만 함
+    with (ParallelParser() if settings.RAG_INGEST_PARALLEL_PARSE else nullcontext()) as parser:
+        vectorstore, total_new_docs, processed_count = RAGProcessor.process_conversation_files(
+            pending, existing_ids, vectorstore, parser=parser
+        )
+
+    if total_new_docs:
+        RAGProcessor.refresh_query_indexes(vectorstore)
+    return {
+        'message': '모든 JSON 파일 처리 완료',
+        'processed_files': processed_count,
+        'new_docs': total_new_docs,
+        'total_docs': vectorstore._collection.count() if vectorstore else 0,
+    }
+
+
+JOB_HANDLERS = {
+    IngestionJob.KIND_CSV: _run_csv,
+    IngestionJob.KIND_JSON: _run_json,
+    IngestionJob.KIND_BULK_JSON: _run_bulk_json,
+}
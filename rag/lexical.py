@@ -0,0 +1,336 @@
+"""
+적재된 대화 문서에 대한 BM25 역색인.
+
+짧은 한국어 발화는 임베딩보다 표면형이 정확히 일치하는 쪽이 더 잘 맞는 경우가 많고,
+원격 임베딩 호출 없이도 동작하므로 임베딩 서비스가 느릴 때의 대체 경로로도 사용합니다.
+
+토크나이저는 형태소 분석기 없이 어절 단위 토큰과 어절 내 문자 2-gram을 함께 사용합니다.
+    "감정적이야" -> ["감정적이야", "감정", "정적", "적이", "이야"]
+
+색인은 RAG_LEXICAL_INDEX_PATH 디렉터리에 세그먼트 단위로 저장됩니다.
+
+    lexical_index/
+        manifest.json             세그먼트 목록 (세그먼트를 다 쓴 뒤 원자적으로 갱신)
+        seg-<번호>/
+            meta.json             문서 수, 길이 합, emotion 값 목록
+            terms.json            색인어 (정렬됨)
+            term_offsets.npy      색인어별 게시 목록 구간 (CSR indptr)
+            rows.npy, tfs.npy     게시 목록 (세그먼트 내 행 번호, 단어 빈도)
+            doc_lengths.npy, emotions.npy
+            docs.jsonl, doc_offsets.npy   본문/메타데이터 (검색 결과 상위 k개만 읽음)
+
+- 적재 중에는 LexicalIndexWriter가 RAG_LEXICAL_SEGMENT_DOCS개 문서까지만 메모리에 모았다가
+  세그먼트로 내려쓰므로 적재량과 관계없이 메모리 사용량이 일정합니다.
+- 질의 시에는 배열을 메모리 매핑으로 열고, 평균 문서 길이는 로드 시 한 번만 계산합니다.
+- 문서 비율이 RAG_LEXICAL_MAX_DF_RATIO를 넘는 흔한 색인어(조사/어미 2-gram 등)는 점수 기여가 작고
+  게시 목록만 길므로 질의에서 제외합니다.
+"""
+import heapq
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from langchain_core.documents import Document
+
+WORD_PATTERN = re.compile(r"\w+")
+MANIFEST = "manifest.json"
+
+
+def tokenize(text: str):
+    """어절 토큰과 어절 내 문자 2-gram을 반환합니다."""
+    tokens = []
+    for word in WORD_PATTERN.findall(unicodedata.normalize("NFC", text).lower()):
+        tokens.append(word)
+        if len(word) > 2:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def _write_json(path, value):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"segments": []}
+
+
+class LexicalSegment:
+    """메모리 매핑으로 연 세그먼트 하나."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.count = meta["count"]
+        self.total_length = meta["total_length"]
+        self.emotions = {value: code for code, value in enumerate(meta["emotions"])}
+        with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+            self.terms = {term: i for i, term in enumerate(json.load(f))}
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.term_offsets = load("term_offsets.npy")
+        self.rows = load("rows.npy")
+        self.tfs = load("tfs.npy")
+        self.doc_lengths = load("doc_lengths.npy")
+        self.emotion_codes = load("emotions.npy")
+        self.doc_offsets = load("doc_offsets.npy")
+        self._docs = os.open(os.path.join(path, "docs.jsonl"), os.O_RDONLY)
+
+    def __del__(self):
+        fd = getattr(self, "_docs", None)
+        if fd is not None:
+            os.close(fd)
+
+    def postings(self, term):
+        """term의 (행 번호, 단어 빈도) 배열. 없으면 None."""
+        i = self.terms.get(term)
+        if i is None:
+            return None
+        start, end = self.term_offsets[i], self.term_offsets[i + 1]
+        return self.rows[start:end], self.tfs[start:end]
+
+    def df(self, term):
+        i = self.terms.get(term)
+        return 0 if i is None else int(self.term_offsets[i + 1] - self.term_offsets[i])
+
+    def top(self, term_idfs, k, avg_length, k1, b, emotions=None):
+        """세그먼트 안에서 BM25 점수 상위 k개 (score, row)를 반환합니다."""
+        rows_parts, score_parts = [], []
+        for term, idf in term_idfs:
+            posting = self.postings(term)
+            if posting is None:
+                continue
+            rows, tfs = posting
+            tfs = tfs.astype(np.float32)
+            norm = k1 * (1 - b + b * self.doc_lengths[rows] / avg_length)
+            rows_parts.append(rows)
+            score_parts.append(idf * tfs * (k1 + 1) / (tfs + norm))
+        if not rows_parts:
+            return []
+        scores = np.bincount(np.concatenate(rows_parts), weights=np.concatenate(score_parts), minlength=self.count)
+        candidates = np.flatnonzero(scores)
+        if emotions:
+            codes = [self.emotions[e] for e in emotions if e in self.emotions]
+            candidates = candidates[np.isin(self.emotion_codes[candidates], codes)]
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        return [(float(scores[row]), int(row)) for row in candidates]
+
+    def document(self, row):
+        start, end = int(self.doc_offsets[row]), int(self.doc_offsets[row + 1])
+        record = json.loads(os.pread(self._docs, end - start, start))
+        metadata = dict(record["metadata"] or {})
+        metadata.setdefault("doc_id", record["id"])
+        return Document(page_content=record["text"], metadata=metadata)
+
+
+class LexicalIndex:
+    """디스크의 세그먼트들을 합쳐 BM25로 검색하는 읽기 전용 색인."""
+    _writer = None
+    _writer_lock = threading.Lock()
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, segments=()):
+        self.segments = list(segments)
+        self.count = sum(segment.count for segment in self.segments)
+        # 평균 문서 길이는 로드 시 한 번만 계산
+        self.avg_length = sum(segment.total_length for segment in self.segments) / self.count if self.count else 0.0
+
+    @property
+    def term_count(self):
+        """세그먼트별 색인어 수의 합 (세그먼트 사이 중복 포함)."""
+        return sum(len(segment.terms) for segment in self.segments)
+
+    @staticmethod
+    def default_path():
+        return str(settings.RAG_LEXICAL_INDEX_PATH)
+
+    @classmethod
+    def exists(cls, path=None):
+        return bool(_read_manifest(path or cls.default_path())["segments"])
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or cls.default_path()
+        return cls([LexicalSegment(os.path.join(path, name)) for name in _read_manifest(path)["segments"]])
+
+    @classmethod
+    def writer(cls):
+        """적재 경로에서 공유하는 프로세스 전역 LexicalIndexWriter."""
+        if cls._writer is None:
+            with cls._writer_lock:
+                if cls._writer is None:
+                    cls._writer = LexicalIndexWriter()
+        return cls._writer
+
+    @classmethod
+    def flush_writer(cls):
+        """적재 중 모아 둔 문서가 있으면 세그먼트로 저장합니다."""
+        writer = cls._writer
+        if writer is not None:
+            writer.flush()
+
+    def search(self, query, k, emotions=None):
+        """BM25 점수 상위 k개 (Document, score)를 반환합니다."""
+        n = self.count
+        if not n:
+            return []
+        stats = []
+        for term in set(tokenize(query)):
+            df = sum(segment.df(term) for segment in self.segments)
+            if df:
+                stats.append((df, term))
+        if not stats:
+            return []
+        # 흔한 색인어는 제외하되, 모두 흔하면 가장 드문 것 하나는 남김
+        max_df = max(1, int(n * settings.RAG_LEXICAL_MAX_DF_RATIO))
+        stats.sort()
+        kept = [(df, term) for df, term in stats if df <= max_df] or stats[:1]
+        term_idfs = [(term, math.log(1 + (n - df + 0.5) / (df + 0.5))) for df, term in kept]
+
+        hits = []
+        for i, segment in enumerate(self.segments):
+            hits.extend(
+                (score, i, row)
+                for score, row in segment.top(term_idfs, k, self.avg_length, self.K1, self.B, emotions)
+            )
+        top = heapq.nlargest(k, hits)
+        return [(self.segments[i].document(row), score) for score, i, row in top]
+
+
+class LexicalIndexWriter:
+    """
+    문서를 segment_docs개까지 메모리에 모았다가 세그먼트로 내려씁니다.
+
+    중복 제거는 하지 않으므로 이미 적재된 문서를 걸러 낸 뒤(RAGProcessor.filter_new_documents) 추가해야 합니다.
+    """
+
+    def __init__(self, path=None, segment_docs=None):
+        self.path = str(path or LexicalIndex.default_path())
+        self.segment_docs = segment_docs or settings.RAG_LEXICAL_SEGMENT_DOCS
+        self.added = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        self.doc_lengths = array("I")
+        self.postings = {}  # term -> (array('I') rows, array('H') term frequencies)
+
+    @property
+    def dirty(self):
+        return bool(self.ids)
+
+    def add_documents(self, ids, texts, metadatas):
+        with self._lock:
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                row = len(self.ids)
+                self.ids.append(doc_id)
+                self.texts.append(text)
+                self.metadatas.append(metadata or {})
+                terms = Counter(tokenize(text))
+                self.doc_lengths.append(sum(terms.values()))
+                for term, tf in terms.items():
+                    posting = self.postings.get(term)
+                    if posting is None:
+                        posting = self.postings[term] = (array("I"), array("H"))
+                    posting[0].append(row)
+                    posting[1].append(min(tf, 65535))
+                if len(self.ids) >= self.segment_docs:
+                    self._write_segment()
+            self.added += len(ids)
+        return len(ids)
+
+    def flush(self):
+        with self._lock:
+            if self.ids:
+                self._write_segment()
+
+    def _write_segment(self):
+        """모아 둔 문서를 새 세그먼트로 쓰고 manifest에 추가합니다 (잠금 안에서 호출)."""
+        manifest = _read_manifest(self.path)
+        name = f"seg-{len(manifest['segments']):05d}-{os.getpid()}"
+        final = os.path.join(self.path, name)
+        tmp = f"{final}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        terms = sorted(self.postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(self.postings[term][0]) for term in terms], out=offsets[1:])
+        rows = np.empty(offsets[-1], dtype=np.uint32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(terms):
+            term_rows, term_tfs = self.postings[term]
+            rows[offsets[i]:offsets[i + 1]] = term_rows
+            tfs[offsets[i]:offsets[i + 1]] = term_tfs
+
+        emotion_values = sorted({str(m["emotion"]) for m in self.metadatas if m.get("emotion") is not None})
+        emotion_codes = {value: code for code, value in enumerate(emotion_values)}
+        emotions = np.array(
+            [emotion_codes.get(str(m.get("emotion")), -1) for m in self.metadatas], dtype=np.int32
+        )
+
+        doc_offsets = np.zeros(len(self.ids) + 1, dtype=np.int64)
+        with open(os.path.join(tmp, "docs.jsonl"), "wb") as f:
+            for i, (doc_id, text, metadata) in enumerate(zip(self.ids, self.texts, self.metadatas)):
+                line = json.dumps({"id": doc_id, "text": text, "metadata": metadata}, ensure_ascii=False)
+                f.write(line.encode("utf-8") + b"\n")
+                doc_offsets[i + 1] = f.tell()
+
+        np.save(os.path.join(tmp, "term_offsets.npy"), offsets)
+        np.save(os.path.join(tmp, "rows.npy"), rows)
+        np.save(os.path.join(tmp, "tfs.npy"), tfs)
+        np.save(os.path.join(tmp, "doc_lengths.npy"), np.frombuffer(self.doc_lengths, dtype=np.uint32))
+        np.save(os.path.join(tmp, "emotions.npy"), emotions)
+        np.save(os.path.join(tmp, "doc_offsets.npy"), doc_offsets)
+        _write_json(os.path.join(tmp, "terms.json"), terms)
+        _write_json(os.path.join(tmp, "meta.json"), {
+            "count": len(self.ids),
+            "total_length": int(sum(self.doc_lengths)),
+            "emotions": emotion_values,
+        })
+        os.replace(tmp, final)
+
+        manifest["segments"].append(name)
+        _write_json(os.path.join(self.path, MANIFEST), manifest)
+        self._reset()
+
+
+def reciprocal_rank_fusion(hit_lists, k, rrf_k=60):
+    """
+    여러 검색 결과를 Reciprocal Rank Fusion으로 합칩니다.
+
+    각 결과에서의 순위 r에 대해 1 / (rrf_k + r)을 더한 점수로 정렬하며,
+    문서는 metadata의 doc_id(없으면 본문)로 동일성을 판단합니다.
+    """
+    scores = {}
+    documents = {}
+    for hits in hit_lists:
+        for rank, (doc, _) in enumerate(hits, start=1):
+            key = doc.metadata.get("doc_id") or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+    return [(documents[key], score) for key, score in top]
@@ -0,0 +1,107 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from chat.models import Message
+from chat.services import MessageTranslator
+from rag.method import RAGQuery
+from rag.models import WarmPhrase
+from rag.warm_phrases import WarmPhraseLibrary, normalize_phrase, phrase_key
+
+
+class Command(BaseCommand):
+    help = (
+        "다정모드 채팅방에서 자주 들어온 메시지(Message.input_content)를 찾아 3가지 다정한 표현을 미리 생성하고 "
+        "WarmPhrase 테이블에 버전 태그와 함께 저장합니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=500, help='생성할 최대 문장 수')
+        parser.add_argument('--min-count', type=int, default=3, help='이 횟수 이상 등장한 문장만 사용')
+        parser.add_argument('--days', type=int, default=None, help='최근 N일 메시지만 집계 (기본: 전체)')
+        parser.add_argument('--tag', dest='tag', default=None, help='버전 태그 (기본: 현재 시각 YYYYmmddHHMM)')
+        parser.add_argument('--batch-size', type=int, default=50, help='한 번에 생성할 문장 수')
+        parser.add_argument('--max-concurrency', type=int, default=8, help='동시 LLM 호출 수')
+        parser.add_argument('--dry-run', action='store_true', help='집계 결과만 출력하고 생성/저장하지 않음')
+
+    def handle(self, *args, **options):
+        version = options['tag'] or timezone.now().strftime('%Y%m%d%H%M')
+        phrases = self._mine(options)
+        if not phrases:
+            self.stdout.write("조건에 맞는 문장이 없습니다.")
+            return
+
+        self.stdout.write(f"상위 {len(phrases)}개 문장 (버전 {version})")
+        for text, frequency in phrases[:10]:
+            self.stdout.write(f"  {frequency:>6}  {text}")
+        if options['dry_run']:
+            return
+
+        started = time.perf_counter()
+        saved = failed = 0
+        for start in range(0, len(phrases), options['batch_size']):
+            batch = phrases[start:start + options['batch_size']]
+            results = async_to_sync(RAGQuery.abatch_answer)(
+                [text for text, _ in batch], max_concurrency=options['max_concurrency']
+            )
+            rows = []
+            for (text, frequency), result in zip(batch, results):
+                answer_options = MessageTranslator.parse_options(result['answer']) if 'answer' in result else []
+                if len(answer_options) != 3:
+                    failed += 1
+                    continue
+                rows.append(WarmPhrase(
+                    phrase_key=phrase_key(text),
+                    text=text,
+                    normalized_text=normalize_phrase(text),
+                    options=answer_options,
+                    frequency=frequency,
+                    version=version
+                ))
+            WarmPhrase.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['version', 'phrase_key'],
+                update_fields=['text', 'normalized_text', 'options', 'frequency']
+            )
+            saved += len(rows)
+            self.stdout.write(f"  {min(start + len(batch), len(phrases))}/{len(phrases)} 처리")
+
+        WarmPhraseLibrary.instance().invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f"저장 완료: {saved}개 (실패 {failed}개, 버전 {version}, {time.perf_counter() - started:.1f}초)"
+        ))
+
+    @staticmethod
+    def _mine(options):
+        """정규화된 문장 단위로 등장 횟수를 합산해 (대표 원문, 횟수)를 빈도순으로 반환합니다."""
+        messages = Message.objects.filter(Q(chat_room__warm_mode=True) | Q(warm_mode=True))
+        if options['days']:
+            messages = messages.filter(created_at__gte=timezone.now() - timedelta(days=options['days']))
+        # DB에서 원문 단위로 먼저 집계 (정규화 후 합쳐질 수 있으므로 넉넉히 가져옴)
+        rows = (
+            messages.values('input_content')
+            .annotate(n=Count('id'))
+            .order_by('-n')[:options['top'] * 5]
+        )
+
+        counts = Counter()
+        representative = {}
+        for row in rows:
+            normalized = normalize_phrase(row['input_content'])
+            if not normalized:
+                continue
+            counts[normalized] += row['n']
+            # 가장 많이 쓰인 원문을 대표 문장으로
+            representative.setdefault(normalized, row['input_content'].strip())
+
+        return [
+            (representative[normalized], frequency)
+            for normalized, frequency in counts.most_common(options['top'])
+            if frequency >= options['min_count']
+        ]
@@ -0,0 +1,109 @@
+import json
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rag.faiss_index import _normalize, iter_collection
+from rag.method import RAGProcessor
+from rag.quantization import QuantizedIndex, bytes_per_vector, quantize
+
+
+class Command(BaseCommand):
+    help = (
+        "Chroma 컬렉션(korean_dialogue)의 벡터로 양자화 방식별 recall@k와 메모리 사용량을 비교합니다. "
+        "float32 전체 검색 결과를 정답으로 삼아 float16/int8 압축 검색(재채점 배수별)의 재현율을 측정합니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100000, help='평가에 사용할 최대 문서 수')
+        parser.add_argument('--queries', type=int, default=200, help='질의 수 (문서 벡터에 잡음을 섞어 생성)')
+        parser.add_argument('--k', type=int, default=None, help='recall@k의 k (기본: RAG_RETRIEVER_K)')
+        parser.add_argument('--noise', type=float, default=0.3, help='질의 벡터에 섞을 가우시안 잡음 크기')
+        parser.add_argument('--rescore-factors', default='1,2,4,8', help='쉼표로 구분한 재채점 후보 배수 (1이면 재채점 없음)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Chroma에서 한 번에 읽을 문서 수')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='결과를 JSON 한 줄씩 출력')
+
+    def handle(self, *args, **options):
+        vectorstore, _ = RAGProcessor.initialize_chroma_db()
+        if vectorstore is None:
+            self.stderr.write("Chroma DB가 없습니다. 먼저 /api/rag/setup/으로 데이터를 적재하세요.")
+            return
+
+        vectors = self._load_vectors(vectorstore._collection, options['limit'], options['batch_size'])
+        if not len(vectors):
+            self.stderr.write("컬렉션에 벡터가 없습니다.")
+            return
+        k = min(options['k'] or settings.RAG_RETRIEVER_K, len(vectors))
+        factors = [int(f) for f in options['rescore_factors'].split(',') if f.strip()]
+        queries = self._make_queries(vectors, options['queries'], options['noise'], options['seed'])
+
+        exact = QuantizedIndex.exact_over(vectors)
+        started = time.perf_counter()
+        _, truth = exact.search(queries, k)
+        results = [self._result('none', 1, vectors.shape, k, truth, truth, time.perf_counter() - started, len(queries))]
+
+        for mode in ('float16', 'int8'):
+            codes, scales = quantize(vectors, mode)
+            for factor in factors:
+                index = QuantizedIndex(codes, scales, vectors, rescore_factor=factor)
+                started = time.perf_counter()
+                _, rows = index.search(queries, k)
+                results.append(self._result(mode, factor, vectors.shape, k, truth, rows, time.perf_counter() - started, len(queries)))
+
+        if options['json']:
+            for result in results:
+                self.stdout.write(json.dumps(result, ensure_ascii=False))
+            return
+        self._print_table(results, vectors.shape, k)
+
+    @staticmethod
+    def _load_vectors(collection, limit, batch_size):
+        parts, total = [], 0
+        for _, embeddings, _, _ in iter_collection(collection, min(batch_size, limit)):
+            embeddings = _normalize(embeddings)[:limit - total]
+            parts.append(embeddings)
+            total += len(embeddings)
+            if total >= limit:
+                break
+        return np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def _make_queries(vectors, count, noise, seed):
+        """무작위 문서 벡터에 잡음을 섞어 '비슷하지만 같지 않은' 질의를 만듭니다."""
+        rng = np.random.default_rng(seed)
+        picked = vectors[rng.choice(len(vectors), size=count, replace=count > len(vectors))]
+        scale = noise / np.sqrt(vectors.shape[1])
+        return _normalize(picked + rng.normal(0.0, scale, size=picked.shape).astype(np.float32))
+
+    @staticmethod
+    def _result(mode, factor, shape, k, truth, rows, seconds, n_queries):
+        n, dim = shape
+        hits = sum(len(set(t[t >= 0]) & set(r[r >= 0])) for t, r in zip(truth, rows))
+        resident = bytes_per_vector(dim, mode) * n
+        return {
+            'quantization': mode,
+            'rescore_factor': factor,
+            'documents': n,
+            'dim': dim,
+            'recall_at_k': round(hits / (len(truth) * k), 4),
+            # 압축 방식은 재채점용 float32 원본을 디스크(메모리 매핑)에 두고 후보 행만 읽음
+            'resident_mb': round(resident / 2 ** 20, 2),
+            'disk_mb': round((resident + (4 * dim * n if mode != 'none' else 0)) / 2 ** 20, 2),
+            'memory_ratio': round(resident / (4 * dim * n), 3),
+            'query_ms': round(seconds / n_queries * 1000, 3),
+        }
+
+    def _print_table(self, results, shape, k):
+        self.stdout.write(f"문서 {shape[0]}개, {shape[1]}차원, recall@{k}")
+        header = f"{'mode':>8} {'rescore':>8} {'recall':>8} {'resident MB':>12} {'ratio':>6} {'disk MB':>9} {'ms/query':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for r in results:
+            rescore = '-' if r['quantization'] == 'none' or r['rescore_factor'] <= 1 else f"x{r['rescore_factor']}"
+            self.stdout.write(
+                f"{r['quantization']:>8} {rescore:>8} {r['recall_at_k']:>8.4f} {r['resident_mb']:>12.2f} "
+                f"{r['memory_ratio']:>6.3f} {r['disk_mb']:>9.2f} {r['query_ms']:>9.3f}"
+            )
@@ -0,0 +1,211 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from rag.engine import RAGEngine
+from rag.lexical import LexicalIndex
+from rag.method import RAGProcessor, RAGQuery
+from rag.quantization import MODES
+
+FILE_ROWS = 50000  # 합성 CSV 파일당 행 수
+EMOTIONS = ["기쁨", "슬픔", "분노", "불안", "당황", "상처"]
+SUBJECTS = ["너", "나", "우리", "오늘", "어제", "요즘", "주말에", "아까", "그때", "지금"]
+OBJECTS = ["연락", "약속", "말투", "저녁", "선물", "데이트", "친구", "회사", "집안일", "여행"]
+PREDICATES = ["왜 그래", "진짜 싫어", "너무 서운해", "좀 해줘", "또 늦었네", "신경 써", "그만하자", "고마워", "보고 싶어", "기분 나빠"]
+
+
+def synthetic_sentence(rng):
+    return " ".join([
+        rng.choice(SUBJECTS), rng.choice(OBJECTS), rng.choice(PREDICATES), f"#{rng.randrange(1000000)}"
+    ])
+
+
+def percentile_ms(values, q):
+    return float(np.percentile(values, q) * 1000) if values else 0.0
+
+
+def max_rss_mb():
+    # Linux: KB 단위, 프로세스 시작 이후 최댓값
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "OpenAI 호출 없이 로컬 대체 모델(rag.fakes)로 적재 처리량과 질의 지연을 측정합니다. "
+        "코퍼스 크기별로 적재 docs/sec, 질의/검색 p50/p95/p99, 메모리 최대 사용량(RSS)을 출력합니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000', help='쉼표로 구분한 코퍼스 크기 목록')
+        parser.add_argument('--queries', type=int, default=200, help='크기별 질의 수')
+        parser.add_argument('--llm-latency', type=float, default=0.05, help='가짜 LLM 응답 지연(초)')
+        parser.add_argument('--embedding-latency', type=float, default=0.0, help='가짜 임베딩 배치 호출당 지연(초)')
+        parser.add_argument('--embedding-size', type=int, default=256, help='가짜 임베딩 차원')
+        parser.add_argument('--backend', choices=['chroma', 'faiss'], default='chroma', help='질의용 벡터 검색 백엔드')
+        parser.add_argument('--retrieval-mode', choices=['vector', 'lexical', 'hybrid'], default='hybrid')
+        parser.add_argument('--quantization', choices=MODES, default='none', help='FAISS 스냅샷 압축 방식 (--backend faiss)')
+        parser.add_argument('--workdir', default=None, help='작업 디렉터리 (기본: 임시 디렉터리, 끝나면 삭제)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='결과를 JSON 한 줄씩 출력')
+        parser.add_argument('--verbose', action='store_true', help='적재/질의 중 출력 표시')
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        if len(sizes) > 1:
+            # 메모리 최대 사용량(RSS)은 프로세스 단위이므로 크기마다 별도 프로세스로 측정
+            results = [self._run_subprocess(size, options) for size in sizes]
+        else:
+            results = [self._run_size(sizes[0], options)]
+
+        if options['json']:
+            for result in results:
+                self.stdout.write(json.dumps(result, ensure_ascii=False))
+            return
+        self._print_table(results)
+
+    def _run_subprocess(self, size, options):
+        argv = [
+            sys.executable, sys.argv[0], 'rag_benchmark', '--json',
+            '--sizes', str(size),
+            '--queries', str(options['queries']),
+            '--llm-latency', str(options['llm_latency']),
+            '--embedding-latency', str(options['embedding_latency']),
+            '--embedding-size', str(options['embedding_size']),
+            '--backend', options['backend'],
+            '--retrieval-mode', options['retrieval_mode'],
+            '--quantization', options['quantization'],
+            '--seed', str(options['seed']),
+        ]
+        if options['workdir']:
+            argv += ['--workdir', options['workdir']]
+        if options['verbose']:
+            argv.append('--verbose')
+        output = subprocess.run(argv, check=True, stdout=subprocess.PIPE, text=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def _run_size(self, size, options):
+        rng = random.Random(options['seed'])
+        root = options['workdir'] or tempfile.mkdtemp(prefix='rag_benchmark_')
+        workdir = os.path.join(root, str(size))
+        db_dir = os.path.join(workdir, 'chroma_db')
+        os.makedirs(workdir, exist_ok=True)
+
+        csv_files, samples = self._write_corpus(workdir, size, rng)
+        fake_settings = override_settings(
+            RAG_EMBEDDINGS_FACTORY='rag.fakes.hashing_embeddings',
+            RAG_LLM_FACTORY='rag.fakes.canned_chat_model',
+            RAG_FAKE_EMBEDDING_SIZE=options['embedding_size'],
+            RAG_FAKE_EMBEDDING_LATENCY=options['embedding_latency'],
+            RAG_FAKE_LLM_LATENCY=options['llm_latency'],
+            RAG_EMBEDDING_CACHE_ENABLED=False,
+            RAG_SEMANTIC_CACHE_ENABLED=False,
+            RAG_RETRIEVER_BACKEND=options['backend'],
+            RAG_RETRIEVAL_MODE=options['retrieval_mode'],
+            RAG_LEXICAL_INDEX=options['retrieval_mode'] != 'vector',
+            RAG_VECTOR_QUANTIZATION=options['quantization'],
+            RAG_FAISS_DIR=os.path.join(workdir, 'faiss'),
+            RAG_LEXICAL_INDEX_PATH=os.path.join(workdir, 'lexical_index'),
+        )
+        saved = (RAGProcessor.DB_DIR, RAGProcessor.TEMP_DIR, RAGEngine._instance, LexicalIndex._writer)
+        quiet = contextlib.nullcontext() if options['verbose'] else contextlib.redirect_stdout(io.StringIO())
+        try:
+            with fake_settings, quiet, transaction.atomic():
+                RAGProcessor.DB_DIR = db_dir
+                RAGProcessor.TEMP_DIR = os.path.join(workdir, 'temp_embeddings')
+                RAGEngine._instance = RAGEngine(db_dir)
+                LexicalIndex._writer = None
+
+                # 적재
+                started = time.perf_counter()
+                vectorstore, total_docs, _ = RAGProcessor.process_files(csv_files, set(), None, db_dir)
+                RAGProcessor.refresh_query_indexes(vectorstore)
+                ingest_seconds = time.perf_counter() - started
+                ingest_rss = max_rss_mb()
+
+                # 엔진 로드
+                started = time.perf_counter()
+                state = RAGEngine.instance().get()
+                load_seconds = time.perf_counter() - started
+
+                # 질의
+                queries = [rng.choice(samples) for _ in range(options['queries'])]
+                retrieval, answers = [], []
+                for question in queries:
+                    started = time.perf_counter()
+                    state.retriever.invoke(question)
+                    retrieval.append(time.perf_counter() - started)
+                for question in queries:
+                    started = time.perf_counter()
+                    RAGQuery.get_answer(question)
+                    answers.append(time.perf_counter() - started)
+
+                # RAG_DB 적재 기록은 남기지 않음
+                transaction.set_rollback(True)
+        finally:
+            RAGProcessor.DB_DIR, RAGProcessor.TEMP_DIR, RAGEngine._instance, LexicalIndex._writer = saved
+            if not options['workdir']:
+                shutil.rmtree(root, ignore_errors=True)
+
+        return {
+            'size': size,
+            'documents': total_docs,
+            'ingest_seconds': round(ingest_seconds, 2),
+            'ingest_docs_per_sec': round(total_docs / ingest_seconds, 1) if ingest_seconds else 0.0,
+            'engine_load_seconds': round(load_seconds, 3),
+            'retrieval_p50_ms': round(percentile_ms(retrieval, 50), 2),
+            'retrieval_p95_ms': round(percentile_ms(retrieval, 95), 2),
+            'retrieval_p99_ms': round(percentile_ms(retrieval, 99), 2),
+            'query_p50_ms': round(percentile_ms(answers, 50), 2),
+            'query_p95_ms': round(percentile_ms(answers, 95), 2),
+            'query_p99_ms': round(percentile_ms(answers, 99), 2),
+            'ingest_max_rss_mb': round(ingest_rss, 1),
+            'max_rss_mb': round(max_rss_mb(), 1),
+        }
+
+    @staticmethod
+    def _write_corpus(workdir, size, rng):
+        """size개 행의 합성 대화 CSV(text, emotion)를 FILE_ROWS 단위 파일로 씁니다."""
+        csv_dir = os.path.join(workdir, 'csv')
+        os.makedirs(csv_dir, exist_ok=True)
+        files, samples = [], []
+        for start in range(0, size, FILE_ROWS):
+            path = os.path.join(csv_dir, f'corpus_{start // FILE_ROWS:04d}.csv')
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['text', 'emotion'])
+                for _ in range(min(FILE_ROWS, size - start)):
+                    sentence = synthetic_sentence(rng)
+                    writer.writerow([sentence, rng.choice(EMOTIONS)])
+                    if len(samples) < 1000:
+                        samples.append(sentence)
+            files.append(path)
+        return files, samples
+
+    def _print_table(self, results):
+        header = (
+            f"{'rows':>9} {'docs/s':>9} {'load s':>7} "
+            f"{'search p50/p95/p99 ms':>24} {'query p50/p95/p99 ms':>24} {'RSS MB':>8}"
+        )
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for r in results:
+            search = f"{r['retrieval_p50_ms']:.1f}/{r['retrieval_p95_ms']:.1f}/{r['retrieval_p99_ms']:.1f}"
+            query = f"{r['query_p50_ms']:.1f}/{r['query_p95_ms']:.1f}/{r['query_p99_ms']:.1f}"
+            self.stdout.write(
+                f"{r['size']:>9} {r['ingest_docs_per_sec']:>9.1f} {r['engine_load_seconds']:>7.2f} "
+                f"{search:>24} {query:>24} {r['max_rss_mb']:>8.1f}"
+            )
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rag.jobs import IngestionJobRunner
+from rag.models import IngestionJob
+
+
+class Command(BaseCommand):
+    help = (
+        "setup API가 등록한 적재 작업(IngestionJob)을 순서대로 실행하는 워커입니다. "
+        "Chroma 로컬 DB는 쓰기 프로세스가 하나여야 하므로 워커도 하나만 실행하세요. "
+        "--cancel/--resume으로 작업을 취소하거나 이어서 다시 실행하도록 등록할 수 있습니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='대기 작업을 모두 실행한 뒤 종료')
+        parser.add_argument('--poll-interval', type=float, default=None, help='대기 작업 확인 간격(초) (기본: RAG_INGEST_JOB_POLL_SECONDS)')
+        parser.add_argument('--worker-id', default=None, help='작업에 기록할 워커 이름 (기본: 호스트:PID)')
+        parser.add_argument('--cancel', type=int, metavar='JOB_ID', help='작업 취소 후 종료')
+        parser.add_argument('--resume', type=int, metavar='JOB_ID', help='실패/취소된 작업을 다시 대기열에 넣고 종료')
+
+    def handle(self, *args, **options):
+        if options['cancel'] or options['resume']:
+            job_id = options['cancel'] or options['resume']
+            job = IngestionJob.objects.filter(pk=job_id).first()
+            if job is None:
+                raise CommandError(f"작업 #{job_id}을(를) 찾을 수 없습니다.")
+            try:
+                job = IngestionJobRunner.cancel(job) if options['cancel'] else IngestionJobRunner.resume(job)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"작업 #{job.pk}: {job.status}" + (" (취소 요청됨)" if job.cancel_requested else ""))
+            return
+
+        worker = options['worker_id'] or IngestionJobRunner.default_worker_name()
+        self.stdout.write(f"적재 워커 시작: {worker}")
+        try:
+            processed = IngestionJobRunner.work(worker, once=options['once'], poll_interval=options['poll_interval'])
+        except KeyboardInterrupt:
+            # 실행 중이던 작업은 하트비트가 끊기므로 RAG_INGEST_JOB_STALE_SECONDS 뒤 다음 워커가 다시 가져감
+            self.stdout.write("워커 종료")
+            return
+        self.stdout.write(self.style.SUCCESS(f"대기 작업 없음, {processed}개 작업 실행 후 종료"))
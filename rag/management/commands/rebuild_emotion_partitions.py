@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from rag.engine import RAGEngine
+from rag.faiss_index import iter_collection
+from rag.method import RAGProcessor
+from rag.partitions import add_to_partitions, list_partitions
+
+
+class Command(BaseCommand):
+    help = "기존 Chroma 컬렉션(korean_dialogue)에서 emotion 값별 파티션 컬렉션을 다시 만듭니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Chroma에서 한 번에 읽을 문서 수')
+
+    def handle(self, *args, **options):
+        vectorstore, _ = RAGProcessor.initialize_chroma_db()
+        if vectorstore is None:
+            self.stderr.write("Chroma DB가 없습니다. 먼저 /api/rag/setup/으로 데이터를 적재하세요.")
+            return
+
+        client = vectorstore._client
+        for emotion, collection in list_partitions(client).items():
+            client.delete_collection(collection.name)
+
+        total = 0
+        for ids, embeddings, documents, metadatas in iter_collection(vectorstore._collection, options['batch_size']):
+            add_to_partitions(client, embeddings, documents, metadatas, ids)
+            total += len(ids)
+
+        RAGEngine.instance().invalidate()
+        partitions = list_partitions(client)
+        self.stdout.write(self.style.SUCCESS(f"파티션 생성 완료: {total}개 문서, {len(partitions)}개 감정"))
+        for emotion, collection in sorted(partitions.items()):
+            self.stdout.write(f"- {emotion}: {collection.count()}개")
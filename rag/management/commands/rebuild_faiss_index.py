@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from rag.engine import RAGEngine
+from rag.faiss_index import FaissIndex
+from rag.method import RAGProcessor
+from rag.quantization import MODES
+
+
+class Command(BaseCommand):
+    help = "Chroma 컬렉션(korean_dialogue)을 FAISS 스냅샷으로 다시 내보냅니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Chroma에서 한 번에 읽을 문서 수')
+        parser.add_argument(
+            '--quantization', choices=MODES, default=None,
+            help='압축 방식 (기본: 컬렉션에 기록된 방식 또는 RAG_VECTOR_QUANTIZATION)'
+        )
+
+    def handle(self, *args, **options):
+        vectorstore, _ = RAGProcessor.initialize_chroma_db()
+        if vectorstore is None:
+            self.stderr.write("Chroma DB가 없습니다. 먼저 /api/rag/setup/으로 데이터를 적재하세요.")
+            return
+
+        path = FaissIndex.build_from_chroma(
+            vectorstore._collection, batch_size=options['batch_size'], quantization=options['quantization']
+        )
+        RAGEngine.instance().invalidate()
+        index = FaissIndex.load()
+        self.stdout.write(self.style.SUCCESS(
+            f"FAISS 스냅샷 생성 완료: {path} (문서 수: {index.count}, 인덱스: {index.meta['index_type']})"
+        ))
@@ -0,0 +1,45 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+
+from rag.engine import RAGEngine
+from rag.faiss_index import iter_collection
+from rag.lexical import LexicalIndex, LexicalIndexWriter
+from rag.method import RAGProcessor
+
+
+class Command(BaseCommand):
+    help = "기존 Chroma 컬렉션(korean_dialogue)에서 BM25 어휘 색인을 다시 만듭니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Chroma에서 한 번에 읽을 문서 수')
+
+    def handle(self, *args, **options):
+        vectorstore, _ = RAGProcessor.initialize_chroma_db()
+        if vectorstore is None:
+            self.stderr.write("Chroma DB가 없습니다. 먼저 /api/rag/setup/으로 데이터를 적재하세요.")
+            return
+
+        # 새 디렉터리에 세그먼트를 쓴 뒤 기존 색인과 교체 (그동안 질의는 기존 색인을 사용)
+        path = LexicalIndex.default_path()
+        building = f"{path}.rebuild"
+        shutil.rmtree(building, ignore_errors=True)
+        writer = LexicalIndexWriter(building)
+        for ids, _, documents, metadatas in iter_collection(
+            vectorstore._collection, options['batch_size'], include=("documents", "metadatas")
+        ):
+            writer.add_documents(ids, documents, metadatas)
+        writer.flush()
+
+        old = f"{path}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(building, path)
+        shutil.rmtree(old, ignore_errors=True)
+        index = LexicalIndex.load(path)
+        RAGEngine.instance().invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f"어휘 색인 생성 완료: {index.count}개 문서, {len(index.segments)}개 세그먼트 ({path})"
+        ))
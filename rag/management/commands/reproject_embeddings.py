@@ -0,0 +1,116 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from langchain_chroma import Chroma
+
+from rag.constants import COLLECTION_NAME
+from rag.engine import RAGEngine, collection_dimensions
+from rag.faiss_index import FaissIndex, iter_collection
+from rag.method import RAGProcessor
+from rag.partitions import add_to_partitions, list_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "기존 Chroma 컬렉션(korean_dialogue)의 임베딩을 더 작은 차원으로 변환합니다. "
+        "text-embedding-3 계열은 앞부분 차원만 남기고 다시 정규화한 벡터가 dimensions 파라미터로 받은 벡터와 같으므로 "
+        "다시 임베딩하지 않고 새 컬렉션에 옮겨 쓴 뒤 이름을 바꿔 교체합니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dimensions', type=int, default=None,
+            help='변환할 차원 (기본: RAG_EMBEDDING_DIMENSIONS)'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Chroma에서 한 번에 읽을 문서 수')
+        parser.add_argument('--keep-backup', action='store_true', help='기존 컬렉션을 백업 이름으로 남겨 둠')
+
+    def handle(self, *args, **options):
+        target = options['dimensions'] or settings.RAG_EMBEDDING_DIMENSIONS
+        if not target:
+            raise CommandError("--dimensions 또는 RAG_EMBEDDING_DIMENSIONS를 지정하세요.")
+
+        # 차원 확인(initialize_chroma_db)을 거치지 않고 기존 컬렉션을 그대로 엽니다
+        vectorstore = Chroma(
+            persist_directory=RAGProcessor.DB_DIR,
+            embedding_function=None,
+            collection_name=COLLECTION_NAME
+        )
+        client = vectorstore._client
+        source = vectorstore._collection
+        current = collection_dimensions(source)
+        if current is None:
+            raise CommandError("컬렉션이 비어 있습니다. 변환할 벡터가 없습니다.")
+        if current == target:
+            self.stdout.write(f"이미 {target}차원입니다.")
+            return
+        if target > current:
+            raise CommandError(f"차원을 늘릴 수는 없습니다 ({current} -> {target}). 원본 데이터를 다시 적재하세요.")
+
+        started = time.perf_counter()
+        staging_name = f"{COLLECTION_NAME}__reproject_{target}"
+        if staging_name in [str(name) for name in client.list_collections()]:
+            client.delete_collection(staging_name)
+        metadata = dict(source.metadata or {})
+        metadata.update(embedding_dimensions=target)
+        staging = client.create_collection(staging_name, metadata=metadata, embedding_function=None)
+
+        total = 0
+        self.stdout.write(f"{source.count()}개 문서를 {current}차원 -> {target}차원으로 변환합니다.")
+        for ids, embeddings, documents, metadatas in iter_collection(source, options['batch_size']):
+            staging.add(
+                ids=ids,
+                embeddings=self._reproject(embeddings, target),
+                documents=documents,
+                metadatas=metadatas
+            )
+            total += len(ids)
+            self.stdout.write(f"  {total}개 처리")
+
+        # 새 컬렉션으로 교체 (기존 컬렉션은 백업 이름으로 바꾼 뒤 필요 없으면 삭제)
+        backup_name = f"{COLLECTION_NAME}__backup_{time.strftime('%Y%m%d%H%M%S')}"
+        source.modify(name=backup_name)
+        staging.modify(name=COLLECTION_NAME)
+        if not options['keep_backup']:
+            client.delete_collection(backup_name)
+
+        self._rebuild_derived(vectorstore, options['batch_size'])
+        RAGEngine.instance().invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"변환 완료: {total}개 문서, {target}차원 ({time.perf_counter() - started:.1f}초)"
+            + (f", 백업: {backup_name}" if options['keep_backup'] else "")
+        ))
+        if settings.RAG_EMBEDDING_DIMENSIONS != target:
+            self.stdout.write(self.style.WARNING(
+                f"질의/적재에 같은 차원을 쓰도록 RAG_EMBEDDING_DIMENSIONS={target}로 설정하세요."
+            ))
+
+    @staticmethod
+    def _reproject(embeddings, target):
+        """앞부분 target 차원만 남기고 L2 정규화합니다."""
+        vectors = np.asarray(embeddings, dtype=np.float32)[:, :target]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).tolist()
+
+    def _rebuild_derived(self, vectorstore, batch_size):
+        """감정별 파티션과 FAISS 스냅샷을 새 컬렉션 기준으로 다시 만듭니다."""
+        vectorstore = Chroma(
+            client=vectorstore._client,
+            embedding_function=None,
+            collection_name=COLLECTION_NAME
+        )
+        client = vectorstore._client
+        partitions = list_partitions(client)
+        if partitions or settings.RAG_EMOTION_PARTITIONS:
+            for collection in partitions.values():
+                client.delete_collection(collection.name)
+            for ids, embeddings, documents, metadatas in iter_collection(vectorstore._collection, batch_size):
+                add_to_partitions(client, embeddings, documents, metadatas, ids)
+            self.stdout.write(f"감정별 파티션 재생성: {len(list_partitions(client))}개")
+        if FaissIndex.exists() or settings.RAG_RETRIEVER_BACKEND == "faiss":
+            path = FaissIndex.build_from_chroma(vectorstore._collection, batch_size=batch_size)
+            self.stdout.write(f"FAISS 스냅샷 재생성: {path}")
@@ -1,15 +1,34 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_chroma import Chroma
 from langchain_community.document_loaders import CSVLoader
 import os
 from glob import glob
-import uuid
-import pickle
+import hashlib
+import json
 from .models import RAG_DB
+from .embedding_cache import normalize_text
+from .embedding_scheduler import EmbeddingScheduler
+from .embedding_shards import EmbeddingShardStore
+from .pipeline import IngestBatch, IngestionPipeline
+from .jobs import JobCancelled, report_file_started, report_file_status, report_progress, track_file
+from .parallel_ingest import ParallelParser, csv_chunk_documents, iter_csv_row_chunks, parse_conversation_file, parse_csv_chunk
+from .engine import RAGEngine, COLLECTION_NAME, build_embeddings, check_dimensions, collection_dimensions
+from .history import ChatHistoryProvider
+from .faiss_index import FaissIndex
+from .partitions import add_to_partitions
+from .lexical import LexicalIndex
+from .quantization import validate_mode
+from .context import PackedContext, pack_context
+from .metrics import Trace, current_trace, record_usage, timed, traced, use_trace
 import asyncio
+import logging
+import time
+import numpy as np
+from collections import Counter
+from contextlib import nullcontext
+from dataclasses import dataclass
 from typing import List
-from langchain.prompts import ChatPromptTemplate
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from tqdm import tqdm
 
@@ -17,6 +36,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class RAGProcessor:
     TEMP_DIR = "data/temp_embeddings"
     DB_DIR = os.path.join(settings.BASE_DIR, "embeddings", "chroma_db")
@@ -53,22 +74,24 @@ class RAGProcessor:
         if os.path.exists(f"{db_dir}/chroma.sqlite3"):
             print(f"chroma.sqlite3 파일 크기: {os.path.getsize(f'{db_dir}/chroma.sqlite3')} bytes")
         
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small", chunk_size=1000)
+        embeddings = build_embeddings()
 
         if os.path.exists(db_dir) and os.path.exists(f"{db_dir}/chroma.sqlite3"):
             print("기존 Chroma DB 로드 중...")
             vectorstore = Chroma(
                 persist_directory=db_dir,
                 embedding_function=embeddings,
-                collection_name="korean_dialogue"
+                collection_name=COLLECTION_NAME
             )
-            existing_ids = set(vectorstore._collection.get()['ids'])
-            print(f"기존 문서 수: {len(existing_ids)}")
+            # 설정된 임베딩 차원과 컬렉션 차원이 다르면 적재 전에 바로 실패
+            check_dimensions(collection_dimensions(vectorstore._collection), f"Chroma 컬렉션({COLLECTION_NAME})")
+            print(f"기존 문서 수: {vectorstore._collection.count()}")
         else:
             print("새로운 Chroma DB 생성")
             vectorstore = None
-            existing_ids = set()
 
+        # 기존 문서는 내용 해시 ID로 청크마다 컬렉션에서 확인하므로 전체 ID를 미리 읽지 않음
+        existing_ids = set()
         return vectorstore, existing_ids
 
     @staticmethod
@@ -79,18 +102,55 @@ class RAGProcessor:
         return loader.load()
 
     @staticmethod
-    def filter_new_documents(docs, existing_ids, csv_file):
-        """이미 존재하는 문서를 제외하고 새 문서만 필터링."""
-        new_docs = []
-        for idx, doc in enumerate(docs):
-            doc.metadata['source_file'] = os.path.basename(csv_file)
-            unique_id = str(uuid.uuid4())
-            doc_id = f"doc_{unique_id}_{idx}"
-            if doc_id not in existing_ids:
-                doc.metadata['doc_id'] = doc_id
-                new_docs.append(doc)
-        print(f"새로운 문서 발견: {len(new_docs)}개")
-        return new_docs
+    def iter_csv_chunks(csv_file, chunk_rows=None):
+        """
+        CSV 파일을 chunk_rows 행씩 Document 리스트로 읽는 제너레이터.
+
+        load_csv_with_metadata와 같은 Document(page_content, source/row/emotion 메타데이터)를 만들지만
+        한 청크씩 읽으므로 파일 크기와 관계없이 한 청크만 메모리에 올라갑니다.
+        병렬 파싱(parse_csv_chunk)과 같은 함수(csv_chunk_documents)로 Document를 만듭니다.
+        """
+        for header, rows, start_row in iter_csv_row_chunks(csv_file, chunk_rows):
+            yield csv_chunk_documents(csv_file, header, rows, start_row)
+
+    @staticmethod
+    def content_id(text, metadata=None):
+        """
+        정규화된 텍스트와 메타데이터로 만든 안정적인 문서 ID.
+        같은 내용은 프로세스/실행과 관계없이 항상 같은 ID가 되므로 재적재 시 중복을 건너뛸 수 있습니다.
+        이전 버전의 ID(CSV는 uuid4, JSON은 hash())와는 겹치지 않으므로, 그때 만든 컬렉션은
+        한 번 비우고 다시 적재해야 같은 내용이 두 번 들어가지 않습니다.
+        """
+        payload = normalize_text(text) + "\x00" + json.dumps(metadata or {}, ensure_ascii=False, sort_keys=True)
+        return "doc_" + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def filter_new_documents(vectorstore, texts, metadatas, ids, existing_ids=None, lookup_batch=5000):
+        """
+        이미 컬렉션에 있거나(같은 내용 해시 ID) 배치 안에서 중복된 행을 제외합니다.
+
+        컬렉션 확인은 청크의 ID만 get(ids=..., include=[])으로 조회하므로 전체 ID를 메모리에 올리지 않습니다.
+        """
+        existing_ids = existing_ids or set()
+        seen = set()
+        candidates = []
+        for i, doc_id in enumerate(ids):
+            if doc_id in seen or doc_id in existing_ids:
+                continue
+            seen.add(doc_id)
+            candidates.append(i)
+
+        stored = set()
+        if vectorstore is not None and candidates:
+            candidate_ids = [ids[i] for i in candidates]
+            for start in range(0, len(candidate_ids), lookup_batch):
+                batch = candidate_ids[start:start + lookup_batch]
+                stored.update(vectorstore._collection.get(ids=batch, include=[])["ids"])
+
+        keep = [i for i in candidates if ids[i] not in stored]
+        skipped = len(ids) - len(keep)
+        print(f"새로운 문서 발견: {len(keep)}개" + (f" (기존/중복 {skipped}개 건너뜀)" if skipped else ""))
+        return [texts[i] for i in keep], [metadatas[i] for i in keep], [ids[i] for i in keep]
 
     @staticmethod
     def split_documents(docs):
@@ -107,78 +167,34 @@ class RAGProcessor:
 
     @staticmethod
     def prepare_data_for_chroma(splits):
-        """Chroma DB에 저장할 텍스트, 메타데이터, ID 준비."""
+        """Chroma DB에 저장할 텍스트, 메타데이터, 내용 해시 ID 준비."""
         texts, metadatas, ids = [], [], []
         for doc in splits:
-            texts.append(f"content: {doc.page_content}")
-            metadatas.append({
+            text = f"content: {doc.page_content}"
+            metadata = {
                 "emotion": doc.metadata.get('emotion', ''),
-            })
-            ids.append(doc.metadata.get('doc_id'))
+            }
+            texts.append(text)
+            metadatas.append(metadata)
+            ids.append(RAGProcessor.content_id(text, metadata))
 
         return texts, metadatas, ids
 
     @staticmethod
-    async def create_embeddings_async(texts: List[str], pbar: tqdm, batch_size: int = 20, concurrent_tasks: int = 5) -> List[List[float]]:
-        """텍스트 리스트의 임베딩을 비동기로 생성합니다."""
-        embedding_function = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            chunk_size=1000
-        )
-        
-        all_embeddings = []
-        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
-        semaphore = asyncio.Semaphore(concurrent_tasks)
-        async def process_batch(batch):
-            async with semaphore:
-                await asyncio.sleep(0.1)
-                return await embedding_function.aembed_documents(batch)
-        tasks = [process_batch(batch) for batch in batches]
-        for coro in asyncio.as_completed(tasks):
-            embeddings = await coro
-            if embeddings:
-                all_embeddings.extend(embeddings)
-                pbar.update(batch_size)
-        return all_embeddings
-
-    @staticmethod
-    def get_optimal_embedding_params(num_texts: int) -> (int, int):
-        """
-        입력 텍스트의 총 개수(num_texts)와 CPU 코어 수를 기준으로 최적의 batch_size와
-        concurrent_tasks 값을 계산합니다.
-
-        Returns:
-            tuple: (batch_size, concurrent_tasks)
-        """
-        import multiprocessing
-        cpu_count = multiprocessing.cpu_count()
-        # 텍스트 수에 따라 배치 크기를 조정하는 간단한 heuristic
-        if num_texts < 100:
-            batch_size = 10
-        elif num_texts < 1000:
-            batch_size = 20
-        else:
-            batch_size = 50
+    async def create_embeddings_async(texts: List[str], pbar: tqdm) -> List[List[float]]:
+        """텍스트 리스트의 임베딩을 비동기로 생성합니다.
 
-        # 동시 실행 태스크는 CPU 코어 수와 상한값 10을 고려
-        concurrent_tasks = min(10, cpu_count)
-        print(
-            f"Optimal Parameters determined: batch_size={batch_size}, "
-            f"concurrent_tasks={concurrent_tasks} based on {num_texts} texts and {cpu_count} CPUs"
-        )
-        return batch_size, concurrent_tasks
+        배치 크기/동시성/재시도는 EmbeddingScheduler가 토큰 수와 API 한도(TPM/RPM) 기준으로 정합니다.
+        """
+        # 캐시를 거치므로 이미 계산된 텍스트는 다시 요청하지 않습니다.
+        embedding_function = build_embeddings()
+        return await EmbeddingScheduler.instance().embed(texts, embedding_function, pbar)
 
     @staticmethod
     def create_embeddings(texts: List[str]) -> List[List[float]]:
-        """동기 방식으로 비동기 임베딩 생성을 실행합니다.
-        
-        입력 텍스트의 수에 따라 최적의 batch_size와 concurrent_tasks를 계산하여 임베딩을 생성합니다.
-        """
-        batch_size, concurrent_tasks = RAGProcessor.get_optimal_embedding_params(len(texts))
+        """동기 방식으로 비동기 임베딩 생성을 실행합니다."""
         with tqdm(total=len(texts), desc="임베딩 생성 중") as pbar:
-            embeddings = asyncio.run(
-                RAGProcessor.create_embeddings_async(texts, pbar, batch_size, concurrent_tasks)
-            )
+            embeddings = asyncio.run(RAGProcessor.create_embeddings_async(texts, pbar))
         return embeddings
 
     @staticmethod
@@ -188,75 +204,238 @@ class RAGProcessor:
         processed_count = 0
 
         print("\n=== CSV 파일 처리 시작 ===")
-        for csv_file in tqdm(csv_files, desc="📂 CSV 파일 처리"):
-            try:
-                # CSV 파일 로드 및 메타데이터 추가
-                docs = RAGProcessor.load_csv_with_metadata(csv_file)
-                if not docs:
+        # 병렬 파싱이면 프로세스 풀을 파일 전체에 걸쳐 한 번만 띄움
+        with (ParallelParser() if settings.RAG_INGEST_PARALLEL_PARSE else nullcontext()) as parser:
+            for csv_file in tqdm(csv_files, desc="📂 CSV 파일 처리"):
+                try:
+                    with track_file(csv_file):
+                        vectorstore, new_docs = RAGProcessor.process_csv_file(
+                            csv_file, existing_ids, vectorstore, db_dir, parser=parser
+                        )
+                    total_new_docs += new_docs
+                    processed_count += 1
+                    print(f"✅ [{os.path.basename(csv_file)}] 처리 완료\n")
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    print(f"❌ 파일 처리 중 오류 발생 ({os.path.basename(csv_file)}): {e}")
                     continue
 
-                # 새 문서 필터링
-                new_docs = RAGProcessor.filter_new_documents(docs, existing_ids, csv_file)
-                if not new_docs:
-                    continue
+        return vectorstore, total_new_docs, processed_count
 
-                # 문서 분할
-                total_new_docs += len(new_docs)
-                splits = RAGProcessor.split_documents(new_docs)
-                
-                # 데이터 준비
-                texts, metadatas, ids = RAGProcessor.prepare_data_for_chroma(splits)
-                
-                print(f"\n📄 [{os.path.basename(csv_file)}] 처리 중...")
-                print(f"   - 텍스트 수: {len(texts)}개")
-                
-                # 임시 저장된 임베딩 확인
-                temp_embeddings = RAGProcessor.load_temp_embeddings(csv_file)
-                
-                if temp_embeddings is not None:
-                    print("💾 기존 임시 임베딩 사용")
-                    embeddings = temp_embeddings
-                else:
-                    print("🔄 새로운 임베딩 생성 시작")
-                    embeddings = RAGProcessor.create_embeddings(texts)
-                    RAGProcessor.save_temp_embeddings(csv_file, embeddings)
-                
-                # Chroma DB 업데이트
-                vectorstore = RAGProcessor.update_chroma_db(
-                    vectorstore, texts, embeddings, metadatas, ids, db_dir
-                )
-                
-                # 처리 완료 기록
-                RAGProcessor.save_processed_file_info(csv_file)
-                processed_count += 1
-                print(f"✅ [{os.path.basename(csv_file)}] 처리 완료\n")
-
-            except Exception as e:
-                print(f"❌ 파일 처리 중 오류 발생 ({os.path.basename(csv_file)}): {e}")
-                continue
+    @staticmethod
+    def process_csv_file(csv_file, existing_ids, vectorstore, db_dir, parser=None):
+        """
+        CSV 파일 하나를 적재하고 처리 완료를 기록합니다.
+        parser를 주면 스트리밍 적재의 파싱/분할을 프로세스 풀에서 실행합니다.
 
-        return vectorstore, total_new_docs, processed_count
+        Returns:
+            (vectorstore, 새 문서 수)
+        """
+        if settings.RAG_INGEST_STREAMING or parser is not None:
+            vectorstore, new_docs = RAGProcessor.process_csv_streaming(
+                csv_file, existing_ids, vectorstore, db_dir, parser=parser
+            )
+            RAGProcessor.save_processed_file_info(csv_file)
+            return vectorstore, new_docs
+
+        # CSV 파일 로드 및 메타데이터 추가
+        docs = RAGProcessor.load_csv_with_metadata(csv_file)
+        if not docs:
+            return vectorstore, 0
+        report_progress(csv_file, rows=len(docs))
+
+        # 문서 분할
+        splits = RAGProcessor.split_documents(docs)
+
+        # 데이터 준비 (내용 해시 ID)
+        texts, metadatas, ids = RAGProcessor.prepare_data_for_chroma(splits)
+
+        # 이미 적재된 행 제외
+        texts, metadatas, ids = RAGProcessor.filter_new_documents(
+            vectorstore, texts, metadatas, ids, existing_ids
+        )
+        if not texts:
+            RAGProcessor.save_processed_file_info(csv_file)
+            return vectorstore, 0
+
+        print(f"\n📄 [{os.path.basename(csv_file)}] 처리 중...")
+        print(f"   - 텍스트 수: {len(texts)}개")
+
+        # 임시 저장된 임베딩 중 같은 ID는 재사용하고 나머지만 생성
+        store = EmbeddingShardStore(csv_file, RAGProcessor.TEMP_DIR)
+        embeddings = RAGProcessor.embed_with_reuse(store, 0, texts, ids)
+
+        # Chroma DB 업데이트
+        vectorstore = RAGProcessor.update_chroma_db(
+            vectorstore, texts, embeddings, metadatas, ids, db_dir
+        )
+        report_progress(csv_file, new_docs=len(texts))
+
+        # 처리 완료 기록
+        RAGProcessor.save_processed_file_info(csv_file)
+        return vectorstore, len(texts)
+
+    @staticmethod
+    def embed_with_reuse(store, shard, texts, ids):
+        """
+        임베딩 샤드(store의 shard 번호)에 같은 ID의 벡터가 있으면 재사용하고 나머지만 임베딩합니다.
+        ID가 내용 해시이므로 이전 실행에서 계산한 벡터를 행 순서와 관계없이 찾을 수 있고,
+        샤드의 행이 그대로 일치하면 메모리 매핑 배열을 복사 없이 반환합니다.
+
+        Returns:
+            np.ndarray: (len(texts), 차원) 임베딩
+        """
+        stored = store.load(shard)
+        if stored is not None and stored[0] == list(ids):
+            print(f"💾 기존 임베딩 샤드 사용: {len(ids)}개")
+            return stored[1]
+
+        known = {}
+        if stored is not None:
+            known = {doc_id: row for row, doc_id in enumerate(stored[0])}
+        missing = [i for i, doc_id in enumerate(ids) if doc_id not in known]
+        if known and len(missing) < len(ids):
+            print(f"💾 기존 임베딩 샤드 사용: {len(ids) - len(missing)}개")
+
+        fresh = None
+        if missing:
+            print(f"🔄 새로운 임베딩 생성 시작: {len(missing)}개")
+            fresh = np.asarray(RAGProcessor.create_embeddings([texts[i] for i in missing]), dtype=np.float32)
+        dim = fresh.shape[1] if fresh is not None else stored[1].shape[1]
+        embeddings = np.empty((len(ids), dim), dtype=np.float32)
+        reused = [i for i, doc_id in enumerate(ids) if doc_id in known]
+        if reused:
+            embeddings[reused] = stored[1][[known[ids[i]] for i in reused]]
+        if missing:
+            embeddings[missing] = fresh
+            store.save(shard, ids, embeddings)
+        return embeddings
+
+    @staticmethod
+    def process_csv_streaming(csv_file, existing_ids, vectorstore, db_dir, parser=None):
+        """
+        CSV 파일 하나를 RAG_INGEST_CHUNK_ROWS 행씩 읽어 청크마다 분할 -> 임베딩 -> 저장까지 마칩니다.
+
+        파일 전체의 텍스트/메타데이터/임베딩을 리스트로 모으지 않으므로 메모리 사용량은 청크 크기에만 비례합니다.
+        청크 N을 저장하는 동안 다음 청크를 임베딩하며(rag/pipeline.py), 저장한 청크마다 체크포인트를 남겨
+        중단되면 다음 실행에서 마지막으로 저장한 청크 다음부터 이어서 진행합니다.
+        이미 적재된 행은 내용 해시 ID로 건너뛰고, 임베딩은 청크마다 샤드(rag/embedding_shards.py)로 저장하여
+        중단 후 다시 실행하면 계산해 둔 임베딩을 재사용합니다.
+        parser(ParallelParser)를 주면 청크의 Document 생성/분할/ID 계산을 프로세스 풀에서 실행합니다.
+
+        Returns:
+            (vectorstore, 새 문서 수)
+        """
+        store = EmbeddingShardStore(csv_file, RAGProcessor.TEMP_DIR)
+        chunk_rows = settings.RAG_INGEST_CHUNK_ROWS
+        if vectorstore is None:
+            vectorstore = RAGProcessor.open_vectorstore(db_dir)
+        collection_id = vectorstore._collection.id
+        resume_from = store.load_checkpoint(collection_id, chunk_rows)
+        print(f"\n📄 [{os.path.basename(csv_file)}] 스트리밍 처리 중..."
+              + (f" (체크포인트: {resume_from}번 배치부터)" if resume_from else ""))
+
+        def parsed_chunks():
+            """(청크 번호, texts, metadatas, ids, 행 수)를 청크 순서대로 내놓습니다."""
+            if parser is None:
+                for chunk_index, docs in enumerate(RAGProcessor.iter_csv_chunks(csv_file, chunk_rows)):
+                    if chunk_index < resume_from:
+                        yield chunk_index, None, None, None, len(docs)
+                        continue
+                    splits = RAGProcessor.split_documents(docs)
+                    texts, metadatas, ids = RAGProcessor.prepare_data_for_chroma(splits)
+                    yield chunk_index, texts, metadatas, ids, len(docs)
+                return
+
+            skipped = []
+
+            def chunk_args():
+                for chunk_index, (header, rows, start_row) in enumerate(iter_csv_row_chunks(csv_file, chunk_rows)):
+                    if chunk_index < resume_from:
+                        skipped.append(len(rows))
+                        continue
+                    yield csv_file, header, rows, start_row
+
+            for chunk_index, (texts, metadatas, ids, rows) in enumerate(parser.map(parse_csv_chunk, chunk_args())):
+                # 체크포인트 이전 청크는 워커에 넘기지 않고 행 수만 셈
+                while skipped:
+                    yield None, None, None, None, skipped.pop()
+                yield resume_from + chunk_index, texts, metadatas, ids, rows
+            while skipped:
+                yield None, None, None, None, skipped.pop()
+
+        def batches():
+            with tqdm(desc="📥 CSV 행", unit="행") as pbar:
+                for chunk_index, texts, metadatas, ids, rows in parsed_chunks():
+                    pbar.update(rows)
+                    # 실행 중인 적재 작업이면 진행 상황을 보고하고, 취소 요청이 있으면 여기서 중단
+                    report_progress(csv_file, rows=rows)
+                    if texts is None:
+                        continue
+                    texts, metadatas, ids = RAGProcessor.filter_new_documents(vectorstore, texts, metadatas, ids, existing_ids)
+                    if texts:
+                        yield IngestBatch(chunk_index, texts, metadatas, ids)
+
+        def checkpoint(batch):
+            store.save_checkpoint(collection_id, chunk_rows, batch.index + 1)
+            report_progress(csv_file, new_docs=len(batch.ids))
+
+        pipeline = IngestionPipeline(
+            embed=lambda batch: RAGProcessor.embed_with_reuse(store, batch.index, batch.texts, batch.ids),
+            write=lambda batch, embeddings: RAGProcessor.update_chroma_db(
+                vectorstore, batch.texts, embeddings, batch.metadatas, batch.ids, db_dir
+            ),
+            checkpoint=checkpoint
+        )
+        new_docs_total = pipeline.run(batches())
+        return vectorstore, new_docs_total
 
     @staticmethod
-    def update_chroma_db(vectorstore, texts, embeddings, metadatas, ids, db_dir):
-        """Chroma DB에 데이터를 배치 단위로 추가하고 진행상황을 표시합니다."""
+    def add_batch(vectorstore, embeddings, documents, metadatas, ids):
+        """
+        한 배치를 Chroma 컬렉션에 추가합니다.
+
+        RAG_EMOTION_PARTITIONS가 켜져 있으면 emotion 값별 파티션 컬렉션에도 함께 추가하고,
+        RAG_LEXICAL_INDEX가 켜져 있으면 BM25 어휘 색인에도 추가합니다.
+        (어휘 색인은 refresh_query_indexes에서 디스크에 저장됩니다.)
+        """
+        vectorstore._collection.add(
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids
+        )
+        if settings.RAG_EMOTION_PARTITIONS:
+            add_to_partitions(vectorstore._client, embeddings, documents, metadatas, ids)
+        if settings.RAG_LEXICAL_INDEX:
+            LexicalIndex.writer().add_documents(ids, documents, metadatas)
+
+    @staticmethod
+    def update_chroma_db(vectorstore, texts, embeddings, metadatas, ids, db_dir, quantization=None):
+        """
+        Chroma DB에 데이터를 배치 단위로 추가하고 진행상황을 표시합니다.
+
+        quantization('none', 'float16', 'int8')을 주면 컬렉션 메타데이터에 기록해 두고,
+        이후 FAISS 스냅샷을 만들 때 해당 방식의 압축 벡터 + float32 재채점 인덱스를 생성합니다.
+        (Chroma 자체 저장은 항상 float32이며 재채점의 원본으로 쓰입니다.)
+        """
         MAX_BATCH_SIZE = 5000
 
         if vectorstore is None:
-            print("🔨 새로운 Chroma DB 생성 중...")
-            embedding_function = OpenAIEmbeddings(model="text-embedding-3-small")
-            vectorstore = Chroma(
-                persist_directory=db_dir,
-                embedding_function=embedding_function,
-                collection_name="korean_dialogue"
-            )
+            vectorstore = RAGProcessor.open_vectorstore(db_dir)
+        if quantization is not None:
+            RAGProcessor.set_quantization(vectorstore, quantization)
+        if len(embeddings):
+            RAGProcessor.record_dimensions(vectorstore, len(embeddings[0]))
 
         total_batches = (len(texts) + MAX_BATCH_SIZE - 1) // MAX_BATCH_SIZE
         print(f"📦 Chroma DB 업데이트 시작 (총 {total_batches}개 배치)")
         
         for i in tqdm(range(0, len(texts), MAX_BATCH_SIZE), desc="💫 DB 업데이트"):
             end_idx = min(i + MAX_BATCH_SIZE, len(texts))
-            vectorstore._collection.add(
+            RAGProcessor.add_batch(
+                vectorstore,
                 embeddings=embeddings[i:end_idx],
                 documents=texts[i:end_idx],
                 metadatas=metadatas[i:end_idx],
@@ -266,6 +445,53 @@ class RAGProcessor:
         print(f"✨ DB 업데이트 완료 (총 {len(texts)}개 문서)")
         return vectorstore
 
+    @staticmethod
+    def open_vectorstore(db_dir):
+        """적재용 Chroma 벡터스토어를 새로 만듭니다."""
+        print("🔨 새로운 Chroma DB 생성 중...")
+        return Chroma(
+            persist_directory=db_dir,
+            embedding_function=build_embeddings(),
+            collection_name=COLLECTION_NAME
+        )
+
+    @staticmethod
+    def update_collection_metadata(vectorstore, **fields):
+        """컬렉션 메타데이터에 값을 기록합니다. 바뀐 값이 있으면 True."""
+        collection = vectorstore._collection
+        # 거리 함수(hnsw:space)는 생성 후 변경할 수 없으므로 나머지 메타데이터만 다시 씀
+        metadata = {k: v for k, v in (collection.metadata or {}).items() if k != "hnsw:space"}
+        if all(metadata.get(key) == value for key, value in fields.items()):
+            return False
+        metadata.update(fields)
+        collection.modify(metadata=metadata)
+        return True
+
+    @staticmethod
+    def set_quantization(vectorstore, quantization):
+        """질의용 스냅샷의 양자화 방식을 컬렉션 메타데이터에 기록합니다."""
+        validate_mode(quantization)
+        if RAGProcessor.update_collection_metadata(vectorstore, quantization=quantization):
+            print(f"🗜️ 질의용 벡터 양자화 방식: {quantization}")
+
+    @staticmethod
+    def record_dimensions(vectorstore, dimensions):
+        """
+        적재하는 임베딩 차원을 컬렉션 메타데이터에 기록합니다.
+        이미 다른 차원의 벡터가 있는 컬렉션이면 쓰기 전에 실패합니다.
+        """
+        current = collection_dimensions(vectorstore._collection)
+        if current and current != dimensions:
+            raise ValueError(
+                f"컬렉션 임베딩 차원({current})과 적재할 임베딩 차원({dimensions})이 다릅니다. "
+                f"manage.py reproject_embeddings로 컬렉션을 먼저 변환하세요."
+            )
+        RAGProcessor.update_collection_metadata(
+            vectorstore,
+            embedding_dimensions=dimensions,
+            embedding_model=settings.RAG_EMBEDDINGS_FACTORY or settings.RAG_EMBEDDING_MODEL
+        )
+
     @staticmethod
     async def async_update_chroma_db(vectorstore, texts, embeddings, metadatas, ids, db_dir):
         """
@@ -279,12 +505,15 @@ class RAGProcessor:
         MAX_BATCH_SIZE = 5000
         total_batches = (len(texts) + MAX_BATCH_SIZE - 1) // MAX_BATCH_SIZE
         print(f"📦 비동기 Chroma DB 업데이트 시작 (총 {total_batches}개 배치)")
+        if len(embeddings):
+            await asyncio.to_thread(RAGProcessor.record_dimensions, vectorstore, len(embeddings[0]))
         tasks = []
         for i in range(0, len(texts), MAX_BATCH_SIZE):
             end_idx = min(i + MAX_BATCH_SIZE, len(texts))
             tasks.append(
                 asyncio.to_thread(
-                    vectorstore._collection.add,
+                    RAGProcessor.add_batch,
+                    vectorstore,
                     embeddings=embeddings[i:end_idx],
                     documents=texts[i:end_idx],
                     metadatas=metadatas[i:end_idx],
@@ -296,32 +525,25 @@ class RAGProcessor:
         return vectorstore
 
     @staticmethod
-    def save_processed_file_info(csv_file):
-        """처리된 파일 정보를 DB에 저장."""
-        RAG_DB.objects.create(file_name=os.path.basename(csv_file), file_path=csv_file)
-
-    @staticmethod
-    def get_temp_embedding_path(file_name):
-        """임시 임베딩 파일 경로를 반환합니다."""
-        if not os.path.exists(RAGProcessor.TEMP_DIR):
-            os.makedirs(RAGProcessor.TEMP_DIR)
-        return os.path.join(RAGProcessor.TEMP_DIR, f"{os.path.basename(file_name)}.pkl")
+    def refresh_query_indexes(vectorstore):
+        """
+        적재가 끝난 뒤 질의용 인덱스를 갱신합니다.
 
-    @staticmethod
-    def save_temp_embeddings(file_name, data):
-        """임베딩 데이터를 임시 파일로 저장합니다."""
-        temp_path = RAGProcessor.get_temp_embedding_path(file_name)
-        with open(temp_path, 'wb') as f:
-            pickle.dump(data, f)
+        RAG_RETRIEVER_BACKEND가 'faiss'이면 컬렉션을 FAISS 스냅샷으로 다시 내보내고,
+        적재 중 추가된 어휘 색인을 저장한 뒤, 모든 워커의 RAG 엔진을 무효화하여
+        다음 질의에서 새 데이터를 사용하게 합니다.
+        """
+        LexicalIndex.flush_writer()
+        if vectorstore is not None and settings.RAG_RETRIEVER_BACKEND == "faiss":
+            print("🔨 FAISS 스냅샷 재생성 중...")
+            path = FaissIndex.build_from_chroma(vectorstore._collection)
+            print(f"✨ FAISS 스냅샷 생성 완료: {path}")
+        RAGEngine.instance().invalidate()
 
     @staticmethod
-    def load_temp_embeddings(file_name):
-        """임시 저장된 임베딩 데이터를 로드합니다."""
-        temp_path = RAGProcessor.get_temp_embedding_path(file_name)
-        if os.path.exists(temp_path):
-            with open(temp_path, 'rb') as f:
-                return pickle.load(f)
-        return None
+    def save_processed_file_info(csv_file):
+        """처리된 파일 정보를 DB에 저장."""
+        RAG_DB.objects.create(file_name=os.path.basename(csv_file), file_path=csv_file)
 
     @staticmethod
     def process_conversation_json(conversation, existing_ids, vectorstore):
@@ -336,109 +558,394 @@ class RAGProcessor:
         Returns:
             vectorstore, new_docs (int), processed_count (int)
         """
-        new_docs = 0
+        texts, metadatas, ids, processed_count = RAGProcessor.conversation_documents(conversation)
+        vectorstore, new_docs = RAGProcessor.add_conversation_documents(
+            vectorstore, texts, metadatas, ids, existing_ids
+        )
+        return vectorstore, new_docs, processed_count
+
+    @staticmethod
+    def conversation_documents(conversation, source_file=None):
+        """
+        대화 JSON의 utterance 텍스트를 Chroma에 저장할 (texts, metadatas, ids)로 만듭니다.
+
+        메타데이터에는 출처(source_file: 원본 파일, conversation: 대화 ID, utterance: 발화 순번)를 남깁니다.
+        ID는 텍스트와 source의 내용 해시(content_id)라 다시 적재해도 같은 발화는 건너뜁니다.
+        이전 버전은 프로세스마다 값이 바뀌는 hash()로 ID를 만들었으므로, 그때 적재한 컬렉션과는
+        ID가 맞지 않습니다. 업그레이드 후 한 번은 컬렉션을 비우고 다시 적재해야 중복이 생기지 않습니다.
+
+        Returns:
+            texts, metadatas, ids, processed_count (int)
+        """
         processed_count = 0
-        texts = []
-        metadatas = []
+        texts, metadatas, ids = [], [], []
+        info = conversation.get("info", {})
+        source = info.get("source", "json")
+        conversation_id = info.get("id")
+        if conversation_id is None and source_file:
+            conversation_id = os.path.splitext(os.path.basename(source_file))[0]
         # 예시: 각 utterance는 "text" 필드를 포함한 dict라고 가정
-        for utter in conversation.get("utterances", []):
+        for index, utter in enumerate(conversation.get("utterances", [])):
             text = utter.get("text", "").strip()
             if not text:
                 continue
-            doc_id = hash(text)  # 단순 해시 사용; 실제 환경에서는 더 안전한 방법 사용 권장
-            if doc_id in existing_ids:
-                continue
+            processed_count += 1
+            # 내용 해시 ID (hash()는 프로세스마다 값이 달라 재적재 시 중복 확인에 쓸 수 없음)
+            doc_id = RAGProcessor.content_id(text, {"source": source})
+            metadata = {"source": source, "doc_id": doc_id, "utterance": index}
+            if conversation_id is not None:
+                metadata["conversation"] = str(conversation_id)
+            if source_file:
+                metadata["source_file"] = source_file
             texts.append(text)
-            metadata = {
-                "source": conversation.get("info", {}).get("source", "json"),
-                "doc_id": doc_id
-            }
             metadatas.append(metadata)
-            new_docs += 1
-            processed_count += 1
-        
+            ids.append(doc_id)
+        return texts, metadatas, ids, processed_count
+
+    @staticmethod
+    def process_conversation_files(json_files, existing_ids, vectorstore, parser=None):
+        """
+        대화 JSON 파일들을 파일 경계와 관계없이 RAG_BULK_JSON_BATCH_DOCS개 발화씩 모아 적재합니다.
+
+        파일마다 조회/임베딩/쓰기를 하면 작은 파일이 많을 때 왕복 횟수가 파일 수만큼 늘어나므로,
+        여러 파일의 발화를 한 배치로 모아 기존 문서 조회 1번, 토큰 기준으로 묶은 임베딩 요청
+        (EmbeddingScheduler), 쓰기 1번으로 처리합니다. 임베딩과 쓰기는 IngestionPipeline으로 겹쳐 실행하고,
+        배치를 쓸 때 그 배치에 들어 있던 파일들을 완료로 기록합니다.
+        parser(ParallelParser)를 주면 파일 읽기/디코딩을 프로세스 풀에서 실행합니다.
+
+        Returns:
+            vectorstore, new_docs (int), processed_count (int, 발화 수)
+        """
+        batch_docs = settings.RAG_BULK_JSON_BATCH_DOCS
+        if vectorstore is None:
+            vectorstore = RAGProcessor.open_vectorstore(RAGProcessor.DB_DIR)
+        if parser is not None:
+            parsed = parser.map(parse_conversation_file, ((file_path,) for file_path in json_files))
+        else:
+            parsed = (parse_conversation_file(file_path) for file_path in json_files)
+        processed = [0]
+
+        def batches():
+            texts, metadatas, ids, files = [], [], [], []
+            batch_index = 0
+            for file_path, file_texts, file_metadatas, file_ids, count, skipped in tqdm(
+                parsed, total=len(json_files), desc="JSON 파일 처리"
+            ):
+                if skipped:
+                    # 유효하지 않은 JSON 파일은 건너뜁니다.
+                    report_file_status(file_path, "skipped", error=skipped)
+                    continue
+                report_file_started(file_path)
+                report_progress(file_path, rows=count)
+                processed[0] += count
+                texts += file_texts
+                metadatas += file_metadatas
+                ids += file_ids
+                files.append(file_path)
+                if len(texts) >= batch_docs:
+                    yield RAGProcessor._conversation_batch(vectorstore, batch_index, texts, metadatas, ids, files, existing_ids)
+                    texts, metadatas, ids, files = [], [], [], []
+                    batch_index += 1
+            if files:
+                yield RAGProcessor._conversation_batch(vectorstore, batch_index, texts, metadatas, ids, files, existing_ids)
+
+        def checkpoint(batch):
+            new_docs = Counter(metadata.get("source_file") for metadata in batch.metadatas)
+            for file_path in batch.extra["files"]:
+                report_progress(file_path, new_docs=new_docs.get(file_path, 0))
+                report_file_status(file_path, "done")
+
+        pipeline = IngestionPipeline(
+            embed=lambda batch: RAGProcessor.create_embeddings(batch.texts) if batch.texts else [],
+            write=lambda batch, embeddings: RAGProcessor.update_chroma_db(
+                vectorstore, batch.texts, embeddings, batch.metadatas, batch.ids, RAGProcessor.DB_DIR
+            ) if batch.texts else None,
+            checkpoint=checkpoint
+        )
+        new_docs = pipeline.run(batches())
+        return vectorstore, new_docs, processed[0]
+
+    @staticmethod
+    def _conversation_batch(vectorstore, index, texts, metadatas, ids, files, existing_ids):
+        """여러 파일의 발화에서 이미 적재된 문서를 한 번에 제외하고 IngestBatch로 만듭니다."""
+        texts, metadatas, ids = RAGProcessor.filter_new_documents(vectorstore, texts, metadatas, ids, existing_ids)
+        print(f"📦 JSON 배치 {index}: 파일 {len(files)}개, 새 발화 {len(texts)}개")
+        return IngestBatch(index, texts, metadatas, ids, extra={"files": files})
+
+    @staticmethod
+    def add_conversation_documents(vectorstore, texts, metadatas, ids, existing_ids):
+        """
+        이미 적재된 문서를 제외하고 나머지를 임베딩하여 vectorstore에 추가합니다.
+
+        Returns:
+            vectorstore, new_docs (int)
+        """
+        texts, metadatas, ids = RAGProcessor.filter_new_documents(vectorstore, texts, metadatas, ids, existing_ids)
         if texts:
-            # vectorstore에 텍스트와 메타데이터 추가 (메서드 명칭은 실제 구현에 맞게 수정)
-            vectorstore.add_texts(texts, metadatas)
-        
-        return vectorstore, new_docs, processed_count
+            if vectorstore is None:
+                vectorstore = RAGProcessor.open_vectorstore(RAGProcessor.DB_DIR)
+            # 임베딩은 캐시(CachedEmbeddings)를 거치므로 이미 계산한 텍스트는 다시 요청하지 않음
+            ids = vectorstore.add_texts(texts, metadatas, ids=ids)
+            if settings.RAG_LEXICAL_INDEX:
+                LexicalIndex.writer().add_documents(ids, texts, metadatas)
+        return vectorstore, len(texts)
+
+@dataclass
+class RAGAnswer:
+    """LLM 응답 텍스트와 프롬프트 토큰 통계(PackedContext.stats())."""
+    text: str
+    stats: dict
+
 
 class RAGQuery:
+    @staticmethod
+    def parse_emotions(value):
+        """요청의 emotions 값(리스트 또는 쉼표로 구분된 문자열)을 리스트로 변환합니다."""
+        if not value:
+            return None
+        if isinstance(value, str):
+            value = value.split(',')
+        emotions = [str(e).strip() for e in value if str(e).strip()]
+        return emotions or None
+
     @staticmethod
     def create_qa_chain():
-        """공유된 DB_DIR을 사용하여 QA 체인 생성"""
-        db_dir = RAGProcessor.DB_DIR
-        vectorstore = Chroma(
-            persist_directory=db_dir,
-            embedding_function=OpenAIEmbeddings(
-                model="text-embedding-3-small"
-            ),
-            collection_name="korean_dialogue"
-        )
-        
-        # 필터 제거하고 테스트
-        retriever = vectorstore.as_retriever(
-            search_kwargs={"k": 10},  # 상위 10개 결과
-            filter={"emotion": "happy"},
-        )
-        
-        # 디버깅을 위한 컬렉션 정보 출력
-        print(f"컬렉션 내 문서 수: {vectorstore._collection.count()}")
-        
-        llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=1.1
+        """프로세스 전역 RAG 엔진에서 리트리버와 QA 체인을 가져옵니다.
+
+        Chroma, 임베딩 클라이언트, LLM, 프롬프트는 워커당 한 번만 로드되며,
+        이후 호출은 로드된 객체를 그대로 재사용합니다.
+        """
+        state = RAGEngine.instance().get()
+        return state.retriever, state.chain
+
+    @staticmethod
+    def prepare(question: str, chat_room=None, retriever=None, emotions=None) -> PackedContext:
+        """
+        프롬프트에 넣을 대화 히스토리와 리트리브된 문맥을 토큰 예산 안으로 묶습니다.
+
+        emotions(감정 값 리스트)가 주어지면 해당 감정의 파티션에서만 문맥을 검색합니다.
+        """
+        # 채팅방의 최근 대화 히스토리 (턴 수/토큰 예산 제한, 방별 캐시)
+        with timed("history"):
+            history_lines = ChatHistoryProvider.instance().get_lines(chat_room)
+
+        # 벡터스토어에서 추가적인 문서(대화 관련 문맥) 가져오기 (embed/search 단계는 리트리버에서 계측)
+        if retriever is None:
+            retriever, _ = RAGQuery.create_qa_chain()
+        retrieved_docs = retriever.invoke(question, emotions=emotions)
+
+        with timed("prompt"):
+            packed = pack_context(question, history_lines, retrieved_docs)
+        RAGQuery.report(packed)
+        return packed
+
+    @staticmethod
+    def build_inputs(question: str, chat_room=None, retriever=None, emotions=None):
+        """prepare()로 묶은 결과를 QA 체인 입력(dict)으로 반환합니다."""
+        return RAGQuery.prepare(question, chat_room, retriever, emotions).as_inputs()
+
+    @staticmethod
+    async def aprepare(question: str, chat_room=None, retriever=None, emotions=None) -> PackedContext:
+        """prepare의 비동기 버전. 히스토리 조회와 벡터 검색을 동시에 수행합니다."""
+        if retriever is None:
+            retriever, _ = await RAGQuery.acreate_qa_chain()
+
+        async def load_history():
+            with timed("history"):
+                return await sync_to_async(ChatHistoryProvider.instance().get_lines)(chat_room)
+
+        history_lines, retrieved_docs = await asyncio.gather(
+            load_history(),
+            retriever.ainvoke(question, emotions=emotions)
         )
+        with timed("prompt"):
+            packed = pack_context(question, history_lines, retrieved_docs)
+        RAGQuery.report(packed)
+        return packed
 
-        # 프롬프트 템플릿 수정: 채팅 히스토리와 리트리브된 문서를 별도의 키로 전달
-        template = """Given the chat history and the retrieved context, rephrase the partner's harsh message into a gentle, warm, and loving tone that fits naturally into your ongoing conversation.
-        
-        Chat History:
-        {chat_history}
-        
-        Retrieved Context:
-        {retrieved_context}
-        
-        Partner's harsh message:
-        {question}
-        
-        Instructions:
-          1. Carefully analyze the chat history to grasp the emotional cues.
-          2. Incorporate relevant context from the retrieved documents.
-          3. Rephrase the partner's message, keeping its original meaning while softening the tone into a caring and respectful manner.
-          4. Provide three alternative rephrasings separated by pipes (|).
-          5. Each alternative should be concise (aim for around 15 words) and crafted for a loving conversation.
-          6. (Important) Whatever the language of the Chat History and Retrieved Context is, always respond in the same language as the harsh message "{question}"!!
-        
-        Response Format:
-        Alternative1 | Alternative2 | Alternative3
+    @staticmethod
+    async def abuild_inputs(question: str, chat_room=None, retriever=None, emotions=None):
+        """build_inputs의 비동기 버전."""
+        return (await RAGQuery.aprepare(question, chat_room, retriever, emotions)).as_inputs()
+
+    @staticmethod
+    def report(packed: PackedContext):
+        """요청별 프롬프트 토큰 사용량을 현재 Trace에 기록합니다. (RAG_PROMPT_TOKEN_BUDGET 조정용)"""
+        logger.debug("Chat History: %s", packed.chat_history)
+        logger.debug("Retrieved Context: %s", packed.retrieved_context)
+        trace = current_trace()
+        if trace is not None:
+            trace.add_tokens(history_tokens=packed.history_tokens, context_tokens=packed.context_tokens)
+            trace.set(
+                documents_used=packed.documents_used, duplicates_dropped=packed.duplicates_dropped,
+                documents_over_budget=packed.documents_over_budget
+            )
+
+    @staticmethod
+    async def acreate_qa_chain():
+        """create_qa_chain의 비동기 버전."""
+        state = await RAGEngine.instance().aget()
+        return state.retriever, state.chain
+
+    @staticmethod
+    def get_answer(question: str, chat_room=None, emotions=None):
         """
-        
-        prompt = ChatPromptTemplate.from_template(template)
-        chain = prompt | llm
-        
-        return retriever, chain
+        질문(상대의 거친 메시지)을 다정한 말투 3가지로 바꾼 응답을 생성합니다.
+
+        chat_room이 주어지면 해당 채팅방의 최근 대화만 히스토리로 사용하고,
+        emotions가 주어지면 해당 감정의 파티션에서만 문맥을 검색합니다.
+        """
+        return RAGQuery.answer(question, chat_room, emotions).text
 
     @staticmethod
-    def get_answer(question: str):
-        # chat_message 테이블(모델)에서 대화 히스토리 가져오기
-        from chat.models import Message
+    def answer(question: str, chat_room=None, emotions=None) -> RAGAnswer:
+        """get_answer와 같은 응답을 프롬프트 토큰 통계와 함께 반환합니다."""
+        with traced("rag.answer"):
+            retriever, chain = RAGQuery.create_qa_chain()
+            packed = RAGQuery.prepare(question, chat_room, retriever, emotions)
+            with timed("llm"):
+                result = chain.invoke(packed.as_inputs())
+            record_usage(result)
+        return RAGAnswer(text=result.content, stats=RAGQuery.answer_stats(packed, result))
 
-        # 시간순으로 정렬된 전체 채팅 메시지로 대화 맥락 구성
-        messages = Message.objects.all().order_by('created_at')
-        chat_history = "\n".join([f"{msg.user}: {msg.input_content}" for msg in messages])
+    @staticmethod
+    async def aget_answer(question: str, chat_room=None, emotions=None):
+        """get_answer의 비동기 버전. 요청을 처리하는 동안 워커 스레드를 점유하지 않습니다."""
+        return (await RAGQuery.aanswer(question, chat_room, emotions)).text
 
-        # 벡터스토어에서 추가적인 문서(대화 관련 문맥) 가져오기
-        retriever, chain = RAGQuery.create_qa_chain()
-        retrieved_docs = retriever.invoke(question)
-        retrieved_context = "\n".join([doc.page_content for doc in retrieved_docs])
+    @staticmethod
+    async def aanswer(question: str, chat_room=None, emotions=None) -> RAGAnswer:
+        """answer의 비동기 버전."""
+        with traced("rag.answer"):
+            retriever, chain = await RAGQuery.acreate_qa_chain()
+            packed = await RAGQuery.aprepare(question, chat_room, retriever, emotions)
+            with timed("llm"):
+                result = await chain.ainvoke(packed.as_inputs())
+            record_usage(result)
+        return RAGAnswer(text=result.content, stats=RAGQuery.answer_stats(packed, result))
 
-        print(f"Chat History: {chat_history}")
-        print(f"Retrieved Context: {retrieved_context}")
-        result = chain.invoke({
-            "chat_history": chat_history,
-            "retrieved_context": retrieved_context,
-            "question": question
-        })
-        return result.content
+    @staticmethod
+    def answer_stats(packed: PackedContext, result) -> dict:
+        """프롬프트 묶음 통계에 LLM이 보고한 프롬프트/완성 토큰 수를 더합니다."""
+        stats = packed.stats()
+        usage = getattr(result, "usage_metadata", None) or {}
+        stats["prompt_tokens"] = usage.get("input_tokens")
+        stats["completion_tokens"] = usage.get("output_tokens")
+        return stats
+
+    @staticmethod
+    def stream_answer(question: str, chat_room=None, emotions=None, trace=None):
+        """
+        get_answer와 같은 응답을 LLM이 생성하는 대로 조각(str) 단위로 내보냅니다.
+
+        제너레이터는 호출한 쪽의 컨텍스트에서 실행되므로, Trace는 인자로 받거나 새로 만들고
+        yield 사이 구간에서만 활성화합니다. 직접 만든 Trace만 끝날 때 기록합니다.
+        """
+        owns_trace = trace is None
+        trace = trace or Trace("rag.stream")
+        with use_trace(trace):
+            retriever, chain = RAGQuery.create_qa_chain()
+            inputs = RAGQuery.build_inputs(question, chat_room, retriever, emotions)
+        error = None
+        started = time.perf_counter()
+        first_chunk = None
+        try:
+            for chunk in chain.stream(inputs):
+                if first_chunk is None:
+                    first_chunk = time.perf_counter()
+                with use_trace(trace):
+                    record_usage(chunk)
+                if chunk.content:
+                    yield chunk.content
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            trace.add_stage("llm", time.perf_counter() - started)
+            if first_chunk is not None:
+                trace.set(llm_first_chunk_ms=round((first_chunk - started) * 1000, 2))
+            if owns_trace:
+                trace.finish(error=error)
 
+    @staticmethod
+    async def abatch_answer(questions: List[str], chat_room=None, emotions=None, max_concurrency=None):
+        """
+        여러 질문을 한 번에 다정한 말투로 바꿉니다. (모더레이션/리플레이 도구용 일괄 처리)
+
+        - 모든 질문을 한 번의 배치 임베딩 호출로 임베딩하고
+        - 벡터 검색은 같은 emotions 단위로 한 번의 search_many로 수행하며
+        - LLM 호출은 chain.abatch로 max_concurrency개까지 동시에 보냅니다.
+
+        questions의 각 항목은 문자열 또는 {"question": str, "emotions": [...]} 입니다.
+
+        Returns:
+            list: 입력 순서대로 {"answer": str, "stats": dict} 또는 {"error": str}
+        """
+        max_concurrency = max_concurrency or settings.RAG_BATCH_MAX_CONCURRENCY
+        results = [None] * len(questions)
+        items = []  # (index, question, emotions)
+        for index, item in enumerate(questions):
+            if isinstance(item, dict):
+                question = item.get('question')
+                item_emotions = RAGQuery.parse_emotions(item.get('emotions')) or emotions
+            else:
+                question, item_emotions = item, emotions
+            if not isinstance(question, str) or not question.strip():
+                results[index] = {'error': '질문이 필요합니다.'}
+                continue
+            items.append((index, question, item_emotions))
+        if not items:
+            return results
+
+        with traced("rag.batch") as trace:
+            trace.set(batch_size=len(items))
+            state = await RAGEngine.instance().aget()
+
+            async def load_history():
+                with timed("history"):
+                    return await sync_to_async(ChatHistoryProvider.instance().get_lines)(chat_room)
+
+            async def embed_all():
+                with timed("embed"):
+                    return await state.embeddings.aembed_documents([question for _, question, _ in items])
+
+            history_lines, vectors = await asyncio.gather(load_history(), embed_all())
+
+            # 같은 emotions를 가진 질문끼리 묶어 한 번에 검색
+            groups = {}
+            for position, (_, _, item_emotions) in enumerate(items):
+                groups.setdefault(tuple(item_emotions or ()), []).append(position)
+            documents = [None] * len(items)
+            for key, positions in groups.items():
+                found = await asyncio.to_thread(
+                    state.retriever.search_batch,
+                    [items[p][1] for p in positions],
+                    [vectors[p] for p in positions],
+                    list(key) or None
+                )
+                for position, docs in zip(positions, found):
+                    documents[position] = docs
+
+            with timed("prompt"):
+                packed = [
+                    pack_context(question, history_lines, documents[position])
+                    for position, (_, question, _) in enumerate(items)
+                ]
+
+            with timed("llm"):
+                answers = await state.chain.abatch(
+                    [p.as_inputs() for p in packed],
+                    config={"max_concurrency": max_concurrency},
+                    return_exceptions=True
+                )
+
+            failed = 0
+            for (index, _, _), p, answer in zip(items, packed, answers):
+                if isinstance(answer, Exception):
+                    failed += 1
+                    results[index] = {'error': str(answer)}
+                    continue
+                record_usage(answer)
+                results[index] = {'answer': answer.content, 'stats': RAGQuery.answer_stats(p, answer)}
+            trace.set(failed=failed)
+        return results
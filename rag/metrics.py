@@ -0,0 +1,223 @@
+"""
+다정모드 파이프라인의 단계별 지연 시간/토큰 계측.
+
+요청 하나를 Trace로 묶고, 각 단계를 timed(stage)로 감싸 단조(monotonic) 타이머로 잽니다.
+    with traced("json_drf"):
+        with timed("history"): ...
+        with timed("llm"): ...
+
+- 바깥쪽 traced()가 끝나면 단계별 시간과 토큰 수를 'rag.metrics' 로거에 JSON 한 줄로 남깁니다.
+  안쪽에서 다시 traced()를 호출하면 바깥 Trace를 그대로 사용합니다 (뷰 -> MessageTranslator -> RAGQuery).
+- 같은 값은 프로세스 내 히스토그램(MetricsRegistry)에도 누적되어 /api/rag/metrics/에서 조회할 수 있습니다.
+- 현재 Trace는 contextvars로 전달되므로 asyncio 태스크와 asyncio.to_thread에서도 이어집니다.
+  직접 스레드 풀에 작업을 넘길 때는 contextvars.copy_context().run으로 감싸야 합니다.
+
+단계 이름:
+    history, semantic_cache, embed, search, lexical_search, prompt, llm
+"""
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("rag.metrics")
+
+# 히스토그램 버킷 상한 (지연: ms, 토큰: 개)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets, unit):
+        self.buckets = buckets
+        self.unit = unit
+        self.counts = [0] * (len(buckets) + 1)  # 마지막은 +Inf
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """버킷 상한으로 추정한 q 분위수 (관측 최댓값을 넘지 않음)."""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(upper, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'unit': self.unit,
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'buckets': {
+                **{str(upper): count for upper, count in zip(self.buckets, self.counts)},
+                '+Inf': self.counts[-1],
+            },
+        }
+
+
+class MetricsRegistry:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    @classmethod
+    def instance(cls):
+        """프로세스 전역 히스토그램 저장소를 반환합니다."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS_MS, unit="ms"):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(buckets, unit)
+            histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: histogram.snapshot() for name, histogram in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+class Trace:
+    """요청 하나의 단계별 소요 시간(ms)과 토큰 수."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.tokens = {}
+        self.fields = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000
+
+    def add_tokens(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                if value is not None:
+                    self.tokens[key] = self.tokens.get(key, 0) + int(value)
+
+    def set(self, **fields):
+        with self._lock:
+            self.fields.update(fields)
+
+    def finish(self, error=None):
+        """Trace를 마치고 구조화 로그와 히스토그램에 기록합니다."""
+        total_ms = (time.perf_counter() - self.started) * 1000
+        registry = MetricsRegistry.instance()
+        registry.observe(f"{self.name}.total", total_ms)
+        for stage, ms in self.stages.items():
+            registry.observe(f"stage.{stage}", ms)
+        for key, value in self.tokens.items():
+            registry.observe(f"tokens.{key}", value, TOKEN_BUCKETS, "tokens")
+
+        record = {
+            'trace': self.name,
+            'total_ms': round(total_ms, 2),
+            'stages_ms': {stage: round(ms, 2) for stage, ms in self.stages.items()},
+            'tokens': self.tokens,
+            **self.fields,
+        }
+        if error is not None:
+            record['error'] = type(error).__name__
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace):
+    """이미 만들어 둔 Trace를 현재 컨텍스트의 Trace로 지정합니다 (제너레이터 안에서 구간별 사용)."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def traced(name):
+    """
+    요청 단위 Trace를 시작합니다. 이미 진행 중인 Trace가 있으면 그것을 그대로 사용하고,
+    가장 바깥쪽에서만 끝날 때 기록합니다.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        yield trace
+        return
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.finish(error=e)
+        raise
+    else:
+        trace.finish()
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def timed(stage):
+    """구간의 소요 시간을 현재 Trace의 stage에 더합니다. Trace가 없으면 히스토그램에만 기록합니다."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(stage, seconds)
+        else:
+            MetricsRegistry.instance().observe(f"stage.{stage}", seconds * 1000)
+
+
+def record_usage(message):
+    """LLM 응답(AIMessage)의 usage_metadata에서 프롬프트/완성 토큰 수를 현재 Trace에 기록합니다."""
+    usage = getattr(message, "usage_metadata", None)
+    trace = _current_trace.get()
+    if not usage or trace is None:
+        return
+    trace.add_tokens(
+        prompt_tokens=usage.get("input_tokens"),
+        completion_tokens=usage.get("output_tokens")
+    )
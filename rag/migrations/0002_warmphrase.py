@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-17 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WarmPhrase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phrase_key', models.CharField(max_length=64)),
+                ('text', models.TextField()),
+                ('normalized_text', models.TextField()),
+                ('options', models.JSONField()),
+                ('frequency', models.PositiveIntegerField(default=0)),
+                ('version', models.CharField(max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='warmphrase',
+            index=models.Index(fields=['version', '-frequency'], name='rag_warm_phrase_version_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='warmphrase',
+            constraint=models.UniqueConstraint(fields=('version', 'phrase_key'), name='rag_warm_phrase_version_key_uniq'),
+        ),
+    ]
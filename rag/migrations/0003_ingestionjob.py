@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-17 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0002_warmphrase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('csv', 'CSV 파일 적재'), ('json', '대화 JSON 한 건 적재'), ('bulk_json', '대화 JSON 파일 일괄 적재')], max_length=16)),
+                ('status', models.CharField(choices=[('queued', '대기'), ('running', '실행 중'), ('succeeded', '완료'), ('failed', '실패'), ('cancelled', '취소됨')], default='queued', max_length=16)),
+                ('params', models.JSONField(default=dict)),
+                ('progress', models.JSONField(default=dict)),
+                ('result', models.JSONField(default=dict)),
+                ('error', models.TextField(blank=True, default='')),
+                ('cancel_requested', models.BooleanField(default=False)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ingestionjob',
+            index=models.Index(fields=['status', 'created_at'], name='rag_ingest_job_status_idx'),
+        ),
+    ]
@@ -20,3 +20,74 @@ class RAG_DB(models.Model):
     def __str__(self):
         return self.file_name
     
+
+# 자주 들어오는 거친 메시지에 대해 미리 생성해 둔 다정모드 옵션 (manage.py mine_warm_phrases)
+class WarmPhrase(models.Model):
+    phrase_key = models.CharField(max_length=64)  # 정규화된 문장의 sha256 (rag.warm_phrases.phrase_key)
+    text = models.TextField()  # 대표 원문
+    normalized_text = models.TextField()
+    options = models.JSONField()  # 3가지 다정한 표현
+    frequency = models.PositiveIntegerField(default=0)  # 마이닝 시점의 등장 횟수
+    version = models.CharField(max_length=32)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['version', 'phrase_key'], name='rag_warm_phrase_version_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['version', '-frequency'], name='rag_warm_phrase_version_idx'),
+        ]
+
+    def __str__(self):
+        return f"[{self.version}] {self.text[:50]}"
+
+
+# 백그라운드 적재 작업 (setup API가 등록하고 manage.py rag_worker가 실행, rag/jobs.py)
+class IngestionJob(models.Model):
+    KIND_CSV = 'csv'
+    KIND_JSON = 'json'
+    KIND_BULK_JSON = 'bulk_json'
+    KIND_CHOICES = [
+        (KIND_CSV, 'CSV 파일 적재'),
+        (KIND_JSON, '대화 JSON 한 건 적재'),
+        (KIND_BULK_JSON, '대화 JSON 파일 일괄 적재'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, '대기'),
+        (STATUS_RUNNING, '실행 중'),
+        (STATUS_SUCCEEDED, '완료'),
+        (STATUS_FAILED, '실패'),
+        (STATUS_CANCELLED, '취소됨'),
+    ]
+    FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED)
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    params = models.JSONField(default=dict)  # 파일 패턴 또는 대화 JSON
+    progress = models.JSONField(default=dict)  # 파일별 진행 상황 {"files": {경로: {...}}}
+    result = models.JSONField(default=dict)  # 처리 파일 수, 새 문서 수, 총 문서 수
+    error = models.TextField(blank=True, default='')
+    cancel_requested = models.BooleanField(default=False)
+    attempts = models.PositiveIntegerField(default=0)  # 실행(재개 포함) 횟수
+    worker = models.CharField(max_length=100, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # 실행 중인 워커가 주기적으로 갱신
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='rag_ingest_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"[{self.kind}] #{self.pk} {self.status}"
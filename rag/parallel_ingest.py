@@ -0,0 +1,180 @@
+"""
+적재 시 파싱/정규화/분할을 여러 프로세스로 나누어 실행합니다 (RAG_INGEST_PARALLEL_PARSE).
+
+    CSV 원시 행 읽기 (메인) ──▶ 프로세스 풀: Document 생성 -> 분할 -> 정규화/내용 해시 ID ──▶ 순서대로 반환
+        ──▶ IngestionPipeline (임베딩 스레드 -> 쓰기 스레드 1개, Chroma 컬렉션은 쓰기 스레드만 사용)
+
+- 메인 프로세스는 csv.reader로 원시 행만 청크 단위로 읽어 넘기고(C 구현이라 가벼움), 행마다 문자열을 만들고
+  분할하고 해시를 계산하는 작업은 워커 프로세스가 나누어 합니다. 대화 JSON은 파일 단위로 읽기/디코딩까지 워커가 합니다.
+- 결과는 제출 순서대로 돌려주므로 청크 번호, 체크포인트, 내용 해시 ID가 순차 적재와 같습니다.
+- 동시에 넘겨 둔 작업 수를 제한하여(RAG_INGEST_PARSE_MAX_PENDING) 쓰기가 밀리면 읽기도 멈춥니다.
+
+워커는 spawn으로 시작하므로(적재 작업의 하트비트 스레드 등이 있는 프로세스를 fork하지 않음) 시작 시 Django를 설정합니다.
+"""
+import csv
+import json
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+def parse_workers():
+    return settings.RAG_INGEST_PARSE_WORKERS or os.cpu_count() or 1
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def iter_csv_row_chunks(csv_file, chunk_rows=None):
+    """
+    CSV 파일을 (헤더, 원시 행 리스트, 시작 행 번호)로 chunk_rows 행씩 읽는 제너레이터.
+    CSVLoader(csv.DictReader)와 같이 빈 줄은 건너뛰고 행 번호를 매깁니다.
+    """
+    chunk_rows = chunk_rows or settings.RAG_INGEST_CHUNK_ROWS
+    with open(csv_file, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        start, rows = 0, []
+        for row in reader:
+            if not row:
+                continue
+            rows.append(row)
+            if len(rows) >= chunk_rows:
+                yield header, rows, start
+                start, rows = start + len(rows), []
+        if rows:
+            yield header, rows, start
+
+
+def row_document(csv_file, header, row, row_index, metadata_columns=("emotion",)):
+    """
+    CSVLoader(file_path=csv_file, metadata_columns=['emotion'])가 만드는 것과 같은 Document.
+    내용 해시 ID가 본문 형식에 달려 있으므로 순차/병렬 적재 모두 이 함수로 Document를 만듭니다.
+    """
+    # csv.DictReader와 같은 방식으로 열 이름을 붙임 (남는 값은 None 키, 모자란 열은 None)
+    values = dict(zip(header, row))
+    if len(row) > len(header):
+        values[None] = row[len(header):]
+    else:
+        for key in header[len(row):]:
+            values[key] = None
+    content = "\n".join(
+        f"""{k.strip() if k is not None else k}: {v.strip()
+        if isinstance(v, str) else ','.join(map(str.strip, v))
+        if isinstance(v, list) else v}"""
+        for k, v in values.items()
+        if k not in metadata_columns
+    )
+    metadata = {"source": str(csv_file), "row": row_index}
+    for col in metadata_columns:
+        if col not in values:
+            raise ValueError(f"Metadata column '{col}' not found in CSV file.")
+        metadata[col] = values[col]
+    return Document(page_content=content, metadata=metadata)
+
+
+def csv_chunk_documents(csv_file, header, rows, start_row):
+    """iter_csv_row_chunks가 읽은 원시 행 청크를 Document 리스트로 만듭니다."""
+    return [row_document(csv_file, header, row, start_row + i) for i, row in enumerate(rows)]
+
+
+def parse_csv_chunk(csv_file, header, rows, start_row):
+    """
+    원시 행 청크를 분할하고 Chroma에 저장할 (texts, metadatas, ids)로 만듭니다 (워커 프로세스에서 실행).
+
+    Returns:
+        (texts, metadatas, ids, 행 수)
+    """
+    from .method import RAGProcessor
+
+    docs = csv_chunk_documents(csv_file, header, rows, start_row)
+    splits = RAGProcessor.split_documents(docs)
+    texts, metadatas, ids = RAGProcessor.prepare_data_for_chroma(splits)
+    return texts, metadatas, ids, len(rows)
+
+
+def parse_conversation_file(file_path):
+    """
+    대화 JSON 파일 하나를 읽어 (texts, metadatas, ids)로 만듭니다 (워커 프로세스에서 실행).
+
+    Returns:
+        (file_path, texts, metadatas, ids, 발화 수, 건너뛴 이유 또는 None)
+    """
+    from .method import RAGProcessor
+
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            conversation = json.load(f)
+    except ValueError:
+        return file_path, [], [], [], 0, "유효하지 않은 JSON"
+    except OSError as e:
+        # 지워졌거나 읽을 수 없는 파일 하나 때문에 작업 전체를 멈추지 않음
+        return file_path, [], [], [], 0, f"파일을 읽을 수 없음: {e.strerror or e}"
+    # 필수 키 체크: info와 utterances 필요
+    if not isinstance(conversation, dict) or not {"info", "utterances"}.issubset(conversation.keys()):
+        return file_path, [], [], [], 0, "info/utterances 키 없음"
+    texts, metadatas, ids, processed_count = RAGProcessor.conversation_documents(conversation, source_file=file_path)
+    return file_path, texts, metadatas, ids, processed_count, None
+
+
+class ParallelParser:
+    """
+    파싱 작업을 프로세스 풀에 넘기고 제출 순서대로 결과를 돌려줍니다.
+
+        with ParallelParser() as parser:
+            for result in parser.map(parse_csv_chunk, chunks):
+                ...
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or parse_workers()
+        self.max_pending = max_pending or settings.RAG_INGEST_PARSE_MAX_PENDING or self.workers * 2
+        self._pool = None
+
+    def __enter__(self):
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+        logger.info("병렬 파싱 워커 %d개 시작", self.workers)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 오류로 빠져나가면 아직 시작하지 않은 작업은 취소
+        self._pool.shutdown(wait=True, cancel_futures=exc_type is not None)
+        self._pool = None
+
+    def map(self, fn, items):
+        """
+        items의 각 원소(인자 튜플)로 fn을 실행하고 결과를 입력 순서대로 내놓는 제너레이터.
+        최대 max_pending개까지만 미리 제출합니다.
+        """
+        pending = deque()
+        items = iter(items)
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < self.max_pending:
+                try:
+                    args = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append(self._pool.submit(fn, *args))
+            if not pending:
+                return
+            yield pending.popleft().result()
@@ -0,0 +1,70 @@
+"""
+emotion 메타데이터 기준 Chroma 파티션(감정별 하위 컬렉션).
+
+적재 시 korean_dialogue 컬렉션에 쓰는 행을 emotion 값별 하위 컬렉션에도 함께 씁니다.
+질의에서 감정을 지정하면 전체 HNSW 그래프를 후처리 필터링하는 대신 해당 감정의
+작은 그래프만 검색합니다.
+
+파티션 컬렉션 이름은 Chroma 이름 규칙(영문/숫자)을 지키기 위해 emotion 값의 해시를 사용하고,
+실제 emotion 값은 컬렉션 메타데이터에 기록합니다.
+"""
+import hashlib
+from collections import defaultdict
+
+from .constants import COLLECTION_NAME
+
+PARTITION_PREFIX = f"{COLLECTION_NAME}__e_"
+
+
+def partition_name(emotion: str) -> str:
+    return PARTITION_PREFIX + hashlib.md5(emotion.encode("utf-8")).hexdigest()[:12]
+
+
+def group_by_emotion(embeddings, documents, metadatas, ids):
+    """행들을 emotion 값별로 묶습니다. emotion이 없는 행은 제외합니다."""
+    groups = defaultdict(lambda: ([], [], [], []))
+    for embedding, document, metadata, doc_id in zip(embeddings, documents, metadatas, ids):
+        emotion = (metadata or {}).get("emotion")
+        if not emotion:
+            continue
+        group = groups[emotion]
+        group[0].append(embedding)
+        group[1].append(document)
+        group[2].append(metadata)
+        group[3].append(doc_id)
+    return groups
+
+
+def get_partition(client, emotion):
+    return client.get_or_create_collection(
+        name=partition_name(emotion),
+        metadata={"emotion": emotion, "partition_of": COLLECTION_NAME},
+        embedding_function=None
+    )
+
+
+def add_to_partitions(client, embeddings, documents, metadatas, ids):
+    """행들을 emotion별 파티션 컬렉션에 추가합니다."""
+    for emotion, (p_embeddings, p_documents, p_metadatas, p_ids) in group_by_emotion(
+        embeddings, documents, metadatas, ids
+    ).items():
+        get_partition(client, emotion).add(
+            embeddings=p_embeddings,
+            documents=p_documents,
+            metadatas=p_metadatas,
+            ids=p_ids
+        )
+
+
+def list_partitions(client) -> dict:
+    """{emotion: collection} 형태로 기존 파티션을 반환합니다."""
+    partitions = {}
+    for name in client.list_collections():
+        name = str(name)
+        if not name.startswith(PARTITION_PREFIX):
+            continue
+        collection = client.get_collection(name, embedding_function=None)
+        emotion = (collection.metadata or {}).get("emotion")
+        if emotion:
+            partitions[emotion] = collection
+    return partitions
@@ -0,0 +1,113 @@
+"""
+임베딩과 벡터스토어 쓰기를 겹쳐 실행하는 적재 파이프라인.
+
+    읽기/분할/임베딩 (스레드 풀, 최대 embed_workers개 배치 동시) ──▶ 순서 큐 (최대 max_pending개) ──▶ 쓰기 스레드 1개
+
+- 배치는 제출 순서대로 큐에 들어가고 쓰기 스레드는 큐 순서대로 결과를 기다려 쓰므로,
+  임베딩이 끝나는 순서와 관계없이 항상 배치 번호 순서로 저장됩니다.
+- 쓰기 스레드가 배치 N을 저장하는 동안 다음 배치들의 임베딩이 진행되므로 처리량이
+  (임베딩 시간 + 쓰기 시간)의 합이 아니라 둘 중 느린 쪽에 가까워집니다.
+- 큐 크기가 제한되어 있어 쓰기가 밀리면 읽기/임베딩도 멈추므로 메모리 사용량이 일정합니다.
+- 배치를 쓸 때마다 checkpoint(batch)를 호출하여 중단 후 다시 실행할 때 이어서 진행할 수 있게 합니다.
+- 임베딩/쓰기 스레드는 run()을 호출한 컨텍스트를 복사해 실행하므로 Trace, 적재 작업 진행 보고가 그대로 이어집니다.
+"""
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
+
+from django.conf import settings
+
+_DONE = object()
+
+
+@dataclass
+class IngestBatch:
+    index: int
+    texts: List[str]
+    metadatas: List[dict]
+    ids: List[str]
+    extra: dict = field(default_factory=dict)
+
+
+class IngestionPipeline:
+    def __init__(
+        self,
+        embed: Callable[[IngestBatch], object],
+        write: Callable[[IngestBatch, object], None],
+        checkpoint: Optional[Callable[[IngestBatch], None]] = None,
+        embed_workers: int = None,
+        max_pending: int = None
+    ):
+        self.embed = embed
+        self.write = write
+        self.checkpoint = checkpoint
+        self.embed_workers = embed_workers or settings.RAG_INGEST_EMBED_WORKERS
+        self.max_pending = max_pending or settings.RAG_INGEST_MAX_PENDING_BATCHES
+        self.written_batches = 0
+        self.written_rows = 0
+        self._error = None
+
+    def run(self, batches: Iterable[IngestBatch]):
+        """
+        배치를 모두 임베딩하고 순서대로 씁니다. 어느 단계에서든 예외가 나면 남은 배치를 멈추고 다시 발생시킵니다.
+
+        Returns:
+            쓴 행 수
+        """
+        pending = queue.Queue(maxsize=self.max_pending)
+        writer = threading.Thread(
+            target=contextvars.copy_context().run, args=(self._write_loop, pending),
+            name="rag-ingest-writer", daemon=True
+        )
+        writer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.embed_workers, thread_name_prefix="rag-ingest-embed") as pool:
+                for batch in batches:
+                    if self._error is not None:
+                        break
+                    self._put(pending, (batch, pool.submit(contextvars.copy_context().run, self.embed, batch)))
+        except BaseException as e:
+            self._error = self._error or e
+        finally:
+            self._put(pending, _DONE, force=True)
+            writer.join()
+        if self._error is not None:
+            raise self._error
+        return self.written_rows
+
+    def _put(self, pending, item, force=False):
+        """큐가 가득 차면 기다리되, 쓰기 스레드가 실패했으면 더 넣지 않습니다."""
+        while True:
+            if self._error is not None and not force:
+                return
+            try:
+                pending.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if self._error is not None:
+                    # 쓰기 스레드가 멈췄으므로 종료 신호를 넣을 자리를 만듦
+                    try:
+                        pending.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def _write_loop(self, pending):
+        while True:
+            item = pending.get()
+            if item is _DONE:
+                return
+            if self._error is not None:
+                continue
+            batch, future = item
+            try:
+                embeddings = future.result()
+                self.write(batch, embeddings)
+                if self.checkpoint is not None:
+                    self.checkpoint(batch)
+                self.written_batches += 1
+                self.written_rows += len(batch.ids)
+            except BaseException as e:
+                self._error = e
@@ -0,0 +1,143 @@
+"""
+질의용 스냅샷의 압축(양자화) 벡터 저장과 float32 재채점.
+
+- 'float16': 벡터를 float16으로 저장 (메모리 1/2)
+- 'int8'   : 벡터마다 max|v|/127 스케일을 두고 int8로 저장 (메모리 약 1/4)
+
+1차 검색은 압축 벡터로 전체를 훑어 상위 k * RAG_QUANTIZATION_RESCORE_FACTOR개 후보를 고르고,
+후보만 메모리 매핑된 float32 원본 벡터로 정확한 내적을 다시 계산해 상위 k개를 돌려줍니다.
+원본 float32 벡터는 디스크에 있고 후보 행만 읽으므로 상주 메모리는 압축 벡터 크기에 가깝습니다.
+
+적재 시 선택: RAGProcessor.update_chroma_db(..., quantization=...) 또는 RAG_VECTOR_QUANTIZATION
+질의 시 선택: RAG_QUERY_QUANTIZATION ('auto'면 압축 벡터 사용, 'float32'면 원본으로 정확 검색)
+"""
+import numpy as np
+from django.conf import settings
+
+MODES = ("none", "float16", "int8")
+SCAN_CHUNK_ROWS = 65536
+
+
+def validate_mode(mode):
+    if mode not in MODES:
+        raise ValueError(f"지원하지 않는 양자화 방식입니다: {mode} (가능한 값: {', '.join(MODES)})")
+    return mode
+
+
+def quantize(vectors, mode):
+    """
+    정규화된 float32 벡터를 압축합니다.
+
+    Returns:
+        (codes, scales): int8이 아니면 scales는 None
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if mode == "float16":
+        return vectors.astype(np.float16), None
+    if mode == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"압축하지 않는 방식입니다: {mode}")
+
+
+def bytes_per_vector(dim, mode):
+    return {"none": 4 * dim, "float16": 2 * dim, "int8": dim + 4}[mode]
+
+
+def save_codes(prefix, codes, scales):
+    np.save(f"{prefix}.codes.npy", codes)
+    if scales is not None:
+        np.save(f"{prefix}.scales.npy", scales)
+
+
+class QuantizedIndex:
+    """
+    압축 벡터 전체 스캔 + float32 재채점 인덱스. faiss 인덱스와 같은 search(queries, k) 형식을 가집니다.
+
+    codes가 float32이면(질의 시 'float32' 선택) 재채점 없이 정확 검색이고,
+    rescore_factor가 1이면 압축 점수만으로 순위를 매깁니다.
+    vectors/row_map은 재채점용 원본 float32 벡터와 (파티션일 때) 로컬 -> 전체 행 번호 매핑입니다.
+    """
+
+    def __init__(self, codes, scales=None, vectors=None, row_map=None, rescore_factor=None):
+        self.codes = codes
+        self.scales = scales
+        self.vectors = vectors
+        self.row_map = row_map
+        self.rescore_factor = rescore_factor or settings.RAG_QUANTIZATION_RESCORE_FACTOR
+
+    @property
+    def ntotal(self):
+        return len(self.codes)
+
+    @property
+    def rescoring(self):
+        return self.codes.dtype != np.float32 and self.vectors is not None and self.rescore_factor > 1
+
+    @classmethod
+    def load(cls, prefix, vectors, row_map=None):
+        codes = np.load(f"{prefix}.codes.npy", mmap_mode="r")
+        try:
+            scales = np.load(f"{prefix}.scales.npy", mmap_mode="r")
+        except FileNotFoundError:
+            scales = None
+        return cls(codes, scales, vectors, row_map)
+
+    @classmethod
+    def exact_over(cls, vectors, row_map=None):
+        """원본 float32 벡터를 그대로 훑는 정확 검색 인덱스."""
+        codes = vectors if row_map is None else np.asarray(vectors[np.asarray(row_map)])
+        return cls(codes, None, None, None)
+
+    def search(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float32)
+        n = self.ntotal
+        if not n:
+            return np.full((len(queries), k), -np.inf, np.float32), np.full((len(queries), k), -1, np.int64)
+        candidates = min(n, k * self.rescore_factor if self.rescoring else k)
+        scores, rows = self._scan(queries, candidates)
+        if self.rescoring:
+            scores, rows = self._rescore(queries, rows, k)
+        return self._pad(scores, rows, k)
+
+    def _scan(self, queries, candidates):
+        """압축 벡터를 청크 단위로 훑으며 질의별 상위 후보를 유지합니다."""
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), 0), -1, dtype=np.int64)
+        for start in range(0, self.ntotal, SCAN_CHUNK_ROWS):
+            chunk = np.asarray(self.codes[start:start + SCAN_CHUNK_ROWS], dtype=np.float32)
+            scores = queries @ chunk.T
+            if self.scales is not None:
+                scores *= np.asarray(self.scales[start:start + SCAN_CHUNK_ROWS])[None, :]
+            rows = np.broadcast_to(np.arange(start, start + len(chunk), dtype=np.int64), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            if best_scores.shape[1] > candidates:
+                keep = np.argpartition(-best_scores, candidates - 1, axis=1)[:, :candidates]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+    def _rescore(self, queries, rows, k):
+        """후보 행만 float32 원본으로 다시 채점합니다."""
+        global_rows = rows if self.row_map is None else np.asarray(self.row_map)[rows]
+        scores = np.empty(rows.shape, dtype=np.float32)
+        for i, query in enumerate(queries):
+            order = np.argsort(global_rows[i])  # 메모리 매핑 파일을 순서대로 읽도록 정렬
+            exact = np.asarray(self.vectors[global_rows[i][order]], dtype=np.float32) @ query
+            scores[i, order] = exact
+        top = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, top, axis=1), np.take_along_axis(rows, top, axis=1)
+
+    @staticmethod
+    def _pad(scores, rows, k):
+        if scores.shape[1] >= k:
+            return scores[:, :k], rows[:, :k]
+        pad = k - scores.shape[1]
+        return (
+            np.pad(scores, ((0, 0), (0, pad)), constant_values=-np.inf),
+            np.pad(rows, ((0, 0), (0, pad)), constant_values=-1)
+        )
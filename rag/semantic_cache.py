@@ -0,0 +1,130 @@
+"""
+다정모드 3가지 변환 결과에 대한 의미 기반(semantic) 응답 캐시.
+
+질의 임베딩을 키로 저장해 두고, 새 질의와의 코사인 유사도가 RAG_SEMANTIC_CACHE_THRESHOLD 이상이며
+채팅방의 최근 맥락 지문(fingerprint)이 같은 항목이 있으면 LLM 호출 없이 저장된 결과를 돌려줍니다.
+
+- 맥락 지문은 최근 RAG_SEMANTIC_CACHE_CONTEXT_TURNS개(기본 2) 대화로 계산하므로 대화 흐름이 다른 채팅방끼리는
+  결과를 공유하지 않습니다. 0으로 설정하면 맥락 구분을 끄고 모든 채팅방(다른 커플 사이에서도)이 결과를 공유합니다.
+- 항목은 RAG_SEMANTIC_CACHE_TTL 초 후 만료되고, RAG_SEMANTIC_CACHE_MAX_ENTRIES를 넘으면
+  가장 오래 사용되지 않은 항목부터 제거됩니다.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+
+def context_fingerprint(history_lines, turns=None) -> int:
+    """최근 대화 줄 목록으로 맥락 지문(64비트 정수)을 계산합니다."""
+    turns = settings.RAG_SEMANTIC_CACHE_CONTEXT_TURNS if turns is None else turns
+    recent = history_lines[-turns:] if turns > 0 else []
+    digest = hashlib.sha1("\n".join(recent).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+class SemanticResponseCache:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, threshold=None, ttl=None, max_entries=None):
+        self.threshold = settings.RAG_SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.ttl = ttl or settings.RAG_SEMANTIC_CACHE_TTL
+        self.max_entries = max_entries or settings.RAG_SEMANTIC_CACHE_MAX_ENTRIES
+        self._lock = threading.Lock()
+        self._vectors = None  # (max_entries, dim) 정규화된 임베딩
+        self._fingerprints = np.zeros(self.max_entries, dtype=np.int64)
+        self._expires_at = np.zeros(self.max_entries, dtype=np.float64)
+        self._active = np.zeros(self.max_entries, dtype=bool)
+        self._options = [None] * self.max_entries
+        self._lru = OrderedDict()  # slot -> None (사용 순서)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def instance(cls):
+        """프로세스 전역 응답 캐시를 반환합니다."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector, fingerprint):
+        """유사한 질의의 저장된 결과(옵션 리스트)를 반환합니다. 없으면 None."""
+        query = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            candidates = self._active & (self._fingerprints == fingerprint) & (self._expires_at > now)
+            if not candidates.any():
+                self.misses += 1
+                return None
+            scores = self._vectors @ query
+            scores[~candidates] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            return list(self._options[slot])
+
+    def store(self, vector, fingerprint, options):
+        """질의 임베딩과 맥락 지문에 대한 변환 결과를 저장합니다."""
+        query = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self._reset(query.shape[0])
+            slot = self._free_slot()
+            self._vectors[slot] = query
+            self._fingerprints[slot] = fingerprint
+            self._expires_at[slot] = time.monotonic() + self.ttl
+            self._active[slot] = True
+            self._options[slot] = list(options)
+            self._lru[slot] = None
+            self._lru.move_to_end(slot)
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._active[:] = False
+            self._options = [None] * self.max_entries
+            self._lru.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'entries': int(self._active.sum()),
+        }
+
+    def _reset(self, dim):
+        self._vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._active[:] = False
+        self._options = [None] * self.max_entries
+        self._lru.clear()
+
+    def _free_slot(self):
+        """빈 슬롯을 반환합니다. 없으면 만료된 항목, 그 다음 가장 오래 사용되지 않은 항목을 비웁니다."""
+        free = np.flatnonzero(~self._active)
+        if free.size:
+            return int(free[0])
+        expired = np.flatnonzero(self._expires_at <= time.monotonic())
+        slot = int(expired[0]) if expired.size else next(iter(self._lru))
+        self._active[slot] = False
+        self._lru.pop(slot, None)
+        return slot
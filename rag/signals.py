@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from chat.models import Message
+from .history import ChatHistoryProvider
+
+
+@receiver(post_save, sender=Message)
+def append_message_to_history(sender, instance, created, **kwargs):
+    """새 메시지를 채팅방 히스토리 캐시에 증분 반영합니다."""
+    if created:
+        ChatHistoryProvider.instance().append(instance)
+    else:
+        ChatHistoryProvider.instance().forget(instance.chat_room_id)
+
+
+@receiver(post_delete, sender=Message)
+def forget_room_history(sender, instance, **kwargs):
+    """메시지가 삭제되면 해당 채팅방의 히스토리 캐시를 버립니다."""
+    ChatHistoryProvider.instance().forget(instance.chat_room_id)
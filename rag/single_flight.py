@@ -0,0 +1,168 @@
+"""
+같은 요청의 동시 실행을 하나로 합치는 single-flight 계층.
+
+연속 전송이나 타임아웃 후 재시도로 같은 다정모드 요청이 동시에 여러 번 들어오면, 처음 들어온
+요청(리더)만 임베딩/LLM을 호출하고 나머지(팔로워)는 그 결과를 기다려 함께 받습니다.
+
+- 키는 (채팅방, 정규화된 입력, 히스토리 지문)으로 만듭니다 (flight_key).
+- 프로세스 내에서는 항상 합치고, RAG_SINGLE_FLIGHT_SHARED가 켜져 있으면 Django 캐시를
+  잠금 테이블로 사용해 다른 워커와도 합칩니다. (워커 간 공유에는 Redis/DB 캐시처럼
+  프로세스 간에 공유되는 CACHES 백엔드가 필요합니다.)
+- 리더가 실패하면 팔로워는 각자 다시 계산합니다.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .embedding_cache import normalize_text
+from .semantic_cache import context_fingerprint
+
+LOCK_PREFIX = "rag:flight:lock:"
+RESULT_PREFIX = "rag:flight:result:"
+POLL_INTERVAL = 0.05
+
+
+def flight_key(room_id, input_content, history_lines, *extra) -> str:
+    """(채팅방, 정규화된 입력, 히스토리 지문, 추가 구분값)으로 요청 키를 만듭니다."""
+    fingerprint = context_fingerprint(history_lines, turns=len(history_lines))
+    raw = "\x1f".join(map(str, (room_id, normalize_text(input_content), fingerprint, *extra)))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, timeout=None, shared=None):
+        self.timeout = timeout or settings.RAG_SINGLE_FLIGHT_TIMEOUT
+        self.shared = settings.RAG_SINGLE_FLIGHT_SHARED if shared is None else shared
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future
+        self.leaders = 0
+        self.followers = 0
+
+    @classmethod
+    def instance(cls):
+        """프로세스 전역 single-flight 객체를 반환합니다."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def acquire(self, key):
+        """
+        키에 대한 진행 중인 계산을 찾거나 새로 등록합니다.
+
+        Returns:
+            (future, is_leader): 리더는 계산을 마친 뒤 반드시 release()를 호출해야 합니다.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.followers += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def release(self, key, future, result=None, error=None):
+        """리더의 계산 결과(또는 예외)를 팔로워에게 전달하고 키를 해제합니다."""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        # 누군가 공유 Future를 취소했더라도 리더의 결과 전달은 실패하지 않게 함
+        if not future.set_running_or_notify_cancel():
+            return
+        if error is not None:
+            # 취소/연결 종료 같은 BaseException은 팔로워에게 일반 예외로 전달
+            future.set_exception(error if isinstance(error, Exception) else RuntimeError(repr(error)))
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """
+        fn()을 키 단위로 한 번만 실행하고 결과를 공유합니다.
+
+        Returns:
+            (result, shared): shared는 다른 요청의 결과를 받은 경우 True
+        """
+        future, leader = self.acquire(key)
+        if not leader:
+            try:
+                return future.result(timeout=self.timeout), True
+            except Exception:
+                # 리더 실패/시간 초과: 직접 계산
+                return fn(), False
+
+        try:
+            result, shared = self._run_shared(key, fn) if self.shared else (fn(), False)
+        except BaseException as e:
+            self.release(key, future, error=e)
+            raise
+        self.release(key, future, result)
+        return result, shared
+
+    async def ado(self, key, coro_fn):
+        """do()의 비동기 버전. coro_fn은 코루틴을 반환하는 함수입니다."""
+        future, leader = self.acquire(key)
+        if not leader:
+            try:
+                # 시간 초과 시 wait_for가 취소하는 것은 팔로워마다의 shield 래퍼이고 공유 Future는 그대로 둠
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout), True
+            except Exception:
+                return await coro_fn(), False
+
+        try:
+            result, shared = await self._arun_shared(key, coro_fn) if self.shared else (await coro_fn(), False)
+        except BaseException as e:
+            self.release(key, future, error=e)
+            raise
+        self.release(key, future, result)
+        return result, shared
+
+    def stats(self) -> dict:
+        return {
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'in_flight': len(self._calls),
+        }
+
+    # --- 워커 간 공유 (Django 캐시를 잠금 테이블로 사용) ---
+
+    def _run_shared(self, key, fn):
+        deadline = time.monotonic() + self.timeout
+        while not cache.add(LOCK_PREFIX + key, 1, timeout=self.timeout):
+            result = cache.get(RESULT_PREFIX + key)
+            if result is not None:
+                return result, True
+            if time.monotonic() >= deadline:
+                return fn(), False
+            time.sleep(POLL_INTERVAL)
+        try:
+            result = fn()
+            cache.set(RESULT_PREFIX + key, result, timeout=settings.RAG_SINGLE_FLIGHT_RESULT_TTL)
+            return result, False
+        finally:
+            cache.delete(LOCK_PREFIX + key)
+
+    async def _arun_shared(self, key, coro_fn):
+        deadline = time.monotonic() + self.timeout
+        while not await cache.aadd(LOCK_PREFIX + key, 1, timeout=self.timeout):
+            result = await cache.aget(RESULT_PREFIX + key)
+            if result is not None:
+                return result, True
+            if time.monotonic() >= deadline:
+                return await coro_fn(), False
+            await asyncio.sleep(POLL_INTERVAL)
+        try:
+            result = await coro_fn()
+            await cache.aset(RESULT_PREFIX + key, result, timeout=settings.RAG_SINGLE_FLIGHT_RESULT_TTL)
+            return result, False
+        finally:
+            await cache.adelete(LOCK_PREFIX + key)
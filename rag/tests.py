@@ -1,3 +1,1452 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import chromadb
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from langchain_community.document_loaders import CSVLoader
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.models import ChatRoom, Message
+from chat.services import MessageTranslator
+from .backends import ChromaBackend, FaissBackend
+from .context import pack_context
+from .embedding_cache import CachedEmbeddings, EmbeddingCache
+from .embedding_scheduler import EmbeddingScheduler, pack_batches
+from .embedding_shards import EmbeddingShardStore
+from .engine import RAGEngine, build_embeddings, check_dimensions, collection_dimensions
+from .faiss_index import FaissIndex, iter_collection
+from .fakes import HashingEmbeddings
+from .history import ChatHistoryProvider
+from .jobs import IngestionJobRunner, JobCancelled, JobProgress, _current_job
+from .lexical import LexicalIndex, LexicalIndexWriter, reciprocal_rank_fusion, tokenize
+from .method import RAGProcessor, RAGQuery
+from .metrics import Histogram, MetricsRegistry, timed, traced
+from .models import IngestionJob, WarmPhrase
+from .parallel_ingest import (
+    ParallelParser,
+    csv_chunk_documents,
+    iter_csv_row_chunks,
+    parse_conversation_file,
+    row_document,
+)
+from .partitions import list_partitions, partition_name
+from .pipeline import IngestBatch, IngestionPipeline
+from .quantization import QuantizedIndex, quantize
+from .semantic_cache import SemanticResponseCache, context_fingerprint
+from .single_flight import SingleFlight
+from .warm_phrases import WarmPhraseLibrary, normalize_phrase, phrase_key
+
+
+class RAGEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.db_dir, ignore_errors=True)
+        self.loads = 0
+        patcher = mock.patch.object(RAGEngine, "_load", autospec=True, side_effect=self.fake_load)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_load(self, engine):
+        # 실제 로드처럼 세대 마커를 기록하고, 로드마다 다른 상태 객체를 반환
+        engine._loaded_marker = engine._read_marker()
+        self.loads += 1
+        return object()
+
+    def test_get_loads_once_and_reuses_state(self):
+        engine = RAGEngine(self.db_dir)
+        self.assertFalse(engine.is_loaded)
+        state = engine.get()
+        self.assertIs(engine.get(), state)
+        self.assertEqual(self.loads, 1)
+
+    def test_reload_replaces_state(self):
+        engine = RAGEngine(self.db_dir)
+        state = engine.get()
+        reloaded = engine.reload()
+        self.assertIsNot(reloaded, state)
+        self.assertIs(engine.get(), reloaded)
+        self.assertEqual(self.loads, 2)
+
+    def test_invalidate_is_seen_by_other_workers(self):
+        worker = RAGEngine(self.db_dir)
+        with override_settings(RAG_ENGINE_RELOAD_CHECK_SECONDS=3600):
+            state = worker.get()
+            self.assertIs(worker.get(), state)  # 마커 확인 후 다음 확인은 한 시간 뒤
+            # 다른 워커 프로세스의 적재 후 무효화 (같은 DB_DIR의 세대 마커 갱신)
+            RAGEngine(self.db_dir).invalidate()
+            self.assertIs(worker.get(), state)  # 확인 주기 전에는 그대로 사용
+        worker._next_marker_check = 0.0  # 확인 주기가 지남
+        self.assertIsNot(worker.get(), state)
+        self.assertEqual(self.loads, 2)
+
+
+def fake_encoding(model=None):
+    """tiktoken 인코딩 파일을 받지 않도록 글자 하나를 토큰 하나로 세는 인코딩."""
+    return SimpleNamespace(encode=lambda text, disallowed_special=(): list(text))
+
+
+@mock.patch("rag.tokens.get_encoding", fake_encoding)
+class ChatHistoryProviderTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="a", password="pw")
+        self.room = ChatRoom.objects.create(name="방")
+        self.other_room = ChatRoom.objects.create(name="다른 방")
+        self.provider = ChatHistoryProvider(max_turns=3, max_tokens=1000, ttl=60, max_rooms=10)
+        # 시그널은 프로세스 전역 제공자에 반영하므로 테스트용 제공자로 바꿔 둠
+        patcher = mock.patch.object(ChatHistoryProvider, "_instance", self.provider)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def say(self, text, room=None):
+        return Message.objects.create(user=self.user, chat_room=room or self.room, input_content=text)
+
+    def test_recent_turns_of_the_room_only(self):
+        for i in range(5):
+            self.say(f"메시지{i}")
+        self.say("다른 방 메시지", room=self.other_room)
+        self.assertEqual(self.provider.get_lines(self.room), ["a: 메시지2", "a: 메시지3", "a: 메시지4"])
+        self.assertEqual(self.provider.get_history(None), "")
+
+    def test_token_budget_keeps_most_recent_lines(self):
+        self.say("아주 긴 첫 번째 메시지입니다")
+        self.say("둘째")
+        self.say("셋째")
+        provider = ChatHistoryProvider(max_turns=3, max_tokens=10, ttl=60, max_rooms=10)
+        self.assertEqual(provider.get_history(self.room), "a: 둘째\na: 셋째")
+
+    def test_signals_update_cached_window(self):
+        first = self.say("안녕")
+        self.assertEqual(self.provider.get_history(self.room), "a: 안녕")
+
+        # 새 메시지는 캐시된 창에 바로 추가되어 DB를 다시 읽지 않음
+        self.say("반가워")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.provider.get_history(self.room), "a: 안녕\na: 반가워")
+
+        # 수정/삭제되면 창을 버리고 다음 조회에서 다시 읽음
+        first.input_content = "안녕하세요"
+        first.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.provider.get_history(self.room), "a: 안녕하세요\na: 반가워")
+        first.delete()
+        self.assertEqual(self.provider.get_history(self.room), "a: 반가워")
+
+
+class CountingEmbeddings(Embeddings):
+    """요청받은 텍스트를 기록하는 결정적 임베딩."""
+
+    def __init__(self):
+        self.requests = []
+
+    def embed_documents(self, texts):
+        self.requests.append(list(texts))
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.path = f"{root}/cache.sqlite3"
+
+    def test_repeated_and_duplicate_texts_are_embedded_once(self):
+        underlying = CountingEmbeddings()
+        cached = CachedEmbeddings(underlying, namespace="m", cache=EmbeddingCache(path=self.path, memory_size=10))
+        self.assertEqual(cached.embed_documents(["안녕", "반가워", "안녕"]), [[2.0, 0.5], [3.0, 0.5], [2.0, 0.5]])
+        # 공백만 다른 텍스트는 같은 키
+        self.assertEqual(cached.embed_query("  안녕 "), [2.0, 0.5])
+        self.assertEqual(underlying.requests, [["안녕", "반가워"]])
+
+    def test_memory_entries_are_float32_and_disk_survives_restart(self):
+        cache = EmbeddingCache(path=self.path, memory_size=1)
+        cached = CachedEmbeddings(CountingEmbeddings(), namespace="m", cache=cache)
+        vectors = cached.embed_documents(["가", "나나"])
+        self.assertIsInstance(vectors[0], list)
+        # 메모리 LRU는 float32 배열로 보관하고 크기를 넘으면 오래된 항목부터 버림
+        self.assertEqual(len(cache._memory), 1)
+        self.assertEqual(next(iter(cache._memory.values())).dtype, np.float32)
+
+        restarted = EmbeddingCache(path=self.path, memory_size=10)
+        underlying = CountingEmbeddings()
+        self.assertEqual(CachedEmbeddings(underlying, namespace="m", cache=restarted).embed_documents(["가", "나나"]), vectors)
+        self.assertEqual(underlying.requests, [])
+        self.assertEqual(restarted.stats()["disk_hits"], 2)
+
+        # 네임스페이스(모델)가 다르면 캐시를 공유하지 않음
+        CachedEmbeddings(underlying, namespace="other", cache=restarted).embed_query("가")
+        self.assertEqual(underlying.requests, [["가"]])
+
+
+class SemanticCacheTests(SimpleTestCase):
+    def test_threshold_and_fingerprint(self):
+        cache = SemanticResponseCache(threshold=0.95, ttl=60, max_entries=4)
+        cache.store([1.0, 0.0, 0.0], 7, ["a", "b", "c"])
+        self.assertEqual(cache.lookup([1.0, 0.1, 0.0], 7), ["a", "b", "c"])  # 코사인 약 0.995
+        self.assertIsNone(cache.lookup([1.0, 0.5, 0.0], 7))  # 코사인 약 0.894
+        self.assertIsNone(cache.lookup([1.0, 0.0, 0.0], 8))  # 다른 맥락
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_entries_expire_after_ttl(self):
+        cache = SemanticResponseCache(threshold=0.9, ttl=10, max_entries=4)
+        with mock.patch("rag.semantic_cache.time.monotonic", return_value=1000.0):
+            cache.store([0.0, 1.0], 1, ["x"])
+        with mock.patch("rag.semantic_cache.time.monotonic", return_value=1009.0):
+            self.assertEqual(cache.lookup([0.0, 1.0], 1), ["x"])
+        with mock.patch("rag.semantic_cache.time.monotonic", return_value=1010.5):
+            self.assertIsNone(cache.lookup([0.0, 1.0], 1))
+
+    def test_evicts_least_recently_used(self):
+        cache = SemanticResponseCache(threshold=0.99, ttl=60, max_entries=2)
+        cache.store([1.0, 0.0], 0, ["first"])
+        cache.store([0.0, 1.0], 0, ["second"])
+        cache.lookup([1.0, 0.0], 0)
+        cache.store([1.0, 1.0], 0, ["third"])
+        self.assertEqual(cache.lookup([1.0, 0.0], 0), ["first"])
+        self.assertIsNone(cache.lookup([0.0, 1.0], 0))
+
+    def test_context_fingerprint_uses_recent_turns(self):
+        history = ["A: 안녕", "B: 응 안녕", "A: 오늘 어땠어?"]
+        self.assertEqual(context_fingerprint(history, turns=2), context_fingerprint(["다른 말"] + history[1:], turns=2))
+        self.assertNotEqual(context_fingerprint(history, turns=2), context_fingerprint(history[:2], turns=2))
+        self.assertEqual(context_fingerprint(history, turns=0), context_fingerprint([], turns=0))
+
+    def test_default_fingerprint_separates_rooms(self):
+        room_a = ["A: 어제 싸운 거 아직 서운해", "B: 미안해"]
+        room_b = ["C: 오늘 데이트 재밌었어", "D: 나도"]
+        self.assertNotEqual(context_fingerprint(room_a), context_fingerprint(room_b))
+        with override_settings(RAG_SEMANTIC_CACHE_CONTEXT_TURNS=0):
+            self.assertEqual(context_fingerprint(room_a), context_fingerprint(room_b))
+
+
+class JsonDrfStreamTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="a", password="pw")
+        ChatRoom.objects.create(name="기본 채팅방", warm_mode=True).participants.add(user)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def stream(self, chunks):
+        def stream_answer(question, chat_room=None, **kwargs):
+            yield from chunks
+
+        with mock.patch.object(RAGQuery, "stream_answer", side_effect=stream_answer), self.assertLogs("rag.metrics", "INFO"):
+            response = self.client.post(
+                "/api/v1/chat/json-drf/stream/", {"input_content": "연락 좀 해", "bypass_cache": True},
+                format="json", HTTP_ACCEPT="text/event-stream"
+            )
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            body = b"".join(response.streaming_content).decode("utf-8")
+        events = []
+        for block in body.strip().split("\n\n"):
+            event, data = block.split("\n")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+        return events
+
+    def test_options_are_sent_as_their_delimiters_arrive(self):
+        events = self.stream(["바쁘면 ", "나중에 | 연락 ", "기다릴게|", " 보고 싶어 "])
+        self.assertEqual(events, [
+            ("option", {"index": 0, "text": "바쁘면 나중에"}),
+            ("option", {"index": 1, "text": "연락 기다릴게"}),
+            ("option", {"index": 2, "text": "보고 싶어"}),
+            ("done", {"options": ["바쁘면 나중에", "연락 기다릴게", "보고 싶어"], "cached": False}),
+        ])
+
+    def test_generation_error_becomes_error_event(self):
+        def failing():
+            yield "첫 옵션 |"
+            raise RuntimeError("LLM 오류")
+
+        events = self.stream(failing())
+        self.assertEqual(events, [("option", {"index": 0, "text": "첫 옵션"}), ("error", {"error": "LLM 오류"})])
+
+    def test_requires_warm_mode(self):
+        ChatRoom.objects.update(warm_mode=False)
+        response = self.client.post("/api/v1/chat/json-drf/stream/", {"input_content": "안녕"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class JsonDrfAsyncTests(TestCase):
+    URL = "/api/v1/chat/json-drf/async/"
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="a", password="pw")
+        self.room = ChatRoom.objects.create(name="기본 채팅방", warm_mode=True)
+        self.room.participants.add(self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def post(self, data, **extra):
+        return self.client.post(self.URL, data, content_type="application/json", **extra)
+
+    def test_warm_mode_returns_generated_options(self):
+        generate = mock.AsyncMock(return_value=(["하나", "둘", "셋"], False))
+        with mock.patch.object(MessageTranslator, "agenerate", generate), self.assertLogs("rag.metrics", "INFO"):
+            response = self.post({"input_content": "연락 좀 해", "bypass_cache": "true"}, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"options": ["하나", "둘", "셋"], "cached": False})
+        self.assertEqual(generate.call_args.args, ("연락 좀 해",))
+        self.assertEqual(generate.call_args.kwargs["chat_room"], self.room)
+        self.assertFalse(generate.call_args.kwargs["use_cache"])
+
+    def test_plain_mode_stores_message(self):
+        ChatRoom.objects.update(warm_mode=False)
+        response = self.post({"input_content": "안녕"}, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["output_content"], "안녕")
+        self.assertTrue(Message.objects.filter(chat_room=self.room, input_content="안녕").exists())
+
+    def test_rejects_missing_token_invalid_json_and_get(self):
+        self.assertEqual(self.post({"input_content": "안녕"}).status_code, 401)
+        self.assertEqual(self.post("{", **self.auth).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, **self.auth).status_code, 405)
+
+
+class FaissBackendTests(SimpleTestCase):
+    EMOTIONS = ["기쁨", "슬픔", "분노"]
+
+    def setUp(self):
+        client = chromadb.EphemeralClient()
+        self.collection = client.create_collection(f"faiss-{id(self)}", embedding_function=None)
+        self.addCleanup(client.delete_collection, self.collection.name)
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.vectors = np.random.default_rng(0).normal(size=(40, 8)).astype(np.float32)
+        self.add(range(40))
+
+    def add(self, rows):
+        rows = list(rows)
+        self.collection.add(
+            ids=[f"id-{i:02d}" for i in rows],
+            embeddings=self.vectors[rows].tolist(),
+            documents=[f"문서 {i}" for i in rows],
+            metadatas=[{"emotion": self.EMOTIONS[i % 3]} for i in rows],
+        )
+
+    def build(self, **kwargs):
+        FaissIndex.build_from_chroma(self.collection, root=self.root, batch_size=16, **kwargs)
+        return FaissBackend(FaissIndex.load(self.root))
+
+    def exact(self, query, k, rows=None):
+        """코사인 유사도 기준 정답 상위 k개의 (id, 점수)."""
+        rows = np.arange(len(self.vectors)) if rows is None else np.asarray(rows)
+        normalized = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        scores = normalized[rows] @ (query / np.linalg.norm(query))
+        order = np.argsort(-scores)[:k]
+        return [f"id-{rows[i]:02d}" for i in order], scores[order]
+
+    def test_search_matches_exact_cosine_ranking(self):
+        backend = self.build()
+        self.assertEqual(backend.count(), 40)
+        queries = self.vectors[[5, 17]] + 0.05
+        for query, hits in zip(queries, backend.search_many(queries, 5)):
+            ids, scores = self.exact(query, 5)
+            self.assertEqual([doc.metadata["doc_id"] for doc, _ in hits], ids)
+            np.testing.assert_allclose([score for _, score in hits], scores, rtol=1e-5)
+        doc, _ = backend.search(queries[0], 1)[0]
+        self.assertEqual((doc.page_content, doc.metadata["emotion"]), ("문서 5", "분노"))
+
+    def test_emotion_search_uses_partition_indexes(self):
+        backend = self.build()
+        query = self.vectors[7]
+        for emotions in (["슬픔"], ["기쁨", "분노"]):
+            rows = [i for i in range(40) if self.EMOTIONS[i % 3] in emotions]
+            ids, scores = self.exact(query, 4, rows)
+            hits = backend.search(query, 4, emotions)
+            self.assertEqual([doc.metadata["doc_id"] for doc, _ in hits], ids)
+            np.testing.assert_allclose([score for _, score in hits], scores, rtol=1e-5)
+        # 파티션이 없는 감정은 결과 없음
+        self.assertEqual(backend.search(query, 4, ["없는 감정"]), [])
+
+    def test_quantized_snapshot_rescores_with_float32(self):
+        backend = self.build(quantization="int8")
+        self.assertEqual(backend.index.meta["quantization"], "int8")
+        query = self.vectors[11] + 0.05
+        for emotions, rows in ((None, None), (["슬픔"], [i for i in range(40) if i % 3 == 1])):
+            ids, scores = self.exact(query, 5, rows)
+            hits = backend.search(query, 5, emotions)
+            self.assertEqual([doc.metadata["doc_id"] for doc, _ in hits], ids)
+            np.testing.assert_allclose([score for _, score in hits], scores, rtol=1e-5)
+        with override_settings(RAG_QUERY_QUANTIZATION="float32"):
+            exact = FaissBackend(FaissIndex.load(self.root))
+        self.assertEqual([doc.metadata["doc_id"] for doc, _ in exact.search(query, 5)], self.exact(query, 5)[0])
+
+    def test_rebuild_picks_up_new_rows(self):
+        self.build()
+        self.vectors = np.vstack([self.vectors, np.ones((1, 8), dtype=np.float32)])
+        self.add([40])
+        backend = self.build()
+        self.assertEqual(backend.count(), 41)
+        self.assertEqual(backend.search(np.ones(8), 1)[0][0].metadata["doc_id"], "id-40")
+
+
+class IterCollectionTests(SimpleTestCase):
+    def setUp(self):
+        client = chromadb.EphemeralClient()
+        self.collection = client.create_collection(f"iter-{id(self)}", embedding_function=None)
+        self.addCleanup(client.delete_collection, self.collection.name)
+        self.add(range(25))
+
+    def add(self, numbers):
+        numbers = list(numbers)
+        self.collection.add(
+            ids=[f"id-{n:03d}" for n in numbers],
+            embeddings=[[float(n), 1.0] for n in numbers],
+            documents=[f"문서 {n}" for n in numbers],
+            metadatas=[{"n": n} for n in numbers],
+        )
+
+    def test_reads_every_row_once_in_id_order(self):
+        batches = list(iter_collection(self.collection, 10))
+        self.assertEqual([len(ids) for ids, *_ in batches], [10, 10, 5])
+        ids = [doc_id for batch_ids, *_ in batches for doc_id in batch_ids]
+        self.assertEqual(ids, sorted(f"id-{n:03d}" for n in range(25)))
+        for batch_ids, embeddings, documents, metadatas in batches:
+            for doc_id, embedding, document, metadata in zip(batch_ids, embeddings, documents, metadatas):
+                n = int(doc_id[3:])
+                self.assertEqual(list(embedding), [float(n), 1.0])
+                self.assertEqual((document, metadata["n"]), (f"문서 {n}", n))
+
+    def test_concurrent_writes_do_not_shift_pages(self):
+        seen = []
+        for i, (ids, *_rest) in enumerate(iter_collection(self.collection, 10, include=("documents",))):
+            seen.extend(ids)
+            if i == 0:
+                # 읽는 도중 앞쪽 ID로 문서가 추가되거나 삭제되어도 중복/누락 없이 시작 시점의 목록을 읽음
+                self.add([-1])
+                self.collection.delete(ids=["id-015"])
+        expected = [f"id-{n:03d}" for n in range(25) if n != 15]
+        self.assertEqual(seen, sorted(expected))
+
+
+class ChromaPartitionTests(SimpleTestCase):
+    EMOTIONS = ["기쁨", "슬픔", "분노"]
+
+    def setUp(self):
+        self.client = chromadb.EphemeralClient()
+        collection = self.client.create_collection(f"partitions-{id(self)}", embedding_function=None)
+        self.addCleanup(self.client.delete_collection, collection.name)
+        self.addCleanup(self.drop_partitions)
+        self.vectorstore = SimpleNamespace(_collection=collection, _client=self.client)
+        self.vectors = np.random.default_rng(1).normal(size=(12, 4)).astype(np.float32)
+
+    def drop_partitions(self):
+        for name in map(str, self.client.list_collections()):
+            if name in {partition_name(e) for e in self.EMOTIONS}:
+                self.client.delete_collection(name)
+
+    def add(self, rows):
+        rows = list(rows)
+        RAGProcessor.add_batch(
+            self.vectorstore,
+            self.vectors[rows].tolist(),
+            [f"문서 {i}" for i in rows],
+            [{"emotion": self.EMOTIONS[i % 3]} for i in rows],
+            [f"id-{i:02d}" for i in rows],
+        )
+
+    def exact(self, query, emotions, k):
+        rows = [i for i in range(len(self.vectors)) if self.EMOTIONS[i % 3] in emotions]
+        distances = ((self.vectors[rows] - query) ** 2).sum(axis=1)
+        return [f"id-{rows[i]:02d}" for i in np.argsort(distances)[:k]]
+
+    def test_partitions_are_written_only_when_enabled(self):
+        with override_settings(RAG_EMOTION_PARTITIONS=False):
+            self.add(range(6))
+        self.assertEqual(list_partitions(self.client), {})
+        with override_settings(RAG_EMOTION_PARTITIONS=True):
+            self.add(range(6, 12))
+        partitions = list_partitions(self.client)
+        self.assertEqual(set(partitions), set(self.EMOTIONS))
+        self.assertEqual(sorted(partitions["기쁨"].get(include=[])["ids"]), ["id-06", "id-09"])
+
+    def test_emotion_search_merges_partitions_and_metadata_filter(self):
+        # 기쁨/슬픔은 파티션이 있고 분노는 파티션 없이 전체 컬렉션의 메타데이터 필터로 검색
+        with override_settings(RAG_EMOTION_PARTITIONS=True):
+            self.add(i for i in range(12) if i % 3 != 2)
+        with override_settings(RAG_EMOTION_PARTITIONS=False):
+            self.add(i for i in range(12) if i % 3 == 2)
+        backend = ChromaBackend(self.vectorstore)
+        self.assertEqual(set(backend.partitions), {"기쁨", "슬픔"})
+
+        query = self.vectors[4] + 0.01
+        for emotions in (["기쁨", "분노"], ["분노"], ["슬픔"]):
+            hits = backend.search(query, 3, emotions)
+            self.assertEqual([doc.metadata["doc_id"] for doc, _ in hits], self.exact(query, emotions, 3))
+            self.assertTrue(all(doc.metadata["emotion"] in emotions for doc, _ in hits))
+        self.assertEqual(len(backend.search(query, 20)), 12)
+
+
+@override_settings(RAG_LEXICAL_MAX_DF_RATIO=1.0)
+class LexicalIndexTests(SimpleTestCase):
+    TEXTS = [
+        "오늘 너무 우울해서 아무것도 하기 싫어",
+        "친구랑 싸워서 기분이 안 좋아",
+        "시험에 합격해서 너무 기뻐",
+        "우울할 때는 산책을 해 봐",
+        "기분 전환이 필요해",
+    ]
+    EMOTIONS = ["슬픔", "분노", "기쁨", "슬픔", "불안"]
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+
+    def build(self, segment_docs):
+        writer = LexicalIndexWriter(self.path, segment_docs=segment_docs)
+        ids = [f"d{i}" for i in range(len(self.TEXTS))]
+        writer.add_documents(ids, self.TEXTS, [{"emotion": e} for e in self.EMOTIONS])
+        writer.flush()
+        return LexicalIndex.load(self.path)
+
+    def expected_scores(self, query):
+        docs = [Counter(tokenize(text)) for text in self.TEXTS]
+        n, avg = len(docs), sum(sum(d.values()) for d in docs) / len(docs)
+        scores = {}
+        for term in set(tokenize(query)):
+            df = sum(1 for d in docs if term in d)
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for i, d in enumerate(docs):
+                tf = d.get(term, 0)
+                if tf:
+                    norm = LexicalIndex.K1 * (1 - LexicalIndex.B + LexicalIndex.B * sum(d.values()) / avg)
+                    scores[f"d{i}"] = scores.get(f"d{i}", 0.0) + idf * tf * (LexicalIndex.K1 + 1) / (tf + norm)
+        return scores
+
+    def test_segmented_scores_match_single_index(self):
+        query = "우울한 기분"
+        expected = self.expected_scores(query)
+        for segment_docs in (100, 2):
+            shutil.rmtree(self.path)
+            index = self.build(segment_docs)
+            self.assertEqual(len(index.segments), 1 if segment_docs == 100 else 3)
+            hits = index.search(query, k=10)
+            self.assertEqual({doc.metadata["doc_id"] for doc, _ in hits}, set(expected))
+            for doc, score in hits:
+                self.assertAlmostEqual(score, expected[doc.metadata["doc_id"]], places=4)
+            self.assertEqual([s for _, s in hits], sorted((s for _, s in hits), reverse=True))
+
+    def test_emotion_filter_and_document_roundtrip(self):
+        index = self.build(2)
+        hits = index.search("우울", k=5, emotions=["슬픔"])
+        self.assertEqual({doc.metadata["doc_id"] for doc, _ in hits}, {"d0", "d3"})
+        doc = dict((d.metadata["doc_id"], d) for d, _ in hits)["d0"]
+        self.assertEqual(doc.page_content, self.TEXTS[0])
+        self.assertEqual(doc.metadata["emotion"], "슬픔")
+
+    @override_settings(RAG_LEXICAL_MAX_DF_RATIO=0.3)
+    def test_common_terms_are_skipped(self):
+        index = self.build(100)
+        # "너무"는 5개 중 2개 문서(40%)에 나와 제외되고 "합격"만 남음
+        hits = index.search("너무 합격", k=5)
+        self.assertEqual([doc.metadata["doc_id"] for doc, _ in hits], ["d2"])
+        # 모든 색인어가 흔하면 가장 드문 것 하나는 사용
+        self.assertTrue(index.search("너무", k=5))
+
+
+class ReciprocalRankFusionTests(SimpleTestCase):
+    @staticmethod
+    def hits(*ids):
+        return [(Document(page_content=f"본문 {i}", metadata={"doc_id": i}), 0.0) for i in ids]
+
+    def test_scores_and_order(self):
+        fused = reciprocal_rank_fusion([self.hits("a", "b", "c"), self.hits("c", "a", "d")], k=3, rrf_k=60)
+        self.assertEqual([doc.metadata["doc_id"] for doc, _ in fused], ["a", "c", "b"])
+        scores = {doc.metadata["doc_id"]: score for doc, score in fused}
+        self.assertAlmostEqual(scores["a"], 1 / 61 + 1 / 62)
+        self.assertAlmostEqual(scores["c"], 1 / 63 + 1 / 61)
+        self.assertAlmostEqual(scores["b"], 1 / 62)
+
+    def test_falls_back_to_content_without_doc_id(self):
+        plain = [(Document(page_content="같은 본문"), 1.0)]
+        fused = reciprocal_rank_fusion([plain, plain], k=5)
+        self.assertEqual(len(fused), 1)
+        self.assertAlmostEqual(fused[0][1], 2 / 61)
+
+
+@mock.patch("rag.tokens.get_encoding", fake_encoding)
+class PackContextTests(SimpleTestCase):
+    @staticmethod
+    def docs(*texts):
+        return [Document(page_content=f"content: {text}") for text in texts]
+
+    def test_question_tokens_come_out_of_the_budget(self):
+        question = "q" * 20
+        packed = pack_context(question, ["h" * 9, "i" * 9], self.docs("a" * 29, "b" * 19, "c" * 9), budget=60, history_share=0.5)
+        # 질문 20 -> 남은 40 중 히스토리 몫 20 (줄당 토큰 + 줄바꿈 1)
+        self.assertEqual(packed.question_tokens, 20)
+        self.assertEqual((packed.history_tokens, packed.history_lines, packed.history_lines_dropped), (20, 2, 0))
+        # 문맥은 남은 20: "a"*29(30)는 넘치고 "b"*19(20)가 들어가며 "c"*9(10)는 넘침
+        self.assertEqual(packed.retrieved_context, "b" * 19)
+        self.assertEqual(packed.documents_over_budget, 2)
+        self.assertEqual(packed.overflow_tokens, 40)
+        self.assertLessEqual(packed.question_tokens + packed.history_tokens + packed.context_tokens, 60)
+        stats = packed.stats()
+        self.assertEqual((stats["documents_over_budget"], stats["overflow_tokens"]), (2, 40))
+
+    def test_question_larger_than_budget_leaves_no_room(self):
+        packed = pack_context("q" * 100, ["h"], self.docs("a"), budget=50)
+        self.assertEqual((packed.history_tokens, packed.context_tokens), (0, 0))
+        self.assertEqual((packed.history_lines_dropped, packed.documents_over_budget), (1, 1))
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_followers_share_leader_result(self):
+        flight = SingleFlight(timeout=1.0, shared=False)
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return "결과"
+
+        async def main():
+            return await asyncio.gather(*(flight.ado("k", work) for _ in range(3)))
+
+        results = asyncio.run(main())
+        self.assertEqual(len(runs), 1)
+        self.assertEqual([r for r, _ in results], ["결과"] * 3)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True])
+
+    def test_follower_timeout_does_not_break_leader(self):
+        """팔로워가 시간 초과로 빠져도 공유 Future가 취소되지 않아 리더는 정상적으로 결과를 전달해야 함."""
+        flight = SingleFlight(timeout=0.2, shared=False)
+
+        async def slow():
+            await asyncio.sleep(0.5)
+            return "v"
+
+        async def main():
+            return await asyncio.gather(*(flight.ado("k", slow) for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(main())
+        for result in results:
+            self.assertNotIsInstance(result, BaseException)
+        self.assertEqual([r for r, _ in results], ["v"] * 3)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_leader_error_propagates_and_followers_recompute(self):
+        flight = SingleFlight(timeout=1.0, shared=False)
+        calls = []
+
+        async def flaky():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return "ok"
+
+        async def main():
+            return await asyncio.gather(*(flight.ado("k", flaky) for _ in range(2)), return_exceptions=True)
+
+        leader, follower = asyncio.run(main())
+        self.assertIsInstance(leader, RuntimeError)
+        self.assertEqual(follower, ("ok", False))
+
+    def test_release_after_cancel_is_ignored(self):
+        flight = SingleFlight(timeout=1.0, shared=False)
+        future, leader = flight.acquire("k")
+        self.assertTrue(leader)
+        future.cancel()
+        flight.release("k", future, "v")  # InvalidStateError가 나면 안 됨
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+
+class HashingEmbeddingsTests(SimpleTestCase):
+    def test_deterministic_unit_vectors_close_for_similar_text(self):
+        embeddings = HashingEmbeddings(size=64)
+        a, b, c = map(np.array, embeddings.embed_documents(["오늘 너무 피곤해", "오늘 너무 피곤하다", "주말에 여행 가자"]))
+        np.testing.assert_array_equal(a, embeddings.embed_query("오늘 너무 피곤해"))
+        self.assertAlmostEqual(float(np.linalg.norm(a)), 1.0, places=5)
+        self.assertGreater(a @ b, a @ c)
+
+
+@mock.patch("rag.tokens.get_encoding", fake_encoding)
+class RagBenchmarkTests(TestCase):
+    def test_small_offline_run(self):
+        out = io.StringIO()
+        # 적재/검색 단계의 print와 tqdm 진행 표시는 명령의 stdout/stderr를 거치지 않음
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()), \
+                self.assertLogs("rag", "INFO"), self.assertLogs("rag.metrics", "INFO"):
+            call_command("rag_benchmark", sizes="200", queries=3, llm_latency=0, json=True, stdout=out, stderr=io.StringIO())
+        result = json.loads(out.getvalue().splitlines()[-1])
+        self.assertEqual((result["size"], result["documents"]), (200, 200))
+        for key in ("ingest_docs_per_sec", "retrieval_p50_ms", "query_p99_ms", "max_rss_mb"):
+            self.assertGreater(result[key], 0)
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        patcher = mock.patch.object(MetricsRegistry, "_instance", self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_histogram_percentiles_use_bucket_bounds(self):
+        histogram = Histogram((10, 100, 1000), "ms")
+        for value in [1, 2, 3, 50, 60, 70, 80, 90, 500, 2000]:
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["buckets"], {"10": 3, "100": 5, "1000": 1, "+Inf": 1})
+        self.assertEqual((snapshot["p50"], snapshot["p95"], snapshot["min"], snapshot["max"]), (100, 2000, 1, 2000))
+
+    def test_nested_traces_are_recorded_once(self):
+        with self.assertLogs("rag.metrics", "INFO") as logs, traced("json_drf") as outer:
+            with traced("warm_mode") as inner, timed("history"):
+                inner.add_tokens(prompt_tokens=120, completion_tokens=None)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIs(inner, outer)
+        with timed("llm"):
+            pass  # Trace 밖의 단계는 히스토그램에만 기록
+        snapshot = self.registry.snapshot()
+        self.assertEqual(set(snapshot), {"json_drf.total", "stage.history", "stage.llm", "tokens.prompt_tokens"})
+        self.assertEqual(snapshot["tokens.prompt_tokens"]["unit"], "tokens")
+        self.assertEqual(snapshot["tokens.prompt_tokens"]["max"], 120)
+
+    def test_metrics_endpoint_returns_and_resets_histograms(self):
+        with self.assertLogs("rag.metrics", "INFO"), traced("rag.answer"), timed("search"):
+            pass
+        response = self.client.get("/api/rag/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["stage.search"]["count"], 1)
+        self.assertEqual(self.client.delete("/api/rag/metrics/").status_code, 204)
+        self.assertEqual(self.client.get("/api/rag/metrics/").json(), {})
+
+
+@mock.patch("rag.tokens.get_encoding", fake_encoding)
+class BatchAnswerTests(SimpleTestCase):
+    def test_embeds_once_and_searches_once_per_emotion_group(self):
+        embeddings = mock.Mock()
+        embeddings.aembed_documents = mock.AsyncMock(side_effect=lambda texts: [[float(i)] for i in range(len(texts))])
+        retriever = mock.Mock()
+        retriever.search_batch.side_effect = lambda queries, vectors, emotions: [
+            [Document(page_content=f"문맥 {query}")] for query in queries
+        ]
+        chain = mock.Mock()
+        chain.abatch = mock.AsyncMock(return_value=[
+            AIMessage(content="a | b | c"), RuntimeError("시간 초과"), AIMessage(content="d | e | f")
+        ])
+        engine = SimpleNamespace(aget=mock.AsyncMock(return_value=SimpleNamespace(
+            embeddings=embeddings, retriever=retriever, chain=chain
+        )))
+        questions = ["왜 이래", {"question": "늦지 마", "emotions": ["분노"]}, " ", "연락 좀 해"]
+        with mock.patch.object(RAGEngine, "instance", return_value=engine), self.assertLogs("rag.metrics", "INFO"):
+            results = asyncio.run(RAGQuery.abatch_answer(questions, emotions=["슬픔"], max_concurrency=2))
+
+        embeddings.aembed_documents.assert_awaited_once_with(["왜 이래", "늦지 마", "연락 좀 해"])
+        self.assertEqual([call.args for call in retriever.search_batch.call_args_list], [
+            (["왜 이래", "연락 좀 해"], [[0.0], [2.0]], ["슬픔"]),
+            (["늦지 마"], [[1.0]], ["분노"]),
+        ])
+        inputs = chain.abatch.call_args.args[0]
+        self.assertEqual([i["question"] for i in inputs], ["왜 이래", "늦지 마", "연락 좀 해"])
+        self.assertIn("문맥 늦지 마", inputs[1]["retrieved_context"])
+        self.assertEqual(chain.abatch.call_args.kwargs["config"], {"max_concurrency": 2})
+        self.assertEqual([r.get("answer") for r in results], ["a | b | c", None, None, "d | e | f"])
+        self.assertEqual((results[1]["error"], results[2]["error"]), ("시간 초과", "질문이 필요합니다."))
+        self.assertIn("context_tokens", results[0]["stats"])
+
+
+class RAGBatchQueryViewTests(TestCase):
+    URL = "/api/rag/query/batch/"
+
+    def post(self, data):
+        return self.client.post(self.URL, data, content_type="application/json")
+
+    @override_settings(RAG_BATCH_MAX_CONCURRENCY=8)
+    def test_results_keep_input_order_and_report_failures(self):
+        room = ChatRoom.objects.create(name="방")
+        answers = [{"answer": '"괜찮아"', "stats": {}}, {"error": "질문이 필요합니다."}, {"answer": "고마워\\", "stats": {}}]
+        batch = mock.AsyncMock(return_value=answers)
+        with mock.patch.object(RAGQuery, "abatch_answer", batch):
+            response = self.post({
+                "questions": ["왜 이래", "", {"question": "늦지 마", "emotions": ["분노"]}],
+                "chat_room_id": room.pk, "emotions": "슬픔, 불안", "max_concurrency": 100,
+            })
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([r["index"] for r in body["results"]], [0, 1, 2])
+        self.assertEqual(body["results"][0]["answer"], "괜찮아")
+        self.assertEqual(body["results"][2]["answer"], "고마워")
+        self.assertEqual((body["succeeded"], body["failed"]), (2, 1))
+        kwargs = batch.call_args.kwargs
+        self.assertEqual((kwargs["chat_room"], kwargs["emotions"]), (room, ["슬픔", "불안"]))
+        self.assertEqual(kwargs["max_concurrency"], 8)  # 설정의 상한으로 제한
+
+    @override_settings(RAG_BATCH_MAX_ITEMS=2)
+    def test_rejects_invalid_requests(self):
+        self.assertEqual(self.post({"questions": []}).status_code, 400)
+        self.assertEqual(self.post({"questions": ["a", "b", "c"]}).status_code, 400)
+        self.assertEqual(self.post({"questions": ["a"], "max_concurrency": "많이"}).status_code, 400)
+        self.assertEqual(self.post({"questions": ["a"], "chat_room_id": 999}).status_code, 404)
+
+
+class WarmPhraseLibraryTests(TestCase):
+    def add(self, text, options, version):
+        return WarmPhrase.objects.create(
+            phrase_key=phrase_key(text), text=text, normalized_text=normalize_phrase(text),
+            options=options, frequency=10, version=version
+        )
+
+    def setUp(self):
+        old = self.add("너 또 늦었네", ["예전 옵션"], "v1")
+        WarmPhrase.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=1))
+        self.add("너 또 늦었네", ["많이 기다렸어", "무슨 일 있었어?", "다음엔 미리 말해 줘"], "v2")
+
+    def test_latest_version_matches_normalized_text(self):
+        library = WarmPhraseLibrary(reload_seconds=60)
+        self.assertEqual(normalize_phrase("  너 또   늦었네?! "), "너 또 늦었네")
+        self.assertEqual(library.lookup("너 또 늦었네?!"), ["많이 기다렸어", "무슨 일 있었어?", "다음엔 미리 말해 줘"])
+        self.assertIsNone(library.lookup("오늘 고마웠어"))
+        self.assertEqual(WarmPhraseLibrary(version="v1", reload_seconds=60).lookup("너 또 늦었네"), ["예전 옵션"])
+        stats = library.stats()
+        self.assertEqual((stats["version"], stats["entries"], stats["hits"], stats["misses"]), ("v2", 1, 1, 1))
+
+    def test_reloads_after_invalidate(self):
+        library = WarmPhraseLibrary(reload_seconds=60)
+        self.assertIsNone(library.lookup("연락 좀 해"))
+        self.add("연락 좀 해", ["연락 기다릴게", "바빴어?", "보고 싶었어"], "v2")
+        with self.assertNumQueries(0):
+            self.assertIsNone(library.lookup("연락 좀 해"))  # 다시 읽기 전까지는 메모리의 항목만 사용
+        library.invalidate()
+        self.assertEqual(library.lookup("연락 좀 해"), ["연락 기다릴게", "바빴어?", "보고 싶었어"])
+
+
+class QuantizedIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        vectors = rng.normal(size=(500, 32)).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.queries = self.vectors[:5] + rng.normal(scale=0.1, size=(5, 32)).astype(np.float32)
+
+    def exact(self, k, rows=None):
+        rows = np.arange(len(self.vectors)) if rows is None else rows
+        scores = self.queries @ self.vectors[rows].T
+        top = np.argsort(-scores, axis=1)[:, :k]
+        return rows[top], np.take_along_axis(scores, top, axis=1)
+
+    def test_rescoring_returns_exact_float32_ranking_and_scores(self):
+        expected_rows, expected_scores = self.exact(10)
+        for mode in ("float16", "int8"):
+            codes, scales = quantize(self.vectors, mode)
+            self.assertEqual(codes.dtype, np.float16 if mode == "float16" else np.int8)
+            scores, rows = QuantizedIndex(codes, scales, self.vectors, rescore_factor=4).search(self.queries, 10)
+            np.testing.assert_array_equal(rows, expected_rows)
+            np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+    def test_scores_are_approximate_without_rescoring(self):
+        codes, scales = quantize(self.vectors, "int8")
+        scores, rows = QuantizedIndex(codes, scales, self.vectors, rescore_factor=1).search(self.queries, 10)
+        exact = np.take_along_axis(self.queries @ self.vectors.T, rows, axis=1)
+        error = np.abs(scores - exact).max()
+        self.assertGreater(error, 0)
+        self.assertLess(error, 0.05)
+
+    def test_partition_rows_are_rescored_against_shared_vectors(self):
+        row_map = np.arange(0, 500, 5)
+        codes, scales = quantize(self.vectors[row_map], "int8")
+        index = QuantizedIndex(codes, scales, self.vectors, row_map=row_map, rescore_factor=4)
+        scores, local_rows = index.search(self.queries, 5)
+        expected_rows, expected_scores = self.exact(5, row_map)
+        np.testing.assert_array_equal(row_map[local_rows], expected_rows)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+    def test_pads_when_fewer_rows_than_k(self):
+        codes, scales = quantize(self.vectors[:3], "float16")
+        scores, rows = QuantizedIndex(codes, scales, self.vectors[:3]).search(self.queries[:1], 5)
+        self.assertEqual(rows[0, 3:].tolist(), [-1, -1])
+        self.assertTrue(np.isneginf(scores[0, 3:]).all())
+
+
+@override_settings(RAG_EMBEDDINGS_FACTORY=None, RAG_EMBEDDING_MODEL="text-embedding-3-small", RAG_EMBEDDING_DIMENSIONS=None)
+class EmbeddingDimensionTests(SimpleTestCase):
+    def test_model_default_and_reduced_dimensions(self):
+        self.assertEqual(check_dimensions(1536, "컬렉션"), 1536)
+        self.assertIsNone(check_dimensions(None, "빈 컬렉션"))
+        with override_settings(RAG_EMBEDDING_DIMENSIONS=256):
+            self.assertEqual(check_dimensions(256, "컬렉션"), 256)
+            with self.assertRaisesMessage(ImproperlyConfigured, "reproject_embeddings --dimensions 256"):
+                check_dimensions(1536, "컬렉션")
+
+    def test_unknown_dimensions_with_custom_factory_are_not_checked(self):
+        with override_settings(RAG_EMBEDDINGS_FACTORY="rag.fakes.hashing_embeddings"):
+            self.assertEqual(check_dimensions(64, "컬렉션"), 64)
+
+    @override_settings(
+        RAG_EMBEDDINGS_FACTORY="rag.fakes.hashing_embeddings", RAG_FAKE_EMBEDDING_SIZE=128,
+        RAG_EMBEDDING_DIMENSIONS=32, RAG_EMBEDDING_CACHE_ENABLED=True,
+    )
+    def test_reduced_embeddings_use_their_own_cache_namespace(self):
+        embeddings = build_embeddings()
+        self.assertEqual(embeddings.namespace, "rag.fakes.hashing_embeddings:32")
+        self.assertEqual(len(embeddings.underlying.embed_query("안녕")), 32)
+
+    def test_collection_dimensions_from_metadata_or_sample(self):
+        client = chromadb.EphemeralClient()
+        recorded = client.create_collection(f"dims-{id(self)}", metadata={"embedding_dimensions": 256}, embedding_function=None)
+        self.addCleanup(client.delete_collection, recorded.name)
+        legacy = client.create_collection(f"dims-legacy-{id(self)}", embedding_function=None)
+        self.addCleanup(client.delete_collection, legacy.name)
+        self.assertEqual(collection_dimensions(recorded), 256)
+        self.assertIsNone(collection_dimensions(legacy))
+        legacy.add(ids=["a"], embeddings=[[0.1, 0.2, 0.3]], documents=["가"])
+        self.assertEqual(collection_dimensions(legacy), 3)
+
+
+class CsvChunkTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.path = f"{self.root}/data.csv"
+        with open(self.path, "w", encoding="utf-8", newline="") as f:
+            f.write("text,emotion\n안녕,기쁨\n\"쉼표, 그리고\n줄바꿈\",슬픔\n잘 가,분노\n또 봐,기쁨\n응,불안\n")
+
+    def test_chunks_match_whole_file_load(self):
+        # 파일을 한 번에 읽지 않고 청크를 요청할 때마다 읽음
+        first = next(RAGProcessor.iter_csv_chunks(self.path, 2))
+        self.assertEqual([d.page_content for d in first], ["text: 안녕", "text: 쉼표, 그리고\n줄바꿈"])
+        chunks = list(RAGProcessor.iter_csv_chunks(self.path, 2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        expected = CSVLoader(file_path=self.path, metadata_columns=["emotion"]).load()
+        self.assertEqual(
+            [(d.page_content, d.metadata) for chunk in chunks for d in chunk],
+            [(d.page_content, d.metadata) for d in expected],
+        )
+
+
+class ContentIdTests(SimpleTestCase):
+    def test_stable_across_whitespace_normalization_and_key_order(self):
+        doc_id = RAGProcessor.content_id("content: 안녕  하세요", {"emotion": "기쁨", "source": "a"})
+        self.assertEqual(doc_id, RAGProcessor.content_id(" content: 안녕 하세요\n", {"source": "a", "emotion": "기쁨"}))
+        # 조합형/완성형 한글도 같은 ID
+        decomposed = "content: \u1106\u1161\u11ab"  # "만"의 자모 조합
+        self.assertEqual(RAGProcessor.content_id(decomposed), RAGProcessor.content_id("content: 만"))
+        self.assertRegex(doc_id, r"^doc_[0-9a-f]{32}$")
+
+    def test_changes_with_metadata(self):
+        self.assertNotEqual(
+            RAGProcessor.content_id("content: 안녕", {"emotion": "기쁨"}),
+            RAGProcessor.content_id("content: 안녕", {"emotion": "슬픔"}),
+        )
+
+    def test_known_value(self):
+        # 이 값이 바뀌면 기존 컬렉션의 문서가 모두 새 문서로 다시 적재되므로 해시 방식은 바꾸지 말 것
+        self.assertEqual(RAGProcessor.content_id("content: 안녕", {"emotion": "기쁨"}), "doc_c4a89a43ab6c7bc9c18ae3afede615d5")
+
+    def test_filter_new_documents_skips_stored_and_repeated_ids(self):
+        collection = chromadb.EphemeralClient().get_or_create_collection(f"content-id-{id(self)}", embedding_function=None)
+        self.addCleanup(chromadb.EphemeralClient().delete_collection, collection.name)
+        collection.add(ids=["a"], embeddings=[[0.0, 1.0]], documents=["저장됨"])
+        vectorstore = SimpleNamespace(_collection=collection)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            texts, metadatas, ids = RAGProcessor.filter_new_documents(
+                vectorstore, ["저장됨", "새 글", "새 글", "이번 실행"], [{}, {"n": 1}, {"n": 2}, {}],
+                ["a", "b", "b", "c"], existing_ids={"c"},
+            )
+        self.assertEqual((texts, metadatas, ids), (["새 글"], [{"n": 1}], ["b"]))
+
+
+@override_settings(RAG_VECTOR_QUANTIZATION="int8")
+class EmbeddingShardTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.source = f"{self.root}/data.csv"
+        with open(self.source, "w") as f:
+            f.write("a,b\n1,2\n")
+
+    def embed(self, store, texts, ids):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return RAGProcessor.embed_with_reuse(store, 0, texts, ids)
+
+    def test_shards_keep_float32_when_quantization_is_enabled(self):
+        store = EmbeddingShardStore(self.source, self.root)
+        vectors = np.random.default_rng(0).random((3, 4))
+        store.save(0, ["a", "b", "c"], vectors)
+        ids, loaded = store.load(0)
+        self.assertEqual(loaded.dtype, np.float32)
+        np.testing.assert_array_equal(loaded, vectors.astype(np.float32))
+
+        with mock.patch.object(RAGProcessor, "create_embeddings") as create:
+            reused = self.embed(store, ["x", "y", "z"], ids)
+        create.assert_not_called()
+        self.assertEqual(reused.dtype, np.float32)
+
+    def test_only_missing_rows_are_embedded(self):
+        store = EmbeddingShardStore(self.source, self.root)
+        store.save(0, ["a", "b"], np.array([[1.0, 0.0], [0.0, 1.0]]))
+        with mock.patch.object(RAGProcessor, "create_embeddings", return_value=[[0.5, 0.5]]) as create:
+            vectors = self.embed(store, ["c 텍스트", "b 텍스트", "a 텍스트"], ["c", "b", "a"])
+        create.assert_called_once_with(["c 텍스트"])
+        np.testing.assert_array_equal(vectors, [[0.5, 0.5], [0.0, 1.0], [1.0, 0.0]])
+        # 새로 계산한 행까지 샤드에 다시 저장
+        self.assertEqual(store.load(0)[0], ["c", "b", "a"])
+
+    def test_edited_file_does_not_reuse_stale_shards(self):
+        old = EmbeddingShardStore(self.source, self.root)
+        old.save(0, ["a"], np.ones((1, 2)))
+        with open(self.source, "a") as f:
+            f.write("3,4\n")
+
+        new = EmbeddingShardStore(self.source, self.root)
+        self.assertNotEqual(new.path, old.path)
+        self.assertIsNone(new.load(0))
+        new.save(0, ["b"], np.zeros((1, 2)))
+        # 같은 파일의 이전 샤드 디렉터리는 새 샤드를 처음 쓸 때 지움
+        self.assertFalse(os.path.exists(old.path))
+        self.assertEqual(new.manifest()["shards"], {"00000": 1})
+
+
+class IngestionPipelineTests(SimpleTestCase):
+    def batches(self, n):
+        return [IngestBatch(i, [f"t{i}"], [{}], [f"id{i}"]) for i in range(n)]
+
+    def test_writes_in_submission_order(self):
+        written, checkpoints = [], []
+
+        def embed(batch):
+            # 뒤 배치일수록 임베딩이 먼저 끝나게 함
+            time.sleep(0.02 * (5 - batch.index))
+            return batch.index
+
+        def write(batch, embeddings):
+            self.assertEqual(embeddings, batch.index)
+            written.append(batch.index)
+
+        pipeline = IngestionPipeline(embed, write, checkpoint=lambda b: checkpoints.append(b.index),
+                                     embed_workers=4, max_pending=2)
+        self.assertEqual(pipeline.run(self.batches(6)), 6)
+        self.assertEqual(written, list(range(6)))
+        self.assertEqual(checkpoints, list(range(6)))
+
+    def test_embed_error_stops_before_failed_batch(self):
+        written = []
+
+        def embed(batch):
+            if batch.index == 2:
+                raise RuntimeError("embed failed")
+            return None
+
+        pipeline = IngestionPipeline(embed, lambda b, _: written.append(b.index), embed_workers=2, max_pending=2)
+        with self.assertRaisesMessage(RuntimeError, "embed failed"):
+            pipeline.run(self.batches(10))
+        self.assertEqual(written, [0, 1])
+
+    def test_write_error_propagates_and_skips_checkpoint(self):
+        checkpoints = []
+
+        def write(batch, _):
+            if batch.index == 1:
+                raise ValueError("write failed")
+
+        pipeline = IngestionPipeline(lambda b: None, write, checkpoint=lambda b: checkpoints.append(b.index),
+                                     embed_workers=2, max_pending=1)
+        with self.assertRaisesMessage(ValueError, "write failed"):
+            pipeline.run(iter(self.batches(50)))
+        self.assertEqual(checkpoints, [0])
+
+    def test_reader_error_propagates(self):
+        def batches():
+            yield from self.batches(2)
+            raise OSError("read failed")
+
+        pipeline = IngestionPipeline(lambda b: None, lambda b, _: None, embed_workers=1)
+        with self.assertRaisesMessage(OSError, "read failed"):
+            pipeline.run(batches())
+
+
+@override_settings(
+    RAG_EMBEDDINGS_FACTORY="rag.fakes.hashing_embeddings",
+    RAG_EMBEDDING_CACHE_ENABLED=False,
+    RAG_EMOTION_PARTITIONS=False,
+    RAG_LEXICAL_INDEX=False,
+    RAG_INGEST_CHUNK_ROWS=2,
+)
+@mock.patch("rag.tokens.get_encoding", fake_encoding)
+class StreamingCheckpointTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.db_dir = f"{self.root}/db"
+        self.csv_file = f"{self.root}/data.csv"
+        with open(self.csv_file, "w", encoding="utf-8") as f:
+            f.write("text,emotion\n")
+            for i in range(6):
+                f.write(f"발화 {i}번,기쁨\n")
+        patcher = mock.patch.object(RAGProcessor, "TEMP_DIR", f"{self.root}/temp")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ingest(self):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return RAGProcessor.process_csv_streaming(self.csv_file, set(), None, self.db_dir)
+
+    def test_resume_after_failed_write(self):
+        real_update = RAGProcessor.update_chroma_db
+        calls = []
+
+        def failing_update(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError("disk full")
+            return real_update(*args, **kwargs)
+
+        with mock.patch.object(RAGProcessor, "update_chroma_db", side_effect=failing_update):
+            with self.assertRaisesMessage(RuntimeError, "disk full"):
+                self.ingest()
+
+        store = EmbeddingShardStore(self.csv_file, RAGProcessor.TEMP_DIR)
+        with contextlib.redirect_stdout(io.StringIO()):
+            collection = RAGProcessor.open_vectorstore(self.db_dir)._collection
+        self.assertEqual(collection.count(), 2)
+        self.assertEqual(store.load_checkpoint(collection.id, 2), 1)
+        failed_chunk_ids = store.load(1)[0]
+
+        # 다시 실행하면 청크 1부터 이어서 진행하고, 실패 전에 저장한 청크 1의 임베딩은 다시 계산하지 않음
+        real_create = RAGProcessor.create_embeddings
+        with mock.patch.object(RAGProcessor, "create_embeddings", side_effect=real_create) as create:
+            vectorstore, new_docs = self.ingest()
+        embedded = [text for call in create.call_args_list for text in call.args[0]]
+        self.assertFalse(any("발화 2번" in text or "발화 3번" in text for text in embedded))
+        self.assertEqual(new_docs, 4)
+        self.assertEqual(vectorstore._collection.count(), 6)
+        self.assertEqual(store.load_checkpoint(collection.id, 2), 3)
+        self.assertEqual(len(vectorstore._collection.get(ids=failed_chunk_ids, include=[])["ids"]), 2)
+
+        # 모두 적재된 뒤 다시 실행하면 아무것도 하지 않음
+        _, new_docs = self.ingest()
+        self.assertEqual(new_docs, 0)
+
+
+@mock.patch("rag.tokens.get_encoding", fake_encoding)
+class PackBatchesTests(SimpleTestCase):
+    def test_respects_token_and_item_limits_in_order(self):
+        texts = ["aaaa", "bb", "cccccc", "d", "e", "f", "gggggggggggg"]
+        batches = pack_batches(texts, max_tokens=8, max_items=3)
+        self.assertEqual([t for _, batch, _ in batches for t in batch], texts)
+        for start, batch, tokens in batches:
+            self.assertEqual(texts[start:start + len(batch)], batch)
+            self.assertEqual(tokens, sum(map(len, batch)))
+            self.assertLessEqual(len(batch), 3)
+            if len(batch) > 1:
+                self.assertLessEqual(tokens, 8)
+        self.assertEqual([batch for _, batch, _ in batches],
+                         [["aaaa", "bb"], ["cccccc", "d", "e"], ["f"], ["gggggggggggg"]])
+
+    def test_empty_text_counts_as_one_token(self):
+        self.assertEqual(pack_batches(["", ""], max_tokens=1, max_items=10), [(0, [""], 1), (1, [""], 1)])
+        self.assertEqual(pack_batches([], max_tokens=10, max_items=10), [])
+
+
+
+@mock.patch("rag.tokens.get_encoding", fake_encoding)
+class EmbeddingSchedulerTests(SimpleTestCase):
+    def test_cache_hits_are_not_charged(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        underlying = HashingEmbeddings(size=8)
+        cached = CachedEmbeddings(underlying, namespace="test", cache=EmbeddingCache(path=f"{root}/cache.sqlite3"))
+        asyncio.run(cached.aembed_documents(["안녕", "반가워"]))
+
+        scheduler = EmbeddingScheduler(tpm=1000, rpm=100, initial_concurrency=1, max_concurrency=1)
+        texts = ["안녕", "반가워", "오늘 어땠어", "오늘 어땠어"]
+        with mock.patch.object(underlying, "aembed_documents", wraps=underlying.aembed_documents) as request:
+            vectors = asyncio.run(scheduler.embed(texts, cached))
+
+        # 캐시 적중과 중복을 빼고 "오늘 어땠어" 한 개만 요청하고 그 토큰만 차감
+        self.assertEqual([call.args[0] for call in request.call_args_list], [["오늘 어땠어"]])
+        self.assertEqual(scheduler.counters["texts"], 1)
+        self.assertEqual(scheduler.counters["tokens"], len("오늘 어땠어"))
+        self.assertEqual(len(vectors), 4)
+        np.testing.assert_allclose(vectors[0], underlying.embed_query("안녕"), rtol=1e-6)
+        self.assertEqual(vectors[2], vectors[3])
+
+        # 모두 캐시에 있으면 요청하지 않음
+        asyncio.run(scheduler.embed(texts, cached))
+        self.assertEqual(scheduler.counters["requests"], 1)
+
+
+    @override_settings(RAG_EMBEDDING_BACKOFF_BASE=0, RAG_EMBEDDING_BATCH_MAX_ITEMS=2)
+    def test_rate_limit_halves_concurrency_and_retries_in_order(self):
+        class RateLimited(Exception):
+            status_code = 429
+
+        underlying = HashingEmbeddings(size=8)
+        real_embed = underlying.aembed_documents
+        failures = [RateLimited()]
+
+        async def flaky_embed(texts):
+            if failures:
+                raise failures.pop()
+            return await real_embed(texts)
+
+        scheduler = EmbeddingScheduler(tpm=1000, rpm=100, initial_concurrency=4, max_concurrency=4)
+        texts = ["하나", "둘", "셋", "넷", "다섯"]
+        with mock.patch.object(underlying, "aembed_documents", side_effect=flaky_embed):
+            with self.assertLogs("rag.embedding_scheduler", "WARNING"):
+                vectors = asyncio.run(scheduler.embed(texts, underlying))
+
+        self.assertEqual(vectors, underlying.embed_documents(texts))
+        self.assertEqual((scheduler.counters["retries"], scheduler.counters["rate_limited"]), (1, 1))
+        self.assertEqual(scheduler.counters["requests"], 3)
+        self.assertLess(scheduler.concurrency, 4)
+
+    def test_non_retryable_errors_propagate(self):
+        underlying = HashingEmbeddings(size=8)
+        scheduler = EmbeddingScheduler(tpm=1000, rpm=100)
+        with mock.patch.object(underlying, "aembed_documents", side_effect=ValueError("bad input")):
+            with self.assertRaisesMessage(ValueError, "bad input"):
+                asyncio.run(scheduler.embed(["안녕"], underlying))
+        self.assertEqual(scheduler.counters["retries"], 0)
+
+
+class IngestionJobClaimTests(TestCase):
+    def test_claims_oldest_queued_job_once(self):
+        first = IngestionJob.objects.create(kind=IngestionJob.KIND_CSV)
+        IngestionJob.objects.create(kind=IngestionJob.KIND_CSV)
+
+        job = IngestionJobRunner.claim("w1")
+        self.assertEqual(job.pk, first.pk)
+        self.assertEqual((job.status, job.worker, job.attempts), (IngestionJob.STATUS_RUNNING, "w1", 1))
+        # 실행 중인 작업이 있으면 다른 워커는 가져가지 않음
+        self.assertIsNone(IngestionJobRunner.claim("w2"))
+
+    def test_does_not_claim_while_another_job_runs(self):
+        IngestionJob.objects.create(kind=IngestionJob.KIND_CSV, status=IngestionJob.STATUS_RUNNING)
+        queued = IngestionJob.objects.create(kind=IngestionJob.KIND_CSV)
+        self.assertIsNone(IngestionJobRunner.claim("w1"))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, IngestionJob.STATUS_QUEUED)
+
+    def test_update_rechecks_running_jobs(self):
+        queued = IngestionJob.objects.create(kind=IngestionJob.KIND_CSV)
+        other = IngestionJob.objects.create(kind=IngestionJob.KIND_CSV)
+        real_list = list
+
+        def racing_list(iterable):
+            rows = real_list(iterable)
+            # 확인을 마친 직후 다른 워커가 작업을 가져간 상황
+            IngestionJob.objects.filter(pk=other.pk).update(status=IngestionJob.STATUS_RUNNING)
+            return rows
+
+        with mock.patch("rag.jobs.list", racing_list, create=True):
+            self.assertIsNone(IngestionJobRunner.claim("w1"))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, IngestionJob.STATUS_QUEUED)
+
+    def test_cancel_queued_and_running_jobs(self):
+        queued = IngestionJob.objects.create(kind=IngestionJob.KIND_CSV)
+        running = IngestionJob.objects.create(kind=IngestionJob.KIND_CSV, status=IngestionJob.STATUS_RUNNING)
+        with self.assertLogs("rag.jobs", "INFO"):
+            queued = IngestionJobRunner.cancel(queued)
+            running = IngestionJobRunner.cancel(running)
+        self.assertEqual(queued.status, IngestionJob.STATUS_CANCELLED)
+        self.assertIsNotNone(queued.finished_at)
+        # 실행 중인 작업은 워커가 다음 청크 경계에서 멈출 때까지 상태를 바꾸지 않음
+        self.assertEqual((running.status, running.cancel_requested), (IngestionJob.STATUS_RUNNING, True))
+
+    def test_resume_only_failed_or_cancelled_jobs(self):
+        job = IngestionJob.objects.create(
+            kind=IngestionJob.KIND_CSV, status=IngestionJob.STATUS_CANCELLED, cancel_requested=True, error="중단"
+        )
+        job = IngestionJobRunner.resume(job)
+        self.assertEqual((job.status, job.cancel_requested, job.error), (IngestionJob.STATUS_QUEUED, False, ""))
+        with self.assertRaises(ValueError):
+            IngestionJobRunner.resume(job)
+
+    def test_run_records_final_status(self):
+        IngestionJob.objects.create(kind=IngestionJob.KIND_CSV, params={"pattern": "*.csv"})
+        handler = mock.Mock(side_effect=JobCancelled("취소"))
+        with mock.patch.dict("rag.jobs.JOB_HANDLERS", {IngestionJob.KIND_CSV: handler}), self.assertLogs("rag.jobs", "INFO"):
+            job = IngestionJobRunner.run(IngestionJobRunner.claim("w1"))
+            self.assertEqual(job.status, IngestionJob.STATUS_CANCELLED)
+            handler.assert_called_once_with({"pattern": "*.csv"}, mock.ANY)
+
+            handler.side_effect = RuntimeError("embed failed")
+            IngestionJobRunner.resume(job)
+            job = IngestionJobRunner.run(IngestionJobRunner.claim("w1"))
+        self.assertEqual((job.status, job.attempts), (IngestionJob.STATUS_FAILED, 2))
+        self.assertIn("RuntimeError: embed failed", job.error)
+        self.assertIsNotNone(job.finished_at)
+
+
+class IngestionJobViewTests(TestCase):
+    def test_setup_enqueues_job_and_detail_cancels_it(self):
+        with self.assertLogs("rag.jobs", "INFO"):
+            response = self.client.post("/api/rag/setup/")
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["job_id"]
+        self.assertTrue(response.json()["status_url"].endswith(f"/api/rag/jobs/{job_id}/"))
+
+        url = f"/api/rag/jobs/{job_id}/"
+        self.assertEqual(self.client.get(url).json()["status"], IngestionJob.STATUS_QUEUED)
+        with self.assertLogs("rag.jobs", "INFO"):
+            response = self.client.post(url, {"action": "cancel"}, content_type="application/json")
+        self.assertEqual(response.json()["status"], IngestionJob.STATUS_CANCELLED)
+        self.assertEqual(self.client.post(url, {"action": "cancel"}, content_type="application/json").status_code, 409)
+        self.assertEqual(self.client.post(url, {"action": "stop"}, content_type="application/json").status_code, 400)
+        self.assertEqual(self.client.get("/api/rag/jobs/999/").status_code, 404)
+        self.assertEqual([job["job_id"] for job in self.client.get("/api/rag/jobs/?status=cancelled").json()["jobs"]], [job_id])
+
+
+class CsvParityTests(SimpleTestCase):
+    """병렬/스트리밍 적재의 Document가 CSVLoader(load_csv_with_metadata)와 같아야 내용 해시 ID가 유지됨."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def write(self, content):
+        path = f"{self.root}/data.csv"
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+        return path
+
+    def assert_parity(self, content, chunk_rows=2):
+        path = self.write(content)
+        expected = CSVLoader(file_path=path, metadata_columns=["emotion"]).load()
+        documents = [
+            row_document(path, header, row, start + i)
+            for header, rows, start in iter_csv_row_chunks(path, chunk_rows)
+            for i, row in enumerate(rows)
+        ]
+        self.assertEqual(
+            [(d.page_content, d.metadata) for d in documents],
+            [(d.page_content, d.metadata) for d in expected],
+        )
+        self.assertEqual(
+            [(d.page_content, d.metadata) for chunk in RAGProcessor.iter_csv_chunks(path, chunk_rows) for d in chunk],
+            [(d.page_content, d.metadata) for d in expected],
+        )
+
+    def test_matches_csvloader(self):
+        self.assert_parity(
+            " 발화 ,emotion,상황\n"
+            "안녕  ,기쁨, 첫 만남\n"
+            "\n"
+            "\"쉼표, 그리고\n줄바꿈\",슬픔,\n"
+            "남는,분노,값,더 있음\n"
+            "모자란,불안\n"
+        )
+
+    def test_missing_metadata_column_raises(self):
+        path = self.write("발화\n안녕\n")
+        header, rows, start = next(iter_csv_row_chunks(path))
+        with self.assertRaisesMessage(ValueError, "Metadata column 'emotion' not found"):
+            row_document(path, header, rows[0], start)
+
+
+class ConversationFileTests(SimpleTestCase):
+    def test_unreadable_files_are_skipped(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        invalid = f"{root}/invalid.json"
+        with open(invalid, "w", encoding="utf-8") as f:
+            f.write("{")
+
+        for path in (invalid, f"{root}/missing.json", root):
+            file_path, texts, _, _, count, skipped = parse_conversation_file(path)
+            self.assertEqual((file_path, texts, count), (path, [], 0))
+            self.assertTrue(skipped)
+
+class ParallelParserTests(SimpleTestCase):
+    def test_results_match_sequential_parsing_in_order(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        path = f"{root}/data.csv"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("text,emotion\n")
+            for i in range(9):
+                f.write(f"\"{i}번째, 발화\",기쁨\n")
+
+        chunks = [(path, header, rows, start) for header, rows, start in iter_csv_row_chunks(path, 2)]
+        with self.assertLogs("rag.parallel_ingest", "INFO"), ParallelParser(workers=2, max_pending=2) as parser:
+            results = list(parser.map(csv_chunk_documents, chunks))
+        self.assertEqual(results, [csv_chunk_documents(*args) for args in chunks])
+        self.assertEqual([len(docs) for docs in results], [2, 2, 2, 2, 1])
+
+
+@override_settings(RAG_BULK_JSON_BATCH_DOCS=4)
+class BulkConversationIngestTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.files = []
+        for i in range(5):
+            path = f"{root}/conv{i}.json"
+            conversation = {
+                "info": {"source": "대화"},
+                "utterances": [{"text": f"{i}번 대화 첫 발화"}, {"text": f"{i}번 대화 둘째 발화"}],
+            }
+            if i == 0:
+                conversation["info"]["id"] = "c-0"
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(conversation, f, ensure_ascii=False)
+            self.files.append(path)
+        self.broken = f"{root}/broken.json"
+        with open(self.broken, "w", encoding="utf-8") as f:
+            f.write("{")
+
+        client = chromadb.EphemeralClient()
+        self.collection = client.get_or_create_collection(f"bulk-json-{id(self)}", embedding_function=None)
+        self.addCleanup(client.delete_collection, self.collection.name)
+        stored_id = RAGProcessor.content_id("1번 대화 첫 발화", {"source": "대화"})
+        self.collection.add(ids=[stored_id], embeddings=[[0.0, 0.0]], documents=["1번 대화 첫 발화"])
+
+    def ingest(self):
+        vectorstore = SimpleNamespace(_collection=self.collection)
+        written = []
+
+        def update_chroma_db(vectorstore, texts, embeddings, metadatas, ids, db_dir):
+            written.append(metadatas)
+
+        with mock.patch.object(RAGProcessor, "create_embeddings", side_effect=lambda texts: [[1.0, 0.0]] * len(texts)) as create, \
+                mock.patch.object(RAGProcessor, "update_chroma_db", side_effect=update_chroma_db), \
+                contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            _, new_docs, processed = RAGProcessor.process_conversation_files(self.files + [self.broken], set(), vectorstore)
+        return create, written, new_docs, processed
+
+    def test_batches_utterances_across_files(self):
+        progress = JobProgress(SimpleNamespace(pk=1, progress={}, cancel_requested=False))
+        token = _current_job.set(progress)
+        try:
+            create, written, new_docs, processed = self.ingest()
+        finally:
+            _current_job.reset(token)
+
+        # 파일 5개의 발화 10개를 4개씩 모으고, 이미 적재된 발화 1개는 빼고 배치마다 한 번씩 임베딩/저장
+        self.assertEqual([len(call.args[0]) for call in create.call_args_list], [3, 4, 2])
+        self.assertEqual([len(metadatas) for metadatas in written], [3, 4, 2])
+        self.assertEqual((new_docs, processed), (9, 10))
+        first = written[0][0]
+        self.assertEqual((first["source_file"], first["conversation"], first["utterance"]), (self.files[0], "c-0", 0))
+        self.assertEqual(written[0][2]["conversation"], "conv1")
+
+        self.assertEqual({path: progress.files[path]["status"] for path in self.files}, dict.fromkeys(self.files, "done"))
+        self.assertEqual(progress.files[self.files[1]]["new_docs"], 1)
+        self.assertEqual(progress.files[self.broken]["status"], "skipped")
@@ -0,0 +1,22 @@
+"""tiktoken 기반 토큰 수 계산 헬퍼."""
+from functools import lru_cache
+
+import tiktoken
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = None):
+    """모델에 맞는 토크나이저를 반환합니다. 알 수 없는 모델은 o200k_base를 사용합니다."""
+    model = model or settings.RAG_LLM_MODEL
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    """텍스트의 토큰 수를 반환합니다."""
+    if not text:
+        return 0
+    return len(get_encoding(model).encode(text, disallowed_special=()))
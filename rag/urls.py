@@ -1,9 +1,15 @@
 from django.urls import path
-from .views import RAGSetupView, RAGQueryView, RAGJsonSetupView, RAGBulkJsonSetupView
+from .views import RAGSetupView, RAGQueryView, RAGBatchQueryView, RAGJsonSetupView, RAGBulkJsonSetupView, RAGCacheStatsView, RAGMetricsView, RAGIngestJobListView, RAGIngestJobDetailView, rag_query_async
 
 urlpatterns = [
     path('setup/', RAGSetupView.as_view(), name='rag-setup'),
     path('query/', RAGQueryView.as_view(), name='rag-query'),
+    path('query/async/', rag_query_async, name='rag-query-async'),
+    path('query/batch/', RAGBatchQueryView.as_view(), name='rag-query-batch'),
     path('json-setup/', RAGJsonSetupView.as_view(), name='rag-json-setup'),
     path('bulk-json-setup/', RAGBulkJsonSetupView.as_view(), name='rag-bulk-json-setup'),
+    path('jobs/', RAGIngestJobListView.as_view(), name='rag-jobs'),
+    path('jobs/<int:job_id>/', RAGIngestJobDetailView.as_view(), name='rag-job-detail'),
+    path('cache-stats/', RAGCacheStatsView.as_view(), name='rag-cache-stats'),
+    path('metrics/', RAGMetricsView.as_view(), name='rag-metrics'),
 ]
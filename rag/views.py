@@ -1,11 +1,16 @@
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.http import JsonResponse, HttpResponseNotAllowed
+from django.urls import reverse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import JSONParser
 from .method import RAGProcessor, RAGQuery
+from .jobs import IngestionJobRunner
+from .models import IngestionJob
 from dotenv import load_dotenv
 import os
-from tqdm import tqdm
 import json
 
 # 환경 변수 로드
@@ -19,12 +24,44 @@ CSV_PATTERN = "data/rag/*.csv"
 if not os.path.exists(DB_DIR):
     os.makedirs(DB_DIR, exist_ok=True)
 
+def _job_payload(job, detail=False):
+    """적재 작업 상태 응답."""
+    totals = (job.progress or {}).get('totals', {})
+    payload = {
+        'job_id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'cancel_requested': job.cancel_requested,
+        'attempts': job.attempts,
+        'worker': job.worker,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'heartbeat_at': job.heartbeat_at,
+        'totals': totals,
+        'result': job.result,
+        'error': job.error,
+    }
+    if detail:
+        payload['files'] = (job.progress or {}).get('files', {})
+    return payload
+
+
+def _job_accepted(request, job, message):
+    return Response({
+        'message': message,
+        'job_id': job.pk,
+        'status': job.status,
+        'status_url': request.build_absolute_uri(reverse('rag-job-detail', args=[job.pk]))
+    }, status=status.HTTP_202_ACCEPTED)
+
+
 class RAGSetupView(APIView):
     """
     RAG 시스템 초기 설정을 위한 API 뷰
     
     Endpoints:
-        POST /rag/setup/: CSV 파일을 읽어 Chroma DB에 임베딩을 저장
+        POST /rag/setup/: CSV 파일을 읽어 Chroma DB에 임베딩을 저장하는 적재 작업 등록
     """
 
     def get(self, request):
@@ -33,70 +70,34 @@ class RAGSetupView(APIView):
             'message': 'RAG 시스템 설정 API',
             'usage': {
                 'method': 'POST',
-                'description': 'CSV 파일을 처리하여 RAG 시스템의 벡터 데이터베이스를 구축합니다.',
+                'description': 'CSV 파일을 처리하여 RAG 시스템의 벡터 데이터베이스를 구축하는 작업을 등록합니다. 진행 상황은 /v1/rag/jobs/<job_id>/에서 확인합니다.',
                 'endpoint': '/v1/rag/setup/'
             }
         }, status=status.HTTP_200_OK)
 
     def post(self, request):
         """
-        CSV 파일을 처리하여 RAG 시스템의 벡터 데이터베이스를 구축합니다.
-        
-        Process:
-            1. CSV 파일 로드 및 전처리
-            2. 새로운(미처리) 파일 필터링
-            3. Chroma DB 초기화
-            4. 각 CSV 파일별 처리:
-                - 메타데이터와 함께 문서 로드
-                - 새로운 문서 필터링
-                - 문서 분할(청크)
-                - Chroma DB에 데이터 저장
-            5. 처리 결과 반환
-        
+        CSV 파일 적재 작업을 등록합니다.
+
+        파싱/임베딩/Chroma 저장은 요청 안에서 하지 않고 백그라운드 워커(manage.py rag_worker)가 실행합니다.
+
+        Process (워커):
+            1. CSV 파일 로드 및 새로운(미처리) 파일 필터링
+            2. Chroma DB 초기화
+            3. 각 CSV 파일별 처리: 로드 -> 새로운 문서 필터링 -> 분할 -> Chroma DB 저장
+            4. 질의용 인덱스 갱신
+
         Returns:
-            Response: {
+            Response (202): {
                 'message': str,
-                'processed_files': int,
-                'new_docs': int,
-                'total_docs': int
+                'job_id': int,
+                'status': str,
+                'status_url': str
             }
         """
-
         try:
-            # 1. CSV 파일 로드
-            csv_files = RAGProcessor.load_and_preprocess_csv(CSV_PATTERN)
-            new_files = RAGProcessor.filter_processed_files(csv_files)
-
-            # 2. 새로운 파일이 없는 경우 처리
-            if not new_files:
-                return Response({
-                    'message': '새로운 파일이 없습니다.',
-                    'processed_files': len(csv_files)
-                }, status=status.HTTP_200_OK)
-
-            # 3. Chroma DB 초기화
-            vectorstore, existing_ids = RAGProcessor.initialize_chroma_db()
-
-            # 4. 파일 처리 및 DB 업데이트
-            vectorstore, total_new_docs, processed_count = RAGProcessor.process_files(
-                new_files, existing_ids, vectorstore, RAGProcessor.DB_DIR
-            )
-
-            # 5. 처리 결과 반환
-            if vectorstore:
-                total_docs = vectorstore._collection.count()
-                return Response({
-                    'message': '새로운 데이터 처리 완료',
-                    'processed_files': processed_count,
-                    'new_docs': total_new_docs,
-                    'total_docs': total_docs
-                }, status=status.HTTP_201_CREATED)
-
-            return Response({
-                'message': '처리된 문서가 없습니다.',
-                'processed_files': processed_count
-            }, status=status.HTTP_200_OK)
-
+            job = IngestionJobRunner.enqueue(IngestionJob.KIND_CSV, {'pattern': CSV_PATTERN})
+            return _job_accepted(request, job, 'CSV 적재 작업이 등록되었습니다.')
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -112,7 +113,9 @@ class RAGQueryView(APIView):
     def get(self, request):
         """API 사용 방법을 반환합니다."""
         return Response({
-            "question": "너 지금 또 감정적이야"
+            "question": "너 지금 또 감정적이야",
+            "chat_room_id": "(선택) 히스토리로 사용할 채팅방 ID",
+            "emotions": "(선택) 검색할 감정 파티션 목록"
         }, status=status.HTTP_200_OK)
 
     def post(self, request):
@@ -126,13 +129,32 @@ class RAGQueryView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            # 채팅방이 지정되면 해당 방의 최근 대화를 히스토리로 사용
+            chat_room = None
+            chat_room_id = request.data.get('chat_room_id')
+            if chat_room_id:
+                from chat.models import ChatRoom
+                try:
+                    chat_room = ChatRoom.objects.get(id=chat_room_id)
+                except ChatRoom.DoesNotExist:
+                    return Response(
+                        {'error': '채팅방을 찾을 수 없습니다.'},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+
+            # 감정(emotion) 파티션 지정 (예: ["기쁨", "설렘"] 또는 "기쁨,설렘")
+            emotions = RAGQuery.parse_emotions(request.data.get('emotions'))
+
             # 답변 생성
-            result = RAGQuery.get_answer(question)
+            answer = RAGQuery.answer(question, chat_room=chat_room, emotions=emotions)
             
             # 출력값 정리 - 따옴표와 백슬래시 제거
-            cleaned_output = result.replace('"', '').replace('\\', '')
+            cleaned_output = answer.text.replace('"', '').replace('\\', '')
             
-            return Response(cleaned_output, status=status.HTTP_200_OK)
+            # 프롬프트 토큰 통계는 응답 본문 형식을 바꾸지 않도록 헤더로 전달
+            return Response(cleaned_output, status=status.HTTP_200_OK, headers={
+                'X-RAG-Prompt-Stats': json.dumps(answer.stats)
+            })
 
         except Exception as e:
             return Response(
@@ -152,6 +174,7 @@ class RAGJsonSetupView(APIView):
           - 이미 파싱된 JSON 객체: 'json_file' 키에 딕셔너리 형식으로 전달됨.
           
         필수적으로, JSON 데이터는 "info"와 "utterances" 키를 포함해야 합니다.
+        형식을 확인한 뒤 적재 작업을 등록하고 작업 ID를 반환합니다 (202).
         """
         try:
             json_file = request.data.get('json_file')
@@ -186,22 +209,9 @@ class RAGJsonSetupView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # 1. Chroma DB 초기화
-            vectorstore, existing_ids = RAGProcessor.initialize_chroma_db()
-            
-            # 2. JSON 파일을 통한 대화 데이터 처리 및 임베딩 생성
-            vectorstore, total_new_docs, processed_count = RAGProcessor.process_conversation_json(
-                conversation, existing_ids, vectorstore
-            )
-            
-            # 3. 최종 DB 내 총 문서 수 확인
-            total_docs = vectorstore._collection.count()
-            return Response({
-                'message': 'JSON 파일 처리 완료',
-                'processed_items': processed_count,
-                'new_docs': total_new_docs,
-                'total_docs': total_docs
-            }, status=status.HTTP_201_CREATED)
+            # 임베딩/저장은 백그라운드 워커가 실행 (결과는 작업 상태의 result)
+            job = IngestionJobRunner.enqueue(IngestionJob.KIND_JSON, {'conversation': conversation})
+            return _job_accepted(request, job, 'JSON 적재 작업이 등록되었습니다.')
             
         except Exception as e:
             return Response(
@@ -211,83 +221,268 @@ class RAGJsonSetupView(APIView):
 
 class RAGBulkJsonSetupView(APIView):
     """
-    데이터 디렉터리(data/rag/) 아래에 있는 모든 JSON 파일을 처리하여
+    데이터 디렉터리(RAG_BULK_JSON_ROOT, 기본 data/rag/) 아래 JSON 파일들을 처리하여
     RAG 시스템의 벡터 데이터베이스를 구축하는 API 뷰.
     
     Endpoints:
         GET  /rag/bulk-json-setup/ : API 사용 방법 반환
-        POST /rag/bulk-json-setup/ : data/rag/ 폴더의 모든 JSON 파일 처리
+        POST /rag/bulk-json-setup/ : 패턴에 맞는 JSON 파일 일괄 적재 작업 등록
+            {"pattern": "data/rag/TL_*/**/*.json"} (선택, 기본: RAG_BULK_JSON_PATTERN)
     """
+
     def get(self, request):
         """API 사용 방법을 반환합니다."""
         return Response({
-            'message': '데이터 디렉터리 내의 모든 JSON 파일을 처리합니다. POST 요청을 사용하여 실행합니다.',
+            'message': '데이터 디렉터리 내의 JSON 파일을 처리합니다. POST 요청을 사용하여 실행합니다.',
             'usage': {
                 'method': 'POST',
-                'description': '서버의 data/rag/ 폴더에 있는 JSON 파일들을 처리하여 벡터 데이터베이스를 구성합니다.',
+                'description': f'서버의 {settings.RAG_BULK_JSON_ROOT}/ 폴더 아래에서 pattern(glob)에 맞는 JSON 파일들을 처리하여 벡터 데이터베이스를 구성합니다.',
+                'body': {'pattern': f'선택, 기본값 {settings.RAG_BULK_JSON_PATTERN}'},
                 'endpoint': '/v1/rag/bulk-json-setup/'
             }
         }, status=status.HTTP_200_OK)
 
     def post(self, request):
         """
-        데이터 디렉터리(data/rag/) 아래 모든 JSON 파일을 처리합니다.
+        패턴에 맞는 JSON 파일 일괄 적재 작업을 등록합니다.
         
-        프로세스:
-            1. data/rag/ 폴더에서 *.json 파일 검색
-            2. 각 JSON 파일에 대해:
-               - 파일 읽기 및 JSON 파싱
-               - 필수 키("info", "utterances") 확인
-               - RAGProcessor.process_conversation_json() 함수를 호출하여 벡터 생성 및 DB 업데이트
-            3. 처리 결과(처리된 파일 수, 새 문서 수, 총 문서 수) 반환
+        프로세스 (워커):
+            1. pattern(glob, ** 사용 가능)으로 *.json 파일 검색
+            2. 파일을 읽고 JSON 파싱, 필수 키("info", "utterances") 확인
+               (RAG_INGEST_PARALLEL_PARSE이면 프로세스 풀에서)
+            3. 여러 파일의 발화를 RAG_BULK_JSON_BATCH_DOCS개씩 모아 기존 문서 조회/임베딩/DB 저장
+               (메타데이터에 source_file, conversation, utterance 출처 기록)
+            4. 처리 결과(처리된 발화 수, 새 문서 수, 총 문서 수)를 작업 result에 기록
         """
         try:
-            import glob
-            import json
-
-            JSON_PATTERN = "data/rag/TL_기쁨_연인/*.json"
-            json_files = glob.glob(JSON_PATTERN)
-            if not json_files:
-                return Response({
-                    'message': '처리할 JSON 파일이 없습니다.'
-                }, status=status.HTTP_200_OK)
-            
-            # Chroma DB 초기화
-            vectorstore, existing_ids = RAGProcessor.initialize_chroma_db()
-            total_new_docs = 0
-            processed_count = 0
-
-            for file_path in tqdm(json_files, desc="JSON 파일 처리"):
-                with open(file_path, "r", encoding="utf-8") as f:
-                    file_content = f.read()
-                try:
-                    conversation = json.loads(file_content)
-                except Exception:
-                    # 유효하지 않은 JSON 파일은 건너뜁니다.
-                    continue
-
-                # 필수 키 체크: info와 utterances 필요
-                if not {"info", "utterances"}.issubset(conversation.keys()):
-                    continue
-
-                # JSON 파일 처리
-                vectorstore, new_docs, count = RAGProcessor.process_conversation_json(
-                    conversation, existing_ids, vectorstore
+            pattern = request.data.get('pattern') or settings.RAG_BULK_JSON_PATTERN
+            if not isinstance(pattern, str):
+                return Response({'error': 'pattern은 문자열이어야 합니다.'}, status=status.HTTP_400_BAD_REQUEST)
+            # 서버의 임의 경로를 읽지 않도록 데이터 디렉터리 아래 패턴만 허용
+            root = os.path.abspath(settings.RAG_BULK_JSON_ROOT)
+            if os.path.commonpath([root, os.path.abspath(pattern)]) != root:
+                return Response(
+                    {'error': f'pattern은 {settings.RAG_BULK_JSON_ROOT}/ 아래여야 합니다.'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                total_new_docs += new_docs
-                processed_count += count
-            
-            total_docs = vectorstore._collection.count() if vectorstore else 0
-            return Response({
-                'message': '모든 JSON 파일 처리 완료',
-                'processed_files': processed_count,
-                'new_docs': total_new_docs,
-                'total_docs': total_docs
-            }, status=status.HTTP_201_CREATED)
-
+            job = IngestionJobRunner.enqueue(IngestionJob.KIND_BULK_JSON, {'pattern': pattern})
+            return _job_accepted(request, job, 'JSON 일괄 적재 작업이 등록되었습니다.')
         except Exception as e:
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+
+
+class RAGBatchQueryView(APIView):
+    parser_classes = (JSONParser,)
+    """
+    RAG 일괄 질의응답 API
+
+    Endpoints:
+        POST /rag/query/batch/: 여러 메시지를 한 번에 다정한 말투로 변환
+    """
+    def get(self, request):
+        """API 사용 방법을 반환합니다."""
+        return Response({
+            "questions": ["너 지금 또 감정적이야", {"question": "연락 좀 해", "emotions": ["분노"]}],
+            "chat_room_id": "(선택) 히스토리로 사용할 채팅방 ID",
+            "emotions": "(선택) 모든 질문에 적용할 감정 파티션 목록",
+            "max_concurrency": f"(선택) 동시 LLM 호출 수 (기본 {settings.RAG_BATCH_MAX_CONCURRENCY})"
+        }, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        """입력 순서대로 항목별 결과(answer 또는 error)를 반환합니다."""
+        questions = request.data.get('questions')
+        if not isinstance(questions, list) or not questions:
+            return Response({'error': 'questions 리스트가 필요합니다.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(questions) > settings.RAG_BATCH_MAX_ITEMS:
+            return Response(
+                {'error': f'한 번에 최대 {settings.RAG_BATCH_MAX_ITEMS}개까지 처리할 수 있습니다.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        chat_room = None
+        chat_room_id = request.data.get('chat_room_id')
+        if chat_room_id:
+            from chat.models import ChatRoom
+            try:
+                chat_room = ChatRoom.objects.get(id=chat_room_id)
+            except ChatRoom.DoesNotExist:
+                return Response({'error': '채팅방을 찾을 수 없습니다.'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            max_concurrency = int(request.data.get('max_concurrency') or settings.RAG_BATCH_MAX_CONCURRENCY)
+        except (TypeError, ValueError):
+            return Response({'error': 'max_concurrency는 정수여야 합니다.'}, status=status.HTTP_400_BAD_REQUEST)
+        max_concurrency = max(1, min(max_concurrency, settings.RAG_BATCH_MAX_CONCURRENCY))
+
+        try:
+            results = async_to_sync(RAGQuery.abatch_answer)(
+                questions,
+                chat_room=chat_room,
+                emotions=RAGQuery.parse_emotions(request.data.get('emotions')),
+                max_concurrency=max_concurrency
+            )
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        for result in results:
+            if 'answer' in result:
+                # 출력값 정리 - 따옴표와 백슬래시 제거 (RAGQueryView와 같음)
+                result['answer'] = result['answer'].replace('"', '').replace('\\', '')
+        failed = sum(1 for result in results if 'error' in result)
+        return Response({
+            'results': [{'index': index, **result} for index, result in enumerate(results)],
+            'succeeded': len(results) - failed,
+            'failed': failed
+        }, status=status.HTTP_200_OK)
+
+
+class RAGIngestJobListView(APIView):
+    """
+    적재 작업 목록 API
+
+    Endpoints:
+        GET /rag/jobs/?status=running&limit=20: 최근 적재 작업 목록 (파일별 진행 상황 제외)
+    """
+    def get(self, request):
+        jobs = IngestionJob.objects.order_by('-created_at')
+        if request.query_params.get('status'):
+            jobs = jobs.filter(status=request.query_params['status'])
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 200)
+        except ValueError:
+            return Response({'error': 'limit은 정수여야 합니다.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'jobs': [_job_payload(job) for job in jobs[:limit]]}, status=status.HTTP_200_OK)
+
+
+class RAGIngestJobDetailView(APIView):
+    """
+    적재 작업 상태/취소/재개 API
+
+    Endpoints:
+        GET  /rag/jobs/<job_id>/: 상태, 파일별 진행 상황(읽은 행 수, 새 문서 수, 처리 속도, 오류), 결과
+        POST /rag/jobs/<job_id>/: {"action": "cancel"} 취소 (실행 중이면 다음 청크 경계에서 중단)
+                                  {"action": "resume"} 실패/취소된 작업을 이어서 다시 실행
+    """
+    parser_classes = (JSONParser,)
+
+    def get(self, request, job_id):
+        job = IngestionJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({'error': '작업을 찾을 수 없습니다.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_job_payload(job, detail=True), status=status.HTTP_200_OK)
+
+    def post(self, request, job_id):
+        job = IngestionJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({'error': '작업을 찾을 수 없습니다.'}, status=status.HTTP_404_NOT_FOUND)
+        action = request.data.get('action')
+        if action == 'cancel':
+            if job.status in IngestionJob.FINISHED_STATUSES:
+                return Response({'error': '이미 끝난 작업입니다.'}, status=status.HTTP_409_CONFLICT)
+            job = IngestionJobRunner.cancel(job)
+        elif action == 'resume':
+            try:
+                job = IngestionJobRunner.resume(job)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        else:
+            return Response({'error': 'action은 cancel 또는 resume이어야 합니다.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(_job_payload(job, detail=True), status=status.HTTP_200_OK)
+
+
+class RAGCacheStatsView(APIView):
+    """
+    RAG 캐시 상태 조회 API
+
+    Endpoints:
+        GET /rag/cache-stats/: 임베딩 캐시/의미 기반 응답 캐시/다정 표현 라이브러리 적중률, single-flight 합침 카운터,
+            적재용 임베딩 스케줄러 상태(동시성, 재시도/429 횟수, 버킷 잔량) 반환
+    """
+    def get(self, request):
+        """캐시 적중률 카운터를 반환합니다."""
+        from .embedding_cache import EmbeddingCache
+        from .embedding_scheduler import EmbeddingScheduler
+        from .semantic_cache import SemanticResponseCache
+        from .single_flight import SingleFlight
+        from .warm_phrases import WarmPhraseLibrary
+        return Response({
+            'embedding_cache': EmbeddingCache.instance().stats(),
+            'semantic_cache': SemanticResponseCache.instance().stats(),
+            'single_flight': SingleFlight.instance().stats(),
+            'warm_phrases': WarmPhraseLibrary.instance().stats(),
+            'embedding_scheduler': EmbeddingScheduler.instance().stats()
+        }, status=status.HTTP_200_OK)
+
+
+class RAGMetricsView(APIView):
+    """
+    RAG 단계별 지연/토큰 히스토그램 조회 API
+
+    Endpoints:
+        GET /rag/metrics/: 이 워커 프로세스에서 누적된 히스토그램 반환
+            - stage.<단계>: history, semantic_cache, embed, search, lexical_search, prompt, llm (ms)
+            - <요청>.total: json_drf, warm_mode, rag.answer 등 요청 전체 (ms)
+            - tokens.<종류>: prompt_tokens, completion_tokens, history_tokens, context_tokens (개)
+        DELETE /rag/metrics/: 누적된 히스토그램 초기화
+    """
+    def get(self, request):
+        from .metrics import MetricsRegistry
+        return Response(MetricsRegistry.instance().snapshot(), status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        from .metrics import MetricsRegistry
+        MetricsRegistry.instance().reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+async def rag_query_async(request):
+    """
+    RAG 질의응답 비동기 API (ASGI 전용)
+
+    Endpoints:
+        POST /rag/query/async/: RAGQueryView.post와 같은 요청/응답 형식
+
+    히스토리 조회와 벡터 검색을 동시에 수행하고, LLM 응답을 기다리는 동안
+    워커 스레드를 점유하지 않습니다.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': '유효한 JSON 형식이 아닙니다.'}, status=400)
+
+    question = data.get('question')
+    if not question:
+        return JsonResponse({'error': '질문이 필요합니다.'}, status=400)
+
+    # 채팅방이 지정되면 해당 방의 최근 대화를 히스토리로 사용
+    chat_room = None
+    chat_room_id = data.get('chat_room_id')
+    if chat_room_id:
+        from chat.models import ChatRoom
+        try:
+            chat_room = await ChatRoom.objects.aget(id=chat_room_id)
+        except ChatRoom.DoesNotExist:
+            return JsonResponse({'error': '채팅방을 찾을 수 없습니다.'}, status=404)
+
+    try:
+        emotions = RAGQuery.parse_emotions(data.get('emotions'))
+        answer = await RAGQuery.aanswer(question, chat_room=chat_room, emotions=emotions)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+    # 출력값 정리 - 따옴표와 백슬래시 제거
+    cleaned_output = answer.text.replace('"', '').replace('\\', '')
+    response = JsonResponse(cleaned_output, safe=False, json_dumps_params={'ensure_ascii': False})
+    response['X-RAG-Prompt-Stats'] = json.dumps(answer.stats)
+    return response
+
+
+# Django 4.2의 csrf_exempt/require_POST 데코레이터는 코루틴 함수를 감싸면 동기 뷰로 바뀌므로 직접 표시
+rag_query_async.csrf_exempt = True
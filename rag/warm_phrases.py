@@ -0,0 +1,114 @@
+"""
+자주 들어오는 거친 메시지에 대해 미리 생성해 둔 다정모드 옵션 라이브러리.
+
+manage.py mine_warm_phrases가 다정모드 메시지 중 빈도가 높은 문장을 골라 RAGQuery로 3가지 옵션을
+미리 만들고 WarmPhrase 테이블에 버전 태그와 함께 저장합니다. MessageTranslator는 LLM을 호출하기 전에
+이 라이브러리에서 정규화된 문장이 일치하는 항목을 찾아 바로 돌려줍니다.
+
+- 사용할 버전은 RAG_WARM_PHRASE_VERSION이며, 비어 있으면 가장 최근에 만든 버전을 사용합니다.
+- 활성 버전 전체를 메모리에 올려 두고 RAG_WARM_PHRASE_RELOAD_SECONDS마다 다시 읽습니다.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+
+def normalize_phrase(text: str) -> str:
+    """
+    매칭용 정규화: NFC, 소문자, 문장부호 제거, 공백 정리.
+        "너 또 늦었네?!"  ->  "너 또 늦었네"
+    """
+    text = unicodedata.normalize("NFC", text or "").lower()
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+def phrase_key(text: str) -> str:
+    return hashlib.sha256(normalize_phrase(text).encode("utf-8")).hexdigest()
+
+
+class WarmPhraseLibrary:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, version=None, reload_seconds=None):
+        self.version = version or settings.RAG_WARM_PHRASE_VERSION
+        self.reload_seconds = reload_seconds or settings.RAG_WARM_PHRASE_RELOAD_SECONDS
+        self._lock = threading.Lock()
+        self._phrases = {}  # phrase_key -> options
+        self._loaded_version = None
+        self._expires_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def instance(cls):
+        """프로세스 전역 라이브러리를 반환합니다."""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @property
+    def needs_reload(self):
+        return time.monotonic() >= self._expires_at
+
+    def lookup(self, text):
+        """정규화된 문장이 일치하는 옵션 리스트를 반환합니다. 없으면 None."""
+        if self.needs_reload:
+            self.reload()
+        return self._get(text)
+
+    async def alookup(self, text):
+        """lookup의 비동기 버전. DB를 다시 읽어야 할 때만 별도 스레드를 사용합니다."""
+        if self.needs_reload:
+            await sync_to_async(self.reload)()
+        return self._get(text)
+
+    def _get(self, text):
+        options = self._phrases.get(phrase_key(text))
+        if options is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(options)
+
+    def reload(self):
+        """활성 버전의 항목을 DB에서 다시 읽습니다."""
+        from .models import WarmPhrase
+
+        with self._lock:
+            if not self.needs_reload:
+                return
+            version = self.version
+            if not version:
+                latest = WarmPhrase.objects.order_by('-created_at').values_list('version', flat=True).first()
+                version = latest
+            phrases = {}
+            if version:
+                phrases = dict(
+                    WarmPhrase.objects.filter(version=version).values_list('phrase_key', 'options')
+                )
+            self._phrases = phrases
+            self._loaded_version = version
+            self._expires_at = time.monotonic() + self.reload_seconds
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'version': self._loaded_version,
+            'entries': len(self._phrases),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
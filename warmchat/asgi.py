@@ -3,6 +3,10 @@ ASGI config for warmchat project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+비동기 엔드포인트(/api/rag/query/async/, /api/v1/chat/json-drf/async/)는
+ASGI 서버에서 실행해야 동시 처리 이점을 얻습니다. 예:
+    uvicorn warmchat.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -176,4 +176,121 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-AUTH_USER_MODEL = 'accounts.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'accounts.User'
+
+# Logging
+# rag.metrics: 요청별 단계 지연/토큰 수를 JSON 한 줄로 기록 (RAG_METRICS_LOG_LEVEL)
+# rag.method: DEBUG로 두면 프롬프트에 들어간 히스토리/문맥 전체를 기록
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{asctime} {levelname} {name} {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'rag': {
+            'handlers': ['console'],
+            'level': os.getenv('RAG_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        'rag.metrics': {
+            'handlers': ['console'],
+            'level': os.getenv('RAG_METRICS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# RAG 설정
+RAG_EMBEDDING_MODEL = os.getenv('RAG_EMBEDDING_MODEL', 'text-embedding-3-small')
+RAG_EMBEDDING_DIMENSIONS = int(os.getenv('RAG_EMBEDDING_DIMENSIONS', 0)) or None  # 줄인 임베딩 차원 (예: 256, 512). 없으면 모델 기본 차원
+RAG_LLM_MODEL = os.getenv('RAG_LLM_MODEL', 'gpt-4o-mini')
+RAG_LLM_TEMPERATURE = 1.1
+RAG_RETRIEVER_K = 10  # 리트리브할 상위 문서 수
+RAG_ENGINE_RELOAD_CHECK_SECONDS = 5  # 다른 워커의 무효화(재적재) 여부를 확인하는 주기
+RAG_HISTORY_MAX_TURNS = 20  # 프롬프트에 넣을 최근 메시지 수
+RAG_HISTORY_MAX_TOKENS = 1000  # 프롬프트에 넣을 대화 히스토리 토큰 상한
+RAG_HISTORY_CACHE_TTL = 30  # 채팅방별 히스토리 캐시 유지 시간(초)
+RAG_HISTORY_CACHE_MAX_ROOMS = 10000  # 히스토리 캐시에 보관할 최대 채팅방 수
+RAG_EMBEDDING_CACHE_ENABLED = True  # 임베딩 메모리/디스크 캐시 사용 여부
+RAG_EMBEDDING_CACHE_MEMORY_SIZE = 10000  # 메모리 LRU에 보관할 임베딩 수
+RAG_EMBEDDING_CACHE_PATH = BASE_DIR / 'embeddings' / 'embedding_cache.sqlite3'
+RAG_SEMANTIC_CACHE_ENABLED = True  # 다정모드 변환 결과의 의미 기반 캐시 사용 여부
+RAG_SEMANTIC_CACHE_THRESHOLD = 0.95  # 캐시 적중으로 볼 최소 코사인 유사도
+RAG_SEMANTIC_CACHE_CONTEXT_TURNS = 2  # 맥락 지문에 포함할 최근 대화 수. 0은 맥락 구분을 끄는 설정으로, 모든 채팅방이 결과를 공유함
+RAG_SEMANTIC_CACHE_TTL = 60 * 60 * 24  # 캐시 항목 유지 시간(초)
+RAG_SEMANTIC_CACHE_MAX_ENTRIES = 5000  # 캐시에 보관할 최대 항목 수
+RAG_RETRIEVER_BACKEND = os.getenv('RAG_RETRIEVER_BACKEND', 'chroma')  # 질의용 벡터 검색 백엔드: 'chroma' 또는 'faiss'
+RAG_FAISS_DIR = BASE_DIR / 'embeddings' / 'faiss'  # FAISS 스냅샷 저장 경로
+RAG_FAISS_IVF_THRESHOLD = 100000  # 이 문서 수 이상이면 IVF 인덱스 사용 (미만이면 Flat)
+RAG_FAISS_NPROBE = 16  # IVF 검색 시 탐색할 클러스터 수
+RAG_INGEST_STREAMING = True  # CSV를 청크 단위로 읽어 분할/임베딩/저장 (파일 크기와 무관하게 메모리 일정)
+RAG_INGEST_CHUNK_ROWS = 5000  # 스트리밍 적재 시 한 번에 처리할 CSV 행 수
+RAG_INGEST_EMBED_WORKERS = 2  # 스트리밍 적재 시 동시에 임베딩할 청크 수 (쓰기는 항상 청크 순서대로 1개씩)
+RAG_INGEST_MAX_PENDING_BATCHES = 4  # 임베딩 중이거나 쓰기를 기다리는 청크 수 상한 (메모리 상한)
+RAG_INGEST_PARALLEL_PARSE = os.getenv('RAG_INGEST_PARALLEL_PARSE', 'False') == 'True'  # CSV 청크/대화 JSON 파일의 파싱·분할을 프로세스 풀에서 실행 (rag/parallel_ingest.py)
+RAG_INGEST_PARSE_WORKERS = int(os.getenv('RAG_INGEST_PARSE_WORKERS', 0)) or None  # 파싱 프로세스 수 (없으면 CPU 코어 수)
+RAG_INGEST_PARSE_MAX_PENDING = None  # 프로세스 풀에 미리 넘겨 둘 파싱 작업 수 상한 (없으면 프로세스 수의 2배)
+RAG_BULK_JSON_ROOT = os.getenv('RAG_BULK_JSON_ROOT', 'data/rag')  # /rag/bulk-json-setup/에서 지정할 수 있는 파일 패턴의 최상위 디렉터리
+RAG_BULK_JSON_PATTERN = os.getenv('RAG_BULK_JSON_PATTERN', 'data/rag/TL_기쁨_연인/*.json')  # 대화 JSON 일괄 적재 기본 파일 패턴 (** 사용 가능)
+RAG_BULK_JSON_BATCH_DOCS = 5000  # 대화 JSON 일괄 적재 시 여러 파일의 발화를 모아 한 번에 조회/임베딩/저장할 개수
+
+# 임베딩 요청 스케줄러 (rag/embedding_scheduler.py)
+RAG_EMBEDDING_BATCH_MAX_TOKENS = 8000 * 32  # 요청 하나에 담을 최대 토큰 수 (OpenAI 임베딩 요청당 한도 300,000 토큰보다 작게)
+RAG_EMBEDDING_BATCH_MAX_ITEMS = 1000  # 요청 하나에 담을 최대 텍스트 수 (OpenAIEmbeddings chunk_size와 같게)
+RAG_EMBEDDING_TPM = int(os.getenv('RAG_EMBEDDING_TPM', 1_000_000))  # 분당 토큰 한도 (계정 등급에 맞게 설정)
+RAG_EMBEDDING_RPM = int(os.getenv('RAG_EMBEDDING_RPM', 3000))  # 분당 요청 한도
+RAG_EMBEDDING_INITIAL_CONCURRENCY = 4  # 시작 동시 요청 수 (AIMD로 조절)
+RAG_EMBEDDING_MAX_CONCURRENCY = 16  # 동시 요청 수 상한
+RAG_EMBEDDING_TARGET_LATENCY = 10.0  # 요청 하나가 이 시간(초)보다 오래 걸리면 동시성을 줄임
+RAG_EMBEDDING_MAX_RETRIES = 6  # 429/일시적 오류 재시도 횟수
+RAG_EMBEDDING_BACKOFF_BASE = 0.5  # 재시도 대기 기본값(초). 2배씩 늘리고 0~대기값 사이에서 무작위로 기다림
+RAG_EMBEDDING_BACKOFF_MAX = 30.0  # 재시도 대기 상한(초)
+
+# 백그라운드 적재 작업 (rag/jobs.py, manage.py rag_worker)
+RAG_INGEST_JOB_POLL_SECONDS = 2.0  # 대기 작업이 없을 때 워커가 다시 확인하는 간격(초)
+RAG_INGEST_JOB_HEARTBEAT_SECONDS = 5.0  # 실행 중 작업의 진행 상황/하트비트 저장 및 취소 요청 확인 간격(초)
+RAG_INGEST_JOB_STALE_SECONDS = 300  # 하트비트가 이 시간(초) 넘게 끊긴 실행 중 작업은 워커가 죽은 것으로 보고 다시 대기열에 넣음
+RAG_VECTOR_QUANTIZATION = os.getenv('RAG_VECTOR_QUANTIZATION', 'none')  # FAISS 스냅샷 압축 방식: 'none', 'float16', 'int8' (적재 시 update_chroma_db 인자가 우선)
+RAG_QUERY_QUANTIZATION = os.getenv('RAG_QUERY_QUANTIZATION', 'auto')  # 'auto'(압축 벡터 + float32 재채점) 또는 'float32'(원본으로 정확 검색)
+RAG_QUANTIZATION_RESCORE_FACTOR = 4  # 압축 벡터로 k * 이 값만큼 후보를 고른 뒤 float32로 재채점
+# 적재 시 emotion 값별 Chroma 파티션 컬렉션에도 벡터를 한 번 더 씀. Chroma 백엔드에서 감정 필터(emotions) 질의가 많을 때만 켜세요.
+# 꺼져 있으면 감정 필터는 메타데이터 필터로 검색합니다 (FAISS 스냅샷은 이 설정과 관계없이 감정별 하위 인덱스를 만듦)
+RAG_EMOTION_PARTITIONS = os.getenv('RAG_EMOTION_PARTITIONS', 'False') == 'True'
+# 'vector', 'lexical', 'hybrid'(벡터+BM25 RRF 결합). 어휘 색인은 벤치마크(rag_benchmark)로 확인한 뒤 켜세요
+RAG_RETRIEVAL_MODE = os.getenv('RAG_RETRIEVAL_MODE', 'vector')
+# 적재 시 BM25 어휘 색인도 함께 생성. 'vector' 모드에서는 질의에 쓰지 않으므로 꺼짐
+# (모드를 바꾼 뒤에는 manage.py rebuild_lexical_index로 기존 문서의 색인을 만드세요)
+RAG_LEXICAL_INDEX = RAG_RETRIEVAL_MODE != 'vector'
+RAG_LEXICAL_INDEX_PATH = BASE_DIR / 'embeddings' / 'lexical_index'  # BM25 어휘 색인 세그먼트 디렉터리
+RAG_LEXICAL_SEGMENT_DOCS = 50000  # 적재 중 메모리에 모았다가 세그먼트 하나로 내려쓸 문서 수
+RAG_LEXICAL_MAX_DF_RATIO = 0.2  # 전체 문서 중 이 비율보다 많은 문서에 나오는 색인어는 질의에서 제외
+RAG_RRF_K = 60  # RRF 결합 상수
+RAG_VECTOR_SEARCH_TIMEOUT = 2.0  # 하이브리드 모드에서 임베딩+벡터 검색 대기 한도(초). 초과하면 BM25 결과만 사용
+RAG_PROMPT_TOKEN_BUDGET = 2000  # 프롬프트에 넣을 질문+히스토리+리트리브 문맥 토큰 상한
+RAG_PROMPT_HISTORY_SHARE = 0.4  # 예산 중 히스토리 몫 (남으면 문맥에 사용)
+RAG_PROMPT_DEDUP_THRESHOLD = 0.9  # 같은 조각으로 볼 문자 3-gram 자카드 유사도
+RAG_SINGLE_FLIGHT_ENABLED = True  # 같은 방/같은 입력의 동시 다정모드 요청을 하나의 계산으로 합침
+RAG_SINGLE_FLIGHT_TIMEOUT = 60  # 진행 중인 계산을 기다리는 최대 시간(초). 초과하면 직접 계산
+RAG_SINGLE_FLIGHT_SHARED = False  # Django 캐시를 잠금 테이블로 사용해 워커 간에도 합침 (공유 CACHES 백엔드 필요)
+RAG_SINGLE_FLIGHT_RESULT_TTL = 10  # 워커 간 공유 시 결과를 캐시에 남겨 두는 시간(초)
+RAG_EMBEDDINGS_FACTORY = os.getenv('RAG_EMBEDDINGS_FACTORY')  # 임베딩 팩토리 모듈 경로 (없으면 OpenAIEmbeddings). 예: 'rag.fakes.hashing_embeddings'
+RAG_LLM_FACTORY = os.getenv('RAG_LLM_FACTORY')  # 채팅 모델 팩토리 모듈 경로 (없으면 ChatOpenAI). 예: 'rag.fakes.canned_chat_model'
+RAG_FAKE_EMBEDDING_SIZE = 256  # rag.fakes.HashingEmbeddings 차원
+RAG_FAKE_EMBEDDING_LATENCY = 0.0  # rag.fakes.HashingEmbeddings 배치 호출당 지연(초)
+RAG_FAKE_LLM_LATENCY = 0.5  # rag.fakes.CannedChatModel 응답 지연(초)
+RAG_BATCH_MAX_ITEMS = 500  # /api/rag/query/batch/ 한 요청당 최대 질문 수
+RAG_BATCH_MAX_CONCURRENCY = 16  # 일괄 처리 시 동시 LLM 호출 수 상한
+RAG_WARM_PHRASE_ENABLED = True  # 미리 생성한 다정 표현 라이브러리(WarmPhrase) 우선 사용
+RAG_WARM_PHRASE_VERSION = os.getenv('RAG_WARM_PHRASE_VERSION')  # 사용할 라이브러리 버전 (없으면 가장 최근 버전)
+RAG_WARM_PHRASE_RELOAD_SECONDS = 300  # 라이브러리를 DB에서 다시 읽는 주기(초)